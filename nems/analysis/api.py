@@ -2,7 +2,7 @@ from .fit_basic import (fit_basic, fit_random_subsets, fit_jackknifes,
                         fit_subsets, fit_state_nfold)
 from .cost_functions import basic_cost, basic_with_copy
 from .fit_iteratively import fit_iteratively, fit_module_sets
-from .fit_nfold import fit_nfold
+from .fit_nfold import fit_nfold, fit_multistart
 from .fit_from_priors import fit_from_priors
 from .test_prediction import (generate_prediction,
                               standard_correlation,
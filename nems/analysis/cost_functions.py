@@ -1,6 +1,9 @@
 import logging
 
+import numpy as np
+
 import nems.utils
+from nems.fitters.util import phi_to_vector
 
 log = logging.getLogger(__name__)
 
@@ -8,13 +11,18 @@ log = logging.getLogger(__name__)
 def basic_cost(sigma, unpacker, modelspec, data, segmentor,
                evaluator, metric):
     '''Standard cost function for use by fit_basic and other analyses.'''
-    updated_spec = unpacker(sigma)
+    profile = getattr(modelspec, 'eval_profile', None)
+    if profile is not None:
+        profile.start_eval()
+    updated_spec = _profiled(profile, 'unpack', unpacker, sigma)
     # The segmentor takes a subset of the data for fitting each step
     # Intended use is for CV or random selection of chunks of the data
     # For fit_basic the 'segmentor' just passes it all through.
-    data_subset = segmentor(data)
+    data_subset = _profiled(profile, 'segmentor', segmentor, data)
     updated_data_subset = evaluator(data_subset, updated_spec)
-    error = metric(updated_data_subset)
+    error = _profiled(profile, 'metric', metric, updated_data_subset)
+    if profile is not None:
+        profile.stop_eval()
     log.debug("inside cost function, current error: %.06f", error)
     log.debug("current sigma: %s", sigma)
 
@@ -31,6 +39,40 @@ def basic_cost(sigma, unpacker, modelspec, data, segmentor,
     return error
 
 
+def gradient_cost(sigma, unpacker, modelspec, data, segmentor,
+                  evaluator, metric):
+    '''Same as basic_cost, but returns (error, gradient) for fitters that
+    use analytic gradients, e.g. scipy_minimize with jac=True.
+
+    evaluator is called as evaluator(data, modelspec, metric) and must
+    return the error and the per-module phi gradients, like
+    nems.modelspec.evaluate_gradient. The gradient is packed in the same
+    order as the simple_vector mapper packs phi for the whole modelspec.
+    '''
+    profile = getattr(modelspec, 'eval_profile', None)
+    if profile is not None:
+        profile.start_eval()
+    updated_spec = _profiled(profile, 'unpack', unpacker, sigma)
+    data_subset = _profiled(profile, 'segmentor', segmentor, data)
+    error, phi_grad = _profiled(profile, 'evaluate_gradient', evaluator,
+                                data_subset, updated_spec, metric)
+    if profile is not None:
+        profile.stop_eval()
+    log.debug("inside cost function, current error: %.06f", error)
+    log.debug("current sigma: %s", sigma)
+
+    if hasattr(gradient_cost, 'counter'):
+        gradient_cost.counter += 1
+        if gradient_cost.counter % 100 == 0:
+            log.info('Eval #%d. E=%.06f', gradient_cost.counter, error)
+            nems.utils.progress_fun()
+
+    if hasattr(gradient_cost, 'error'):
+        gradient_cost.error = error
+
+    return error, np.array(phi_to_vector(phi_grad), dtype=np.float64)
+
+
 def basic_with_copy(sigma, unpacker, modelspec, data, segmentor,
                     evaluator, metric, copy_phi=None):
     '''Same as basic_cost, but allows copying of parameters between modules.
@@ -48,7 +90,10 @@ def basic_with_copy(sigma, unpacker, modelspec, data, segmentor,
             to the fn_kwargs of the module at idx=3
 
     '''
-    updated_spec = unpacker(sigma)
+    profile = getattr(modelspec, 'eval_profile', None)
+    if profile is not None:
+        profile.start_eval()
+    updated_spec = _profiled(profile, 'unpack', unpacker, sigma)
 
     if copy_phi is not None:
         for t in copy_phi:
@@ -56,9 +101,11 @@ def basic_with_copy(sigma, unpacker, modelspec, data, segmentor,
             p = m['phi'].copy()
             updated_spec[t[1]]['fn_kwargs'].update(p)
 
-    data_subset = segmentor(data)
+    data_subset = _profiled(profile, 'segmentor', segmentor, data)
     updated_data_subset = evaluator(data_subset, updated_spec)
-    error = metric(updated_data_subset)
+    error = _profiled(profile, 'metric', metric, updated_data_subset)
+    if profile is not None:
+        profile.stop_eval()
     log.debug("inside cost function, current error: %.06f", error)
     log.debug("current sigma: %s", sigma)
 
@@ -73,3 +120,14 @@ def basic_with_copy(sigma, unpacker, modelspec, data, segmentor,
         basic_cost.error = error
 
     return error
+
+
+def _profiled(profile, name, fn, *args):
+    '''Calls fn(*args), timed as step name of profile if it isn't None.'''
+    if profile is None:
+        return fn(*args)
+    profile.start(name)
+    try:
+        return fn(*args)
+    finally:
+        profile.stop()
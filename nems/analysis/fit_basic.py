@@ -1,14 +1,16 @@
 import copy
+import inspect
 import logging
 import time
 from functools import partial
 
-from nems.analysis.cost_functions import basic_cost
+from nems.analysis.cost_functions import basic_cost, gradient_cost
 from nems.fitters.api import scipy_minimize
 import nems.priors
 import nems.fitters.mappers
 import nems.modelspec as ms
 import nems.metrics.api as metrics
+from nems.recording import FitRecording
 import nems.segmentors
 import nems.utils
 
@@ -20,7 +22,8 @@ def fit_basic(data, modelspec,
               segmentor=nems.segmentors.use_all_data,
               mapper=nems.fitters.mappers.simple_vector,
               metric=None,
-              metaname='fit_basic', fit_kwargs={}, require_phi=True):
+              metaname='fit_basic', fit_kwargs={}, require_phi=True,
+              gradient=False, metric_grad=None, profile=False):
     '''
     Required Arguments:
      data          A recording object
@@ -36,6 +39,18 @@ def fit_basic(data, modelspec,
                    fitting process. This is NOT the same as est/val data splits
      metric        A function of a Recording that returns an error value
                    that is to be minimized.
+     gradient      If True, give the fitter the analytic gradient of the
+                   metric (see nems.modelspec.evaluate_gradient). Falls
+                   back to finite differences if a module has no backward
+                   function, the metric has no gradient, or the fitter is
+                   not scipy_minimize.
+     metric_grad   Gradient version of metric, returning (error, grads).
+                   Defaults to nems.metrics.mse.nmse_grad when metric is
+                   not given.
+     profile       If True, profile the cost function and model evaluation
+                   during the fit (see nems.modelspec.EvalProfile) and save
+                   the profile in meta['profile']. Also done if profiling
+                   was turned on with modelspec.profile_on().
 
     Returns
     A list containing a single modelspec, which has the best parameters found
@@ -45,9 +60,14 @@ def fit_basic(data, modelspec,
 
     modelspec = copy.deepcopy(modelspec)
     output_name = modelspec.meta.get('output_name', 'resp')
+    if profile:
+        modelspec.profile_on()
 
     if metric is None:
         metric = lambda data: metrics.nmse(data, 'pred', output_name)
+        if metric_grad is None:
+            metric_grad = lambda data: metrics.nmse_grad(data, 'pred',
+                                                         output_name)
 
     if cost_function is None:
         # Use the cost function defined in this module by default
@@ -69,6 +89,11 @@ def fit_basic(data, modelspec,
         data = data.apply_mask()
         log.info("Data len post-mask: %d", data['mask'].shape[1])
 
+    if segmentor is nems.segmentors.use_all_data:
+        # evaluate on lightweight copies of the signals. other segmentors
+        # need the full Recording to split the data.
+        data = FitRecording(data)
+
     # turn on "fit mode". currently this serves one purpose, for normalization
     # parameters to be re-fit for the output of each module that uses
     # normalization. does nothing if normalization is not being used.
@@ -99,11 +124,23 @@ def fit_basic(data, modelspec,
     sigma = packer(modelspec)
     bounds = pack_bounds(modelspec)
 
+    fitter_cost_fn = cost_fn
+    if gradient:
+        grad_cost_fn = _gradient_cost_fn(
+                sigma, fitter, cost_function, mapper, metric_grad,
+                unpacker=unpacker, modelspec=modelspec, data=data,
+                segmentor=segmentor)
+        if grad_cost_fn is not None:
+            fitter_cost_fn = grad_cost_fn
+            fit_kwargs = {**fit_kwargs, 'jac': True}
+
     # Results should be a list of modelspecs
     # (might only be one in list, but still should be packaged as a list)
-    improved_sigma = fitter(sigma, cost_fn, bounds=bounds, **fit_kwargs)
+    improved_sigma = fitter(sigma, fitter_cost_fn, bounds=bounds,
+                            **fit_kwargs)
     improved_modelspec = unpacker(improved_sigma)
     elapsed_time = (time.time() - start_time)
+    eval_profile = improved_modelspec.profile_off()
 
     start_err = cost_fn(sigma)
     final_err = cost_fn(improved_sigma)
@@ -116,6 +153,10 @@ def fit_basic(data, modelspec,
     ms.set_modelspec_metadata(improved_modelspec, 'fit_time', elapsed_time)
     ms.set_modelspec_metadata(improved_modelspec, 'n_parms',
                               len(improved_sigma))
+    if eval_profile is not None:
+        log.info('Fit profile:\n%s', eval_profile.summary())
+        ms.set_modelspec_metadata(improved_modelspec, 'profile',
+                                  eval_profile.to_dict())
 
     if type(improved_modelspec) is list:
         return [copy.deepcopy(improved_modelspec)]
@@ -123,6 +164,39 @@ def fit_basic(data, modelspec,
         return improved_modelspec.copy()
 
 
+def _gradient_cost_fn(sigma, fitter, cost_function, mapper, metric_grad,
+                      **cost_kwargs):
+    '''
+    Returns gradient_cost with everything but sigma frozen, or None (after
+    logging why) if analytic gradients can't be used for this fit.
+    '''
+    if inspect.unwrap(fitter) is not scipy_minimize:
+        reason = 'fitter does not take gradients'
+    elif cost_function is not basic_cost:
+        reason = 'custom cost function'
+    elif mapper is not nems.fitters.mappers.simple_vector:
+        reason = 'custom mapper'
+    elif metric_grad is None:
+        reason = 'no metric_grad for custom metric'
+    else:
+        reason = None
+
+    if reason is None:
+        grad_cost_fn = partial(gradient_cost, evaluator=ms.evaluate_gradient,
+                               metric=metric_grad, **cost_kwargs)
+        gradient_cost.counter = 0
+        try:
+            grad_cost_fn(sigma)
+        except NotImplementedError as e:
+            reason = str(e)
+
+    if reason is not None:
+        log.info('Analytic gradient not available (%s), using finite '
+                 'differences', reason)
+        return None
+    return grad_cost_fn
+
+
 def fit_random_subsets(data, modelspec, nsplits=1, rebuild_every=10000):
     """
     Randomly picks a small fraction of the data to fit on.
@@ -1,28 +1,60 @@
 import logging
 import copy
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from nems.fitters.fitter import scipy_minimize
+from nems.modelspec import ModelSpec
 import nems.metrics.api as metrics
 from .fit_basic import fit_basic
 from .fit_iteratively import fit_iteratively
 
 log = logging.getLogger(__name__)
 
+# arguments of the fit_nfold call being run, visible to forked workers
+_nfold_state = {}
+
 
-def fit_nfold(data_list, modelspecs, generate_psth=False,
+def fit_nfold(data_list, modelspec, generate_psth=False,
               fitter=scipy_minimize, analysis='fit_basic',
               metric=None, tolerances=None, module_sets=None,
-              tol_iter=100, fit_iter=20, fit_kwargs={}):
+              tol_iter=100, fit_iter=20, fit_kwargs={},
+              gradient=False, metric_grad=None, metaname='fit_nfold',
+              n_workers=1, early_stop=None, early_stop_evals=100):
     '''
     Takes njacks jackknifes, where each jackknife has some small
     fraction of data NaN'd out, and fits modelspec to them.
 
-    TESTING:
-    if input len(modelspecs) == len(data_list) then use each
-      modelspec as initial condition for corresponding data_list fold
-    if len(modelspecs) == 1, then use the same initial conditions for
-      each fold
+    If modelspec has one jackknife, it is tiled (ModelSpec.tile_jacks) to
+    one jackknife per fold, so every fold starts from the same initial
+    conditions. If it already has one jackknife per fold, jackknife i is
+    the initial condition for fold i. For backward compatibility, a list
+    of one modelspec or of one modelspec per fold is also accepted.
+
+    n_workers > 1 fits up to n_workers folds at a time in worker
+    processes. The workers are forked, so they share the data, modelspec,
+    fitter and metric with this process (copy-on-write) rather than having
+    them pickled. Each worker is sent only a fold and fit index and returns
+    the fitted modules. The results are identical to those of the serial
+    fit (n_workers=1). Where fork is unavailable, folds are fit serially.
 
+    Every fit (e.g. the random initial conditions of
+    nems.initializers.rand_phi) is fit to every fold, so with several fits
+    this is also a parallel multi-start fit, see fit_multistart.
+    If early_stop is given (fit_basic only), a fit is given up once it has
+    made early_stop_evals cost function evaluations and its best error is
+    more than early_stop * abs(best error) behind the best error of any
+    other fit of the same fold so far. It keeps the best parameters it
+    found, and the (fit, fold) index of every fit that was given up is
+    listed in meta['early_stopped']. Fits in progress in other workers
+    count, so which fits are stopped can depend on timing when
+    n_workers > 1.
+
+    Returns a ModelSpec with one jackknife per fold, and every fit
+    (modelspec.fit_count) fit to every fold.
     '''
     if type(data_list) is list:
         nfolds = len(data_list)
@@ -31,40 +63,196 @@ def fit_nfold(data_list, modelspecs, generate_psth=False,
         data_list = data_list.views()
         nfolds = len(data_list)
 
-    models = []
-    if metric is None:
+    modelspec = _tile_folds(modelspec, nfolds)
+    if analysis not in ('fit_basic', 'fit_iteratively'):
+        # Unknown analysis
+        # TODO: use getattr / import to make this more general for
+        #       use with any analysis function?
+        #       Maybe too much of a pain.
+        raise NotImplementedError
+
+    if metric is None and analysis == 'fit_iteratively':
         def metric(d):
-            metrics.nmse(d, 'pred', 'resp')
+            return metrics.nmse(d, 'pred', 'resp')
 
-    for i in range(nfolds):
-        if len(modelspecs) > 1:
-            msidx = i
+    _nfold_state.update(
+        data_list=data_list, modelspec=modelspec, fitter=fitter,
+        analysis=analysis, metric=metric, tolerances=tolerances,
+        module_sets=module_sets, tol_iter=tol_iter, fit_iter=fit_iter,
+        fit_kwargs=fit_kwargs, gradient=gradient, metric_grad=metric_grad,
+        metaname=metaname)
+
+    fits = [(fit_idx, jack_idx) for fit_idx in range(modelspec.fit_count)
+            for jack_idx in range(nfolds)]
+    if (n_workers > 1) and ('fork' not in multiprocessing.get_all_start_methods()):
+        log.warning('fork not available, fitting folds serially')
+        n_workers = 1
+    if (early_stop is not None) and (analysis == 'fit_basic'):
+        # best error of every fit so far, in shared memory so that forked
+        # workers see each other's progress
+        best_errors = multiprocessing.RawArray('d', len(fits))
+        best_errors[:] = [np.inf] * len(fits)
+        _nfold_state.update(early_stop=early_stop,
+                            early_stop_evals=early_stop_evals,
+                            best_errors=best_errors)
+    try:
+        if n_workers > 1:
+            log.info("Fitting %d folds with %d workers", nfolds, n_workers)
+            with ProcessPoolExecutor(
+                    max_workers=min(n_workers, len(fits)),
+                    mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(_fit_fold, *zip(*fits)))
         else:
-            msidx = 0
-
-        log.info("Fitting fold %d/%d, modelspec %d", i+1, nfolds, msidx)
-
-        if analysis == 'fit_basic':
-            models += fit_basic(data_list[i], copy.deepcopy(modelspecs[msidx]),
-                                fitter=fitter,
-                                metric=metric,
-                                metaname='fit_nfold',
-                                fit_kwargs=fit_kwargs)
-        elif analysis == 'fit_iteratively':
-            models += fit_iteratively(
-                        data_list[i], copy.deepcopy(modelspecs[msidx]),
-                        fitter=fitter, metric=metric,
-                        metaname='fit_nfold', fit_kwargs=fit_kwargs,
-                        module_sets=module_sets, invert=False,
-                        tolerances=tolerances, tol_iter=tol_iter,
-                        fit_iter=fit_iter,
-                        )
+            results = [_fit_fold(fit_idx, jack_idx)
+                       for fit_idx, jack_idx in fits]
+    finally:
+        _nfold_state.clear()
+
+    # merge the fitted modules of each fold back into their jackknife
+    meta = modelspec.meta
+    early_stopped = []
+    for (fit_idx, jack_idx), (modules, stopped) in zip(fits, results):
+        modelspec.raw[modelspec.cell_index, fit_idx, jack_idx] = modules
+        meta = modules[0]['meta']
+        if stopped:
+            early_stopped.append([fit_idx, jack_idx])
+    if early_stop is not None:
+        meta['early_stopped'] = early_stopped
+    for r in modelspec.raw.flatten():
+        r[0]['meta'] = meta
+
+    return modelspec
+
 
+def _tile_folds(modelspec, nfolds):
+    '''
+    Returns a copy of modelspec with one jackknife per fold.
+    '''
+    if type(modelspec) is list:
+        if len(modelspec) == 1:
+            modelspec = modelspec[0]
+        elif len(modelspec) == nfolds:
+            # each modelspec is the initial condition for one fold
+            raw = np.concatenate([copy.deepcopy(m.raw[:, :, 0:1])
+                                  for m in modelspec], axis=2)
+            meta = modelspec[0].meta
+            for r in raw.flatten():
+                r[0]['meta'] = meta
+            modelspec = ModelSpec(raw)
         else:
-            # Unknown analysis
-            # TODO: use getattr / import to make this more general for
-            #       use with any analysis function?
-            #       Maybe too much of a pain.
-            raise NotImplementedError
+            raise ValueError('Need one modelspec, or one per fold')
+    modelspec = modelspec.copy()
+    if modelspec.jack_count == 1:
+        modelspec.tile_jacks(nfolds)
+    elif modelspec.jack_count != nfolds:
+        raise ValueError('modelspec.jack_count ({}) does not match the '
+                         'number of folds ({})'
+                         .format(modelspec.jack_count, nfolds))
+    return modelspec
+
+
+def fit_multistart(data, modelspec, n_workers=1, early_stop=None,
+                   early_stop_evals=100, metaname='fit_multistart',
+                   **kwargs):
+    '''
+    Fits every fit (modelspec.fit_count) of modelspec, e.g. the random
+    initial conditions made by nems.initializers.rand_phi, with fit_basic,
+    up to n_workers fits at a time. If data has several views (jackknifed
+    est data), every fit is fit to every view as in fit_nfold.
+
+    Starts that fall far behind the best one can be given up early, see
+    early_stop in fit_nfold. Other keyword arguments are passed to
+    fit_nfold.
+
+    Returns a ModelSpec with every fit populated, to be reduced to the
+    best one with nems.analysis.test_prediction.pick_best_phi.
+    '''
+    return fit_nfold(data.views(), modelspec, n_workers=n_workers,
+                     early_stop=early_stop, early_stop_evals=early_stop_evals,
+                     metaname=metaname, **kwargs)
+
+
+class _HopelessFit(Exception):
+    pass
+
+
+def _stop_hopeless(fitter, fit, fold_fits, best_errors, early_stop,
+                   early_stop_evals):
+    '''
+    Wraps fitter so that the fit is given up once its best error is more
+    than early_stop * abs(best) behind the best error of fold_fits
+    (indices into best_errors), returning the best sigma it found. Its own
+    best error is kept up to date in best_errors[fit].
+    '''
+    @functools.wraps(fitter)
+    def stoppable_fitter(sigma, cost_fn, **kwargs):
+        best = {'error': np.inf, 'sigma': sigma, 'evals': 0}
+
+        def monitored_cost_fn(sigma):
+            result = cost_fn(sigma)
+            # gradient cost functions return (error, gradient)
+            error = result[0] if type(result) is tuple else result
+            best['evals'] += 1
+            if error < best['error']:
+                best['error'] = error
+                best['sigma'] = np.array(sigma, copy=True)
+                best_errors[fit] = error
+            if best['evals'] >= early_stop_evals:
+                fold_best = min(best_errors[i] for i in fold_fits)
+                if best['error'] - fold_best > early_stop * abs(fold_best):
+                    raise _HopelessFit()
+            return result
+
+        try:
+            return fitter(sigma, monitored_cost_fn, **kwargs)
+        except _HopelessFit:
+            log.info('Stopping fit after %d evaluations, E=%.06f is too far '
+                     'behind the best fit', best['evals'], best['error'])
+            stoppable_fitter.stopped = True
+            return best['sigma']
+
+    stoppable_fitter.stopped = False
+    return stoppable_fitter
+
+
+def _fit_fold(fit_idx, jack_idx):
+    '''
+    Fits one fold of the fit_nfold call in _nfold_state. Returns the fitted
+    modules, and whether the fit was stopped early.
+    '''
+    s = _nfold_state
+    modelspec = s['modelspec'].copy()
+    modelspec.fit_index = fit_idx
+    modelspec.jack_index = jack_idx
+    nfolds = modelspec.jack_count
+    log.info("Fitting fold %d/%d, fit %d/%d", jack_idx+1, nfolds,
+             fit_idx+1, modelspec.fit_count)
+
+    fitter = s['fitter']
+    if 'best_errors' in s:
+        fold_fits = [i * nfolds + jack_idx
+                     for i in range(modelspec.fit_count)]
+        fitter = _stop_hopeless(fitter, fit_idx * nfolds + jack_idx,
+                                fold_fits, s['best_errors'],
+                                s['early_stop'], s['early_stop_evals'])
+
+    if s['analysis'] == 'fit_basic':
+        fitted = fit_basic(s['data_list'][jack_idx], modelspec,
+                           fitter=fitter,
+                           metric=s['metric'],
+                           metaname=s['metaname'],
+                           fit_kwargs=s['fit_kwargs'],
+                           gradient=s['gradient'],
+                           metric_grad=s['metric_grad'])
+    else:
+        fitted = fit_iteratively(
+                    s['data_list'][jack_idx], modelspec,
+                    fitter=s['fitter'], metric=s['metric'],
+                    metaname=s['metaname'], fit_kwargs=s['fit_kwargs'],
+                    module_sets=s['module_sets'], invert=False,
+                    tolerances=s['tolerances'], tol_iter=s['tol_iter'],
+                    fit_iter=s['fit_iter'],
+                    )
 
-    return models
+    return (fitted.raw[fitted.cell_index, fit_idx, jack_idx],
+            getattr(fitter, 'stopped', False))
@@ -8,9 +8,10 @@ gammatone filterbank-like "spectrogram" from a Fourier transform.
 """
 from __future__ import division
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-import gammatone.filters as filters
-import gammatone.gtgram as gtgram
+from . import filters
+from . import gtgram
 
 def specgram_window(
         nfft,
@@ -45,21 +46,34 @@ def specgram(x, n, sr, w, h):
     s = x.shape[0]
     win = specgram_window(n, w)
 
-    c = 0
-
     # pre-allocate output array
     ncols = 1 + int(np.floor((s - n)/h))
     d = np.zeros(((1 + n // 2), ncols), np.dtype(complex))
 
-    for b in range(0, s - n, h):
-      u = win * x[b : b + n]
-      t = np.fft.fft(u)
-      d[:, c] = t[0 : (1 + n // 2)].T
-      c = c + 1
+    # the last column is left empty, as in the original loop over
+    # range(0, s - n, h)
+    nframes = len(range(0, s - n, h))
+    if nframes > 0:
+        d[:, :nframes] = specgram_frames(x, win, h, np.arange(nframes))
 
     return d
 
 
+def specgram_frames(x, win, h, cols):
+    """ Calculates some columns of :func:`specgram`.
+
+    :param x: The signal to analyse
+    :param win: The window (see :func:`specgram_window`), of the FFT length
+    :param h: The hop size
+    :param cols: Indices of the columns to calculate
+
+    :return: an array with the ``1 + n // 2`` FFT bins of each column
+    """
+    n = win.shape[0]
+    frames = sliding_window_view(x, n)[h * np.asarray(cols)]
+    return np.fft.fft(frames * win)[:, 0 : (1 + n // 2)].T
+
+
 def fft_weights(
     nfft,
     fs,
@@ -128,7 +142,8 @@ def fft_gtgram(
     fs,
     window_time, hop_time,
     channels,
-    f_min):
+    f_min,
+    chunk_size=None):
     """
     Calculate a spectrogram-like time frequency magnitude array based on
     an FFT-based approximation to gammatone subband filters.
@@ -142,6 +157,10 @@ def fft_gtgram(
     filterbank. ``window_time`` and ``hop_time`` (both in seconds) are the size
     and overlap of the spectrogram columns.
 
+    If ``chunk_size`` is given, the spectrogram columns are calculated and
+    weighted a block at a time, each block covering about ``chunk_size``
+    samples of the waveform, rather than all at once. The result is the same.
+
     | 2009-02-23 Dan Ellis dpwe@ee.columbia.edu
     |
     | (c) 2013 Jason Heeris (Python implementation)
@@ -161,8 +180,16 @@ def fft_gtgram(
             nfft / 2 + 1
         )
 
-    sgram = specgram(wave, nfft, fs, nwin, nhop)
-
-    result = gt_weights.dot(np.abs(sgram)) / nfft
+    # as specgram(wave, nfft, fs, nwin, nhop), a block of columns at a time
+    win = specgram_window(nfft, nwin)
+    ncols = 1 + int(np.floor((wave.shape[0] - nfft) / nhop))
+    result = np.zeros((channels, ncols))
+    nframes = len(range(0, wave.shape[0] - nfft, nhop))
+    block = max(1, (chunk_size or wave.shape[0]) // nhop)
+
+    for c in range(0, nframes, block):
+        cols = np.arange(c, min(c + block, nframes))
+        sgram = specgram_frames(wave, win, nhop, cols)
+        result[:, cols] = gt_weights.dot(np.abs(sgram)) / nfft
 
     return result
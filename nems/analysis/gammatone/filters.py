@@ -197,6 +197,58 @@ def make_erb_filters(fs, centre_freqs, width=1.0):
     return fcoefs
 
 
+def make_erb_sos(coefs):
+    """
+    :param coefs: gammatone filter coefficients, from :func:`make_erb_filters`
+
+    Rearranges the coefficients of a gammatone filterbank into a bank of
+    second-order sections: one (4, 6) array of ``[b0, b1, b2, a0, a1, a2]``
+    rows per channel, in the form used by :func:`scipy.signal.sosfilt`.
+
+    :return: a tuple `sos`, `gain` with the (channels, 4, 6) sections and the
+             gain of each channel
+    """
+    channels = coefs.shape[0]
+    sos = np.empty((channels, 4, 6))
+    # A0, A1k, A2 for section k (see erb_filterbank for the odd A/B order)
+    sos[:, :, 0] = coefs[:, 0, None]
+    sos[:, :, 1] = coefs[:, 1:5]
+    sos[:, :, 2] = coefs[:, 5, None]
+    # B0, B1, B2
+    sos[:, :, 3:] = coefs[:, None, 6:9]
+    return sos, coefs[:, 9]
+
+
+def erb_filterbank_sos(wave, sos, gain, zi=None):
+    """
+    :param wave: input data (one dimensional sequence)
+    :param sos: second-order sections of each channel, from
+                :func:`make_erb_sos`
+    :param gain: gain of each channel, from :func:`make_erb_sos`
+    :param zi: filter state of each channel, as returned by a previous call,
+               or None to start at rest
+
+    Process an input waveform with a bank of gammatone filters given as
+    second-order sections. Each channel runs its four sections in one
+    :func:`scipy.signal.sosfilt` call, which keeps them separate (as the
+    cascaded ``lfilter`` calls of :func:`erb_filterbank` do) for accuracy.
+    The final filter state is returned, so that a long waveform can be
+    processed in consecutive pieces with the same result as in one go.
+
+    :return: a tuple `output`, `zf` with the filter outputs, one channel per
+             row, and the final filter state (channels, 4, 2)
+    """
+    wave = np.asarray(wave, dtype=float)
+    if zi is None:
+        zi = np.zeros((sos.shape[0], sos.shape[1], 2))
+    output = np.empty((sos.shape[0], wave.shape[0]))
+    zf = np.empty_like(zi)
+    for idx in range(sos.shape[0]):
+        output[idx], zf[idx] = sgn.sosfilt(sos[idx], wave, zi=zi[idx])
+    output /= gain[:, None]
+    return output, zf
+
+
 def erb_filterbank(wave, coefs):
     """
     :param wave: input data (one dimensional sequence)
@@ -215,30 +267,10 @@ def erb_filterbank(wave, coefs):
     |
     | (c) 2013 Jason Heeris (Python implementation)
     """
-    output = np.zeros((coefs[:,9].shape[0], wave.shape[0]))
-    
-    gain = coefs[:, 9]
-    # A0, A11, A2
-    As1 = coefs[:, (0, 1, 5)]
-    # A0, A12, A2
-    As2 = coefs[:, (0, 2, 5)]
-    # A0, A13, A2
-    As3 = coefs[:, (0, 3, 5)]
-    # A0, A14, A2
-    As4 = coefs[:, (0, 4, 5)]
-    # B0, B1, B2
-    Bs = coefs[:, 6:9]
-    
-    # Loop over channels
-    for idx in range(0, coefs.shape[0]):
-        # These seem to be reversed (in the sense of A/B order), but that's what
-        # the original code did...
-        # Replacing these with polynomial multiplications reduces both accuracy
-        # and speed.
-        y1 = sgn.lfilter(As1[idx], Bs[idx], wave)
-        y2 = sgn.lfilter(As2[idx], Bs[idx], y1)
-        y3 = sgn.lfilter(As3[idx], Bs[idx], y2)
-        y4 = sgn.lfilter(As4[idx], Bs[idx], y3)
-        output[idx, :] = y4 / gain[idx]
-        
+    # Each channel is a cascade of four second-order sections. These seem to
+    # be reversed (in the sense of A/B order), but that's what the original
+    # code did... Replacing them with polynomial multiplications reduces both
+    # accuracy and speed.
+    sos, gain = make_erb_sos(coefs)
+    output, _ = erb_filterbank_sos(wave, sos, gain)
     return output
@@ -4,8 +4,10 @@
 # BSD license: https://github.com/detly/gammatone/blob/master/COPYING
 from __future__ import division
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-from .filters import make_erb_filters, centre_freqs, erb_filterbank
+from .filters import (make_erb_filters, centre_freqs, erb_filterbank,
+                      make_erb_sos, erb_filterbank_sos)
 
 """
 This module contains functions for rendering "spectrograms" which use gammatone
@@ -57,7 +59,8 @@ def gtgram(
     fs,
     window_time, hop_time,
     channels,
-    f_min, f_max=None):
+    f_min, f_max=None,
+    chunk_size=None):
     """
     Calculate a spectrogram-like time frequency magnitude array based on
     gammatone subband filters. The waveform ``wave`` (at sample rate ``fs``) is
@@ -66,24 +69,58 @@ def gtgram(
     each band then have their energy integrated over windows of ``window_time``
     seconds, advancing by ``hop_time`` secs for successive columns. These
     magnitudes are returned as a nonnegative real matrix with ``channels`` rows.
+
+    If ``chunk_size`` is given, the waveform is filtered ``chunk_size`` samples
+    at a time, carrying the filter state from one chunk to the next, so that
+    only one chunk of the (channels x samples) filterbank output is held in
+    memory at once. The result is the same as without chunks.
     
     | 2009-02-23 Dan Ellis dpwe@ee.columbia.edu
     |
     | (c) 2013 Jason Heeris (Python implementation)
     """
-    xe = gtgram_xe(wave, fs, channels, f_min, f_max)
-    
+    wave = np.asarray(wave, dtype=float)
+    cfs = centre_freqs(fs, channels, f_min, f_max)
+    sos, gain = make_erb_sos(np.flipud(make_erb_filters(fs, cfs)))
+
     nwin, hop_samples, ncols = gtgram_strides(
         fs,
         window_time,
         hop_time,
-        xe.shape[1]
+        wave.shape[0]
     )
-    
+
     y = np.zeros((channels, ncols))
-    
-    for cnum in range(ncols):
-        segment = xe[:, cnum * hop_samples + np.arange(nwin)]
-        y[:, cnum] = np.sqrt(segment.mean(1))
-    
+    if not chunk_size:
+        chunk_size = max(wave.shape[0], 1)
+
+    # filter state, and the squared filter outputs not yet used up by a
+    # column, which start at sample xe_start of the waveform
+    zi = None
+    xe = np.zeros((channels, 0))
+    xe_start = 0
+    cnum = 0
+    for start in range(0, wave.shape[0], chunk_size):
+        xf, zi = erb_filterbank_sos(wave[start:start + chunk_size], sos, gain,
+                                    zi)
+        xe = np.concatenate((xe, np.power(xf, 2)), axis=1)
+        end = xe_start + xe.shape[1]
+
+        # the columns that end within the filtered samples
+        n = 0
+        if end >= nwin:
+            n = min((end - nwin) // hop_samples + 1, ncols) - cnum
+        if n > 0:
+            first = cnum * hop_samples - xe_start
+            windows = sliding_window_view(xe[:, first:], nwin, axis=1)
+            windows = windows[:, ::hop_samples][:, :n]
+            y[:, cnum:cnum + n] = np.sqrt(windows.mean(2))
+            cnum += n
+
+        # drop the samples before the next column (with hop_samples > nwin,
+        # it can start past the end of this chunk)
+        drop = min(cnum * hop_samples, end) - xe_start
+        xe = xe[:, drop:]
+        xe_start += drop
+
     return y
@@ -123,13 +123,12 @@ def standard_correlation(est, val, modelspec=None, modelspecs=None, rec=None,
             v = val.set_view(i)
             e = est.set_view(i*est_mult)
             use_mask = False
-        r_test[:,i], se_test[:,i] = nmet.j_corrcoef(v, 'pred', output_name)
-        r_fit[:,i], se_fit[:,i] = nmet.j_corrcoef(e, 'pred', output_name)
+        r_test[:,i], se_test[:,i], mse_test[:,i], se_mse_test[:,i] = \
+            nmet.j_corrcoef_nmse(v, 'pred', output_name)
+        r_fit[:,i], se_fit[:,i], mse_fit[:,i], se_mse_fit[:,i] = \
+            nmet.j_corrcoef_nmse(e, 'pred', output_name)
         r_floor[:,i] = nmet.r_floor(v, 'pred', output_name)
 
-        mse_test[:,i], se_mse_test[:,i] = nmet.j_nmse(v, 'pred', output_name)
-        mse_fit[:,i], se_mse_fit[:,i] = nmet.j_nmse(e, 'pred', output_name)
-
         ll_test[:,i] = nmet.likelihood_poisson(v, 'pred', output_name)
         ll_fit[:,i] = nmet.likelihood_poisson(e, 'pred', output_name)
 
@@ -88,6 +88,13 @@ XFORMS_PLUGINS = []
 # keywords according to decorators
 LIB_PLUGINS = []
 
+################################################################################
+# Model fitting
+################################################################################
+# Memory budget (in MB) for the per-module evaluation cache used while
+# fitting (see nems.modelspec.EvalCache). Set to 0 to disable the cache.
+EVAL_CACHE_MAX_MB = 512
+
 ################################################################################
 # Display tweaks
 ################################################################################
@@ -23,35 +23,47 @@ def check_result(f):
 def remove_overlap(a):
     '''
     Remove overlapping occurences by taking the first occurence
+
+    An epoch is dropped if it starts before the end of the last epoch kept.
+    As in remove_overlap_reference, the start and end times are sorted
+    separately.
     '''
-    a = a.copy()
-    a.sort(axis=0)
-    i = 0
+    a = _as_epochs(a)
+    starts = np.sort(a[:, 0])
+    ends = np.sort(a[:, 1])
     n = len(a)
-    trimmed = []
-    while i < n:
-        lb, ub = a[i]
-        i += 1
-        trimmed.append((lb, ub))
-        while (i < n) and (ub > a[i, 0]):
-            i += 1
-    return np.array(trimmed)
+    # the epoch kept after epoch i is the first one starting at or after its
+    # end
+    following = np.searchsorted(starts, ends, side='left')
+    following = np.maximum(following, np.arange(1, n + 1))
+    if np.all(following == np.arange(1, n + 1)):
+        return np.stack((starts, ends), axis=1)
+
+    # mark the epochs reachable from the first one by pointer jumping: after
+    # k rounds every epoch at most 2**k steps down the chain is marked
+    jump = np.append(following, n)
+    kept = np.zeros(n + 1, dtype=bool)
+    kept[0] = n > 0
+    steps = 1
+    while steps < n:
+        kept[jump[kept]] = True
+        jump = jump[jump]
+        steps *= 2
+    kept = kept[:n]
+    return np.stack((starts[kept], ends[kept]), axis=1)
 
 
 def merge_epoch(a):
-    a = a.copy()
-    a.sort(axis=0)
-    i = 0
-    n = len(a)
-    merged = []
-    while i < n:
-        lb, ub = a[i]
-        i += 1
-        while (i < n) and (ub >= a[i, 0]):
-            ub = a[i, 1]
-            i += 1
-        merged.append((lb, ub))
-    return np.array(merged)
+    '''
+    Merge overlapping or touching occurences into a single occurence.
+    '''
+    a = _as_epochs(a)
+    starts = np.sort(a[:, 0])
+    ends = np.sort(a[:, 1])
+    gap = ends[:-1] < starts[1:]
+    first = np.concatenate(([True], gap))[:len(a)]
+    last = np.concatenate((gap, [True]))[:len(a)]
+    return np.stack((starts[first], ends[last]), axis=1)
 
 
 def epoch_union(a, b):
@@ -80,7 +92,7 @@ def epoch_union(a, b):
     b:      [   ]       [ ]     []      [    ]
     result: [    ]  [         ] []     [     ]
     '''
-    epoch = np.concatenate((a, b), axis=0)
+    epoch = np.concatenate((_as_epochs(a), _as_epochs(b)), axis=0)
     return merge_epoch(epoch)
 
 
@@ -90,6 +102,102 @@ def epoch_difference(a, b):
     Compute the difference of the epochs. All regions in a which overlap with b
     will be removed.
 
+    Each occurence of a is split by the gaps between the (merged) occurences
+    of b. Pieces of zero length are dropped, but an occurence of a with zero
+    length is kept if it falls strictly inside a gap.
+
+    Parameters
+    ----------
+    a : 2D array of (M x 2)
+        The first column is the start time and second column is the end time. M
+        is the number of occurances of a.
+    b : 2D array of (N x 2)
+        The first column is the start time and second column is the end time. N
+        is the number of occurances of b.
+
+    Returns
+    -------
+    difference : 2D array of (O x 2)
+        The first column is the start time and second column is the end time. O
+        is the number of occurances of the difference of a and b.
+
+    Example
+    -------
+    a:       [   ]  [         ]        [ ]
+    b:      [   ]       [ ]     []      [    ]
+    result:     []  [  ]  [   ]        []
+    '''
+    a = _sort_epochs(_as_epochs(a))
+    b = merge_epoch(b)
+    dtype = np.result_type(a, b)
+    gaps = np.stack((np.concatenate(([-np.inf], b[:, 1])),
+                     np.concatenate((b[:, 0], [np.inf]))), axis=1)
+
+    pieces, index = _pair_overlaps(a, gaps)
+    lb = np.maximum(a[index, 0], gaps[pieces, 0])
+    ub = np.minimum(a[index, 1], gaps[pieces, 1])
+    keep = (lb < ub) | (a[index, 0] == a[index, 1])
+    return np.stack((lb[keep], ub[keep]), axis=1).astype(dtype)
+
+
+def epoch_intersection_full(a, b):
+    """
+    returns all epoch times a that are fully spanned by epoch
+    times in b
+    """
+    a = _sort_epochs(_as_epochs(a))
+    return a[epoch_contained(a, b)]
+
+
+## SVD commented out: @check_result
+def epoch_intersection(a, b, precision=6):
+    '''
+    Compute the intersection of the epochs. Only regions in a which overlap with
+    b will be kept.
+
+    Each occurence of a is intersected on its own, so occurences of a that
+    overlap (or are repeated) each keep their own pieces. Occurences of b
+    that overlap each other are merged first, but occurences that only touch
+    are not. Pieces of zero length are dropped, but an occurence of a with
+    zero length is kept if it falls strictly inside b.
+
+    Parameters
+    ----------
+    a : 2D array of (M x 2)
+        The first column is the start time and second column is the end time. M
+        is the number of occurances of a.
+    b : 2D array of (N x 2)
+        The first column is the start time and second column is the end time. N
+        is the number of occurances of b.
+    precision : int
+        Number of decimal places to use for equality test.
+
+    Returns
+    -------
+    intersection : 2D array of (O x 2)
+        The first column is the start time and second column is the end time. O
+        is the number of occurances of the difference of a and b.
+
+    Example
+    -------
+    a:       [   ]  [         ]        [ ]
+    b:      [   ]       [ ]     []      [    ]
+    result:  [  ]       [ ]             []
+    '''
+    a = _sort_epochs(np.around(_as_epochs(a), precision))
+    b = _merge_overlapping(np.around(_as_epochs(b), precision))
+
+    pieces, index = _pair_overlaps(a, b)
+    lb = np.maximum(a[index, 0], b[pieces, 0])
+    ub = np.minimum(a[index, 1], b[pieces, 1])
+    keep = (lb < ub) | (a[index, 0] == a[index, 1])
+    return np.stack((lb[keep], ub[keep]), axis=1)
+
+
+def epoch_contains(a, b, mode):
+    '''
+    Tests whether an occurence of a contains an occurence of b.
+
     Parameters
     ----------
     a : 2D array of (M x 2)
@@ -98,18 +206,524 @@ def epoch_difference(a, b):
     b : 2D array of (N x 2)
         The first column is the start time and second column is the end time. N
         is the number of occurances of b.
+    mode : {'start', 'end', 'both', 'any'}
+        Test to perform.
+        - 'start' requires only the start of b to be contained in a
+        - 'end' requires only the end of b to be contained in a
+        - 'both' requires both start and end in b to be contained in a
+        - 'any' is True anywhere b partially or completely overlaps with a
+
+    Returns
+    -------
+    mask : 1D array of len(a)
+        Boolean mask indicating whether the corresponding entry in a meets the
+        test criteria.
+    '''
+    a = _as_epochs(a)
+    b = _as_epochs(b)
+    if mode == 'start':
+        return _count_between(b[:, 0], a) > 0
+    elif mode == 'end':
+        return _count_between(b[:, 1], a) > 0
+    elif mode == 'both':
+        return _contains_both(a, b)
+    elif mode == 'any':
+        b_in_a = (_count_between(b[:, 0], a) > 0) | \
+            (_count_between(b[:, 1], a) > 0)
+        # an occurence of a can also lie entirely inside an occurence of b
+        b = merge_epoch(b)
+        a_in_b = _covered(a[:, 0], b) | _covered(a[:, 1], b)
+        return b_in_a | a_in_b
+
+
+def epoch_contained(a, b):
+    '''
+    Tests whether an occurrence of a is fully contained inside b
+    '''
+    a = _as_epochs(a)
+    b = _sort_epochs(_as_epochs(b))
+    if len(b) == 0:
+        return np.zeros(len(a), dtype=bool)
+    # an occurrence of a is contained if the epochs of b that start at or
+    # before it reach past its end
+    max_end = np.maximum.accumulate(b[:, 1])
+    k = np.searchsorted(b[:, 0], a[:, 0], side='right') - 1
+    return (k >= 0) & (max_end[np.maximum(k, 0)] >= a[:, 1])
+
+
+def epoch_contained_pairs(a, b):
+    '''
+    Finds every pair of an occurence of a and an occurence of b that lies
+    within it, i.e. a_start <= b_start and b_end <= a_end.
+
+    The occurences of b are sorted by start time once, so those starting
+    within each occurence of a are found by binary search. This takes
+    O((M + N) log N) time plus the number of occurences of b that start
+    within an occurence of a, rather than M x N comparisons.
+
+    Parameters
+    ----------
+    a : 2D array of (M x 2)
+        The first column is the start time and second column is the end time. M
+        is the number of occurances of a.
+    b : 2D array of (N x 2)
+        The first column is the start time and second column is the end time. N
+        is the number of occurances of b.
+
+    Returns
+    -------
+    a_index, b_index : 1D arrays
+        Row in a and row in b of every pair, ordered by a and then by the
+        start time of b.
+
+    Example
+    -------
+    a:      [           ]      [      ]
+    b:       [ ]  [   ]  [ ]    [  ]
+    pairs:  (0, 0), (0, 1), (1, 3)
+    '''
+    a = _as_epochs(a)
+    b = _as_epochs(b)
+    order = np.argsort(b[:, 0], kind='stable')
+    starts = b[order, 0]
+    first = np.searchsorted(starts, a[:, 0], side='left')
+    last = np.searchsorted(starts, a[:, 1], side='right')
+    a_index, b_index = _expand_ranges(first, last)
+    b_index = order[b_index]
+    keep = b[b_index, 1] <= a[a_index, 1]
+    return a_index[keep], b_index[keep]
+
+
+def adjust_epoch_bounds(a, pre=0, post=0):
+    '''
+
+    Parameters
+    ----------
+    a : 2D array of (M x 2)
+        The first column is the start time and second column is the end time. M
+        is the number of occurances of a.
+    pre : scalar
+        Value to add to start time of epoch
+    post : scalar
+        Value to add to end time of epoch
+
+    Example
+    -------
+    >>> epochs = np.array([[0.5, 1], [2.5, 3]])
+    >>> adjust_epoch_bounds(epochs, -0.5)
+    [[0, 1],
+     [2, 3]]
+
+    >>> adjust_epoch_bounds(epochs, 0.5, 1)
+    [[1, 2],
+     [3, 4]]
+    '''
+    return a + np.array([pre, post])
+
+
+class EpochIndex:
+    '''
+    Lookup structure for an epochs DataFrame. Maps each epoch name to the
+    positions of its rows and keeps the start/end times as arrays, plus a
+    start-sorted order with a running maximum of the end times so that the
+    epochs overlapping a time window can be found by binary search.
+
+    The index is a snapshot of the name/start/end columns. `is_current`
+    compares them against the DataFrame, so edits made in place are picked
+    up as well.
+    '''
+
+    def __init__(self, epochs):
+        self.epochs = epochs
+        self.n_rows = len(epochs)
+        self._names = epochs['name'].values.copy()
+        self.starts = epochs['start'].values.astype(float)
+        self.ends = epochs['end'].values.astype(float)
+        self._rows = {name: rows for name, rows in
+                      epochs.groupby('name', sort=False).indices.items()}
+        self._trees = {}
+
+    def is_current(self, epochs):
+        '''
+        True if the index was built from this DataFrame object and its name,
+        start and end columns have not changed since.
+        '''
+        if (epochs is not self.epochs) or (len(epochs) != self.n_rows):
+            return False
+        starts = np.asarray(epochs['start'].values, dtype=float)
+        ends = np.asarray(epochs['end'].values, dtype=float)
+        return (np.array_equal(starts, self.starts, equal_nan=True) and
+                np.array_equal(ends, self.ends, equal_nan=True) and
+                np.array_equal(epochs['name'].values, self._names))
+
+    def names(self):
+        return list(self._rows.keys())
+
+    def rows(self, name):
+        '''
+        Positions (not labels) of the rows for epoch `name`, in DataFrame
+        order.
+        '''
+        return self._rows.get(name, np.zeros(0, dtype=np.intp))
+
+    def bounds(self, name):
+        '''
+        (M x 2) array of start and end times of epoch `name`, in the same order
+        as the rows of the DataFrame.
+        '''
+        rows = self.rows(name)
+        return np.stack((self.starts[rows], self.ends[rows]), axis=1)
+
+    def _tree(self, name):
+        if name not in self._trees:
+            if name is None:
+                rows = np.arange(self.n_rows)
+            else:
+                rows = self.rows(name)
+            starts = self.starts[rows]
+            order = np.argsort(starts, kind='stable')
+            rows = rows[order]
+            # running max of the ends makes "any epoch up to here still open
+            # after time t" monotonic, so it can be binary searched as well
+            max_end = np.maximum.accumulate(self.ends[rows]) \
+                if len(rows) else self.ends[rows]
+            self._trees[name] = (rows, starts[order], max_end)
+        return self._trees[name]
+
+    def overlapping(self, lb, ub, name=None):
+        '''
+        Positions of the rows (optionally only those of epoch `name`) that
+        overlap the window [lb, ub), sorted by start time.
+        '''
+        rows, starts, max_end = self._tree(name)
+        last = np.searchsorted(starts, ub, side='left')
+        first = np.searchsorted(max_end[:last], lb, side='right')
+        candidates = rows[first:last]
+        return candidates[self.ends[candidates] > lb]
+
+
+def verify_epoch_integrity(epoch):
+    '''
+    There are several kinds of pathological epochs:
+      1. Epochs with NaN for a start time. (It is OK if end is NaN.)
+      2. Epochs where start comes after the end
+      3. Epochs which are completely identical to existing triplets
+         (i.e. redundant duplicates)
+    This function searches for those and throws exceptions about them.
+    '''
+    # TODO
+    raise NotImplementedError
+
+
+def epoch_names_matching(epochs, regex_str):
+    '''
+    Returns a list of epoch names that regex match the regex_str.
+    '''
+    r = re.compile(regex_str)
+    names = epochs['name'].tolist()
+    matches = filter(r.match, names)
+
+    # convert to list
+    matches = [name for name in matches]
+    matches = list(set(matches))  # unique values
+    matches.sort()
+
+    return matches
+
+
+def epoch_occurrences(epochs, regex=None):
+    '''
+    Returns a dataframe of the number of occurrences of each epoch. Optionally,
+    provide regex to match only certain epoch names.
+    '''
+    epoch_counts = epochs.name.value_counts()
+    if regex:
+        epoch_counts = epoch_counts.filter(regex=regex, axis='rows')
+    return epoch_counts
+
+
+def group_epochs_by_occurrence_counts(epochs, regex=None):
+    '''
+    Returns a dictionary mapping the number of occurrences to a list of epoch
+    names. This is essentially the inverse mapping of epoch_occurrences().
+    '''
+    d = {}
+    # Build a dict of n_occurrences -> [epoch_name1, epoch_name2, etc]
+    for row in epoch_occurrences(epochs, regex).iteritems():
+        name, count = row
+        if count in d:
+            d[count].append(name)
+        else:
+            d[count] = [name]
+    return d
+
+
+def find_common_epochs(epochs, epoch_name, d=12):
+    '''
+    Finds all epochs contained by `epoch_name` that are common to all
+    occurences of `epoch_name`. An epoch is considered "common" to all
+    occurences if the name matches and the start and end times, relative to the
+    start `epoch_name`, are the same to the number of decimal places indicated.
+
+    Parameters
+    ----------
+    epochs : dataframe with 'name', 'start', 'end'
+        Epochs to filter through
+    epoch_name : str
+        Name of epoch to use
+    d : int
+        Number of decimal places to round start and end to. This is important
+        when comparing start and end times of different epochs due to
+        floating-point errors.
+
+    Result
+    ------
+    common_epochs : dataframe with 'name', 'start', 'end'
+        Epochs common to all occurances of `epoch_name`. The start and end
+        times will reflect the time relative to the onset of the epoch.
+    '''
+    # First, find all the epochs contained within each occurrence of
+    # `epoch_name`, with their start/end time relative to the beginning of
+    # that occurrence.
+    bounds = epochs[['start', 'end']].values
+    parents = np.flatnonzero((epochs['name'] == epoch_name).values)
+    parent, child = epoch_contained_pairs(bounds[parents], bounds)
+    lb = bounds[parents[parent], 0]
+    epoch_subsets = pd.DataFrame({
+        'name': epochs['name'].values[child],
+        'start': np.round(bounds[child, 0] - lb, d),
+        'end': np.round(bounds[child, 1] - lb, d),
+        'parent': parent,
+    }).drop_duplicates()
+
+    # Now, determine which epochs are common to all occurrences.
+    counts = epoch_subsets.groupby(['name', 'start', 'end']).size()
+    common_epochs = counts.index[counts.values == len(parents)]
+
+    new_epochs = common_epochs.to_frame(index=False)
+    new_epochs.sort_values(['start', 'end'], inplace=True)
+    return new_epochs
+
+
+def group_epochs_by_parent(epochs, epoch_name_regex):
+    '''
+    Iterate through subgroups of the epoches contained by a parent epoch
+
+    Parameters
+    ----------
+    epochs : dataframe with 'name', 'start', 'end'
+        Epochs to filter through
+    epoch_name_regex : str
+        Regular expression that will be used to identify parent epochs to
+        iterate through.
+
+    Returns
+    -------
+    Iterator yielding a tuple of (parent epoch name, dataframe containing subset
+    of epochs contained by parent epoch).
+
+    Example
+    '''
+
+    m = epochs.name.str.match(epoch_name_regex).values
+    parents = np.flatnonzero(m)
+    bounds = epochs[['start', 'end']].values
+    parent, child = epoch_contained_pairs(bounds[parents], bounds)
+
+    # the rows contained by each parent, in DataFrame order
+    order = np.lexsort((child, parent))
+    split = np.searchsorted(parent[order], np.arange(1, len(parents)))
+    names = epochs['name'].values
+    for p, rows in zip(parents, np.split(child[order], split)):
+        yield (names[p], epochs.iloc[rows])
+
+
+def add_epoch(df, regex_a, regex_b, new_name=None, operation='intersection'):
+    '''
+    Add a new epoch based on an operation of two epoch sets, A and B
+
+    Parameters
+    ----------
+    df : dataframe
+        Epoch dataframe with three columns (name, start, end)
+    regex_a : string
+        Regular expression to match against for A
+    regex_b : string
+        Regular expression to match against for B
+    new_name : {None, string}
+        Name to assign to result of operation. If None, name is the
+        concatenation of regex_a and regex_b.
+    operation : {'intersection', 'difference', 'contained'}
+        Operation to perform. See docstring for epoch_{operation} for details.
+    '''
+    if new_name is None:
+        new_name = '{}_{}'.format(regex_a, regex_b)
+
+    mask_a = df['name'].str.contains(regex_a)
+    mask_b = df['name'].str.contains(regex_b)
+    a = df.loc[mask_a, ['start', 'end']].values
+    b = df.loc[mask_b, ['start', 'end']].values
+
+    if operation == 'intersection':
+        # repeated occurences of A give the same pieces, add them once
+        c = np.unique(epoch_intersection(a, b), axis=0)
+    elif operation == 'difference':
+        c = epoch_difference(a, b)
+    elif operation == 'contained':
+        # the occurences of A that lie within an occurence of B
+        _, contained = epoch_contained_pairs(b, a)
+        c = _sort_epochs(a[np.unique(contained)])
+    else:
+        raise ValueError('Unsupported operation {}'.format(operation))
+
+    if len(c) == 0:
+        return df.copy()
+
+    new_epochs = pd.DataFrame({
+        'name': new_name,
+        'start': c[:, 0],
+        'end': c[:, 1],
+    })
+    result = pd.concat((df, new_epochs))
+    result.sort_values(['start', 'end', 'name'], inplace=True)
+    return result[['name', 'start', 'end']]
+
+
+def _as_epochs(a):
+    '''
+    a as an (M x 2) array. An empty a (e.g. np.array([])) has shape (0, 2).
+    '''
+    a = np.asarray(a)
+    if a.size == 0:
+        return a.reshape(0, 2)
+    return a
+
+
+def _sort_epochs(a):
+    '''
+    Rows of a sorted by start time, then by end time.
+    '''
+    return a[np.lexsort((a[:, 1], a[:, 0]))]
+
+
+def _merge_overlapping(a):
+    '''
+    Sorted occurences of a with those that overlap merged. Unlike
+    merge_epoch, occurences that only touch are kept apart.
+    '''
+    a = _sort_epochs(a)
+    if len(a) == 0:
+        return a
+    max_end = np.maximum.accumulate(a[:, 1])
+    first = np.flatnonzero(np.concatenate(([True], a[1:, 0] >= max_end[:-1])))
+    return np.stack((a[first, 0], np.maximum.reduceat(a[:, 1], first)), axis=1)
+
+
+def _pair_overlaps(a, b):
+    '''
+    All pairs of an occurence of a and an occurence of b with
+    a_start < b_end and b_start < a_end. The start and end times of b must
+    both be sorted (e.g. merged epochs). Returns the index in b and the
+    index in a of every pair, ordered by a and then by b.
+    '''
+    first = np.searchsorted(b[:, 1], a[:, 0], side='right')
+    last = np.searchsorted(b[:, 0], a[:, 1], side='left')
+    index, pieces = _expand_ranges(first, last)
+    return pieces, index
+
+
+def _expand_ranges(first, last):
+    '''
+    Concatenation of the ranges first[i]:last[i] (empty where last <= first).
+    Returns the i of every element, and the elements.
+    '''
+    counts = np.maximum(last - first, 0)
+    index = np.repeat(np.arange(len(first)), counts)
+    offsets = np.repeat(first - (np.cumsum(counts) - counts), counts)
+    return index, np.arange(counts.sum()) + offsets
+
+
+def _count_between(x, a):
+    '''
+    Number of the times x that fall within each occurence of a (inclusive).
+    '''
+    x = np.sort(x)
+    return np.searchsorted(x, a[:, 1], side='right') - \
+        np.searchsorted(x, a[:, 0], side='left')
+
+
+def _covered(x, merged):
+    '''
+    Whether each of the times x falls within one of the occurences of
+    merged (inclusive), which must not overlap or touch (see merge_epoch).
+    '''
+    k = np.searchsorted(merged[:, 0], x, side='right') - 1
+    return (k >= 0) & (x <= merged[np.maximum(k, 0), 1])
+
+
+def _contains_both(a, b):
+    '''
+    Whether each occurence of a contains both the start and end of an
+    occurence of b.
+    '''
+    b = _sort_epochs(b)
+    if len(b) == 0:
+        return np.zeros(len(a), dtype=bool)
+    # among the epochs of b that start within a, the one that ends first
+    min_end = np.minimum.accumulate(b[::-1, 1])[::-1]
+    k = np.searchsorted(b[:, 0], a[:, 0], side='left')
+    found = k < len(b)
+    return found & (min_end[np.minimum(k, len(b) - 1)] <= a[:, 1])
+
+
+# Reference implementations of the epoch algebra, which loop over the
+# occurences. The vectorized functions above are used instead and are tested
+# against these.
+
+def remove_overlap_reference(a):
+    '''
+    Walks the sorted occurences, skipping those that start before the
+    end of the last one kept.
+    '''
+    a = a.copy()
+    a.sort(axis=0)
+    i = 0
+    n = len(a)
+    trimmed = []
+    while i < n:
+        lb, ub = a[i]
+        i += 1
+        trimmed.append((lb, ub))
+        while (i < n) and (ub > a[i, 0]):
+            i += 1
+    return np.array(trimmed)
+
+
+def merge_epoch_reference(a):
+    a = a.copy()
+    a.sort(axis=0)
+    i = 0
+    n = len(a)
+    merged = []
+    while i < n:
+        lb, ub = a[i]
+        i += 1
+        while (i < n) and (ub >= a[i, 0]):
+            ub = a[i, 1]
+            i += 1
+        merged.append((lb, ub))
+    return np.array(merged)
 
-    Returns
-    -------
-    difference : 2D array of (O x 2)
-        The first column is the start time and second column is the end time. O
-        is the number of occurances of the difference of a and b.
 
-    Example
-    -------
-    a:       [   ]  [         ]        [ ]
-    b:      [   ]       [ ]     []      [    ]
-    result:     []  [  ]  [   ]        []
+def epoch_union_reference(a, b):
+    epoch = np.concatenate((a, b), axis=0)
+    return merge_epoch_reference(epoch)
+
+
+def epoch_difference_reference(a, b):
+    '''
+    Walks a and b in step. An occurence of a that starts inside one of b
+    and extends past it is dropped entirely.
     '''
     a = a.tolist()
     a.sort(reverse=True)
@@ -196,11 +810,7 @@ def epoch_difference(a, b):
     return np.array(difference)
 
 
-def epoch_intersection_full(a, b):
-    """
-    returns all epoch times a that are fully spanned by epoch
-    times in b
-    """
+def epoch_intersection_full_reference(a, b):
     a = a.copy().tolist()
     a.sort()
     b = b.copy().tolist()
@@ -216,34 +826,9 @@ def epoch_intersection_full(a, b):
     return result
 
 
-## SVD commented out: @check_result
-def epoch_intersection(a, b, precision=6):
+def epoch_intersection_reference(a, b, precision=6):
     '''
-    Compute the intersection of the epochs. Only regions in a which overlap with
-    b will be kept.
-
-    Parameters
-    ----------
-    a : 2D array of (M x 2)
-        The first column is the start time and second column is the end time. M
-        is the number of occurances of a.
-    b : 2D array of (N x 2)
-        The first column is the start time and second column is the end time. N
-        is the number of occurances of b.
-    precision : int
-        Number of decimal places to use for equality test.
-
-    Returns
-    -------
-    intersection : 2D array of (O x 2)
-        The first column is the start time and second column is the end time. O
-        is the number of occurances of the difference of a and b.
-
-    Example
-    -------
-    a:       [   ]  [         ]        [ ]
-    b:      [   ]       [ ]     []      [    ]
-    result:  [  ]       [ ]             []
+    Walks a and b in step, splitting at the boundaries of b.
     '''
     # Convert to a list and then sort in reversed order such that pop() walks
     # through the occurences from earliest in time to latest in time.
@@ -353,30 +938,9 @@ def _epoch_contains_mask(a, b):
     return np.concatenate([m[np.newaxis] for m in mask], axis=0)
 
 
-def epoch_contains(a, b, mode):
+def epoch_contains_reference(a, b, mode):
     '''
-    Tests whether an occurence of a contains an occurence of b.
-
-    Parameters
-    ----------
-    a : 2D array of (M x 2)
-        The first column is the start time and second column is the end time. M
-        is the number of occurances of a.
-    b : 2D array of (N x 2)
-        The first column is the start time and second column is the end time. N
-        is the number of occurances of b.
-    mode : {'start', 'end', 'both', 'any'}
-        Test to perform.
-        - 'start' requires only the start of b to be contained in a
-        - 'end' requires only the end of b to be contained in a
-        - 'both' requires both start and end in b to be contained in a
-        - 'any' is True anywhere b partially or completely overlaps with a
-
-    Returns
-    -------
-    mask : 1D array of len(a)
-        Boolean mask indicating whether the corresponding entry in a meets the
-        test criteria.
+    Compares every occurence of a with every occurence of b.
     '''
     mask = _epoch_contains_mask(a, b)
     if mode == 'start':
@@ -395,219 +959,9 @@ def epoch_contains(a, b, mode):
         return b_in_a | a_in_b
 
 
-def epoch_contained(a, b):
+def epoch_contained_reference(a, b):
     '''
-    Tests whether an occurrence of a is fully contained inside b
+    Compares every occurence of a with every occurence of b.
     '''
     mask = _epoch_contains_mask(b, a)
     return mask.all(axis=2).any(axis=0)
-
-
-def adjust_epoch_bounds(a, pre=0, post=0):
-    '''
-
-    Parameters
-    ----------
-    a : 2D array of (M x 2)
-        The first column is the start time and second column is the end time. M
-        is the number of occurances of a.
-    pre : scalar
-        Value to add to start time of epoch
-    post : scalar
-        Value to add to end time of epoch
-
-    Example
-    -------
-    >>> epochs = np.array([[0.5, 1], [2.5, 3]])
-    >>> adjust_epoch_bounds(epochs, -0.5)
-    [[0, 1],
-     [2, 3]]
-
-    >>> adjust_epoch_bounds(epochs, 0.5, 1)
-    [[1, 2],
-     [3, 4]]
-    '''
-    return a + np.array([pre, post])
-
-
-def verify_epoch_integrity(epoch):
-    '''
-    There are several kinds of pathological epochs:
-      1. Epochs with NaN for a start time. (It is OK if end is NaN.)
-      2. Epochs where start comes after the end
-      3. Epochs which are completely identical to existing triplets
-         (i.e. redundant duplicates)
-    This function searches for those and throws exceptions about them.
-    '''
-    # TODO
-    raise NotImplementedError
-
-
-def epoch_names_matching(epochs, regex_str):
-    '''
-    Returns a list of epoch names that regex match the regex_str.
-    '''
-    r = re.compile(regex_str)
-    names = epochs['name'].tolist()
-    matches = filter(r.match, names)
-
-    # convert to list
-    matches = [name for name in matches]
-    matches = list(set(matches))  # unique values
-    matches.sort()
-
-    return matches
-
-
-def epoch_occurrences(epochs, regex=None):
-    '''
-    Returns a dataframe of the number of occurrences of each epoch. Optionally,
-    provide regex to match only certain epoch names.
-    '''
-    epoch_counts = epochs.name.value_counts()
-    if regex:
-        epoch_counts = epoch_counts.filter(regex=regex, axis='rows')
-    return epoch_counts
-
-
-def group_epochs_by_occurrence_counts(epochs, regex=None):
-    '''
-    Returns a dictionary mapping the number of occurrences to a list of epoch
-    names. This is essentially the inverse mapping of epoch_occurrences().
-    '''
-    d = {}
-    # Build a dict of n_occurrences -> [epoch_name1, epoch_name2, etc]
-    for row in epoch_occurrences(epochs, regex).iteritems():
-        name, count = row
-        if count in d:
-            d[count].append(name)
-        else:
-            d[count] = [name]
-    return d
-
-
-def find_common_epochs(epochs, epoch_name, d=12):
-    '''
-    Finds all epochs contained by `epoch_name` that are common to all
-    occurences of `epoch_name`. An epoch is considered "common" to all
-    occurences if the name matches and the start and end times, relative to the
-    start `epoch_name`, are the same to the number of decimal places indicated.
-
-    Parameters
-    ----------
-    epochs : dataframe with 'name', 'start', 'end'
-        Epochs to filter through
-    epoch_name : str
-        Name of epoch to use
-    d : int
-        Number of decimal places to round start and end to. This is important
-        when comparing start and end times of different epochs due to
-        floating-point errors.
-
-    Result
-    ------
-    common_epochs : dataframe with 'name', 'start', 'end'
-        Epochs common to all occurances of `epoch_name`. The start and end
-        times will reflect the time relative to the onset of the epoch.
-    '''
-    # First, loop through all occurrence of `epoch_name` and find all the
-    # epochs contained within that occurrence. Be sure to adjust the start/end
-    # time so that they are relative to the beginning of the occurrence of that
-    # epoch.
-    epoch_subsets = []
-    matches = epochs.query('name == "{}"'.format(epoch_name))
-    for lb, ub in matches[['start', 'end']].values:
-        m = (epochs['start'] >= lb) & (epochs['end'] <= ub)
-        epoch_subset = epochs.loc[m].copy()
-        epoch_subset['start'] -= lb
-        epoch_subset['end'] -= lb
-        epoch_subset = set((n, round(s, d), round(e, d)) for (n, s, e) \
-                           in epoch_subset[['name', 'start', 'end']].values)
-
-        epoch_subsets.append(epoch_subset)
-
-    # Now, determine which epochs are common to all occurrences.
-    common_epochs = epoch_subsets[0].copy()
-    for other_epoch in epoch_subsets[1:]:
-        common_epochs.intersection_update(other_epoch)
-
-    new_epochs = pd.DataFrame(list(common_epochs),
-                              columns=['name', 'start', 'end'])
-    new_epochs.sort_values(['start', 'end'], inplace=True)
-    return new_epochs
-
-
-def group_epochs_by_parent(epochs, epoch_name_regex):
-    '''
-    Iterate through subgroups of the epoches contained by a parent epoch
-
-    Parameters
-    ----------
-    epochs : dataframe with 'name', 'start', 'end'
-        Epochs to filter through
-    epoch_name_regex : str
-        Regular expression that will be used to identify parent epochs to
-        iterate through.
-
-    Returns
-    -------
-    Iterator yielding a tuple of (parent epoch name, dataframe containing subset
-    of epochs contained by parent epoch).
-
-    Example
-    '''
-
-    m = epochs.name.str.match(epoch_name_regex)
-    for name, start, end in epochs.loc[m, ['name', 'start', 'end']].values:
-        m_lb = epochs['start'] >= start
-        m_ub = epochs['end'] <= end
-        m = m_lb & m_ub
-        yield (name, epochs.loc[m])
-
-
-def add_epoch(df, regex_a, regex_b, new_name=None, operation='intersection'):
-    '''
-    Add a new epoch based on an operation of two epoch sets, A and B
-
-    Parameters
-    ----------
-    df : dataframe
-        Epoch dataframe with three columns (name, start, end)
-    regex_a : string
-        Regular expression to match against for A
-    regex_b : string
-        Regular expression to match against for B
-    new_name : {None, string}
-        Name to assign to result of operation. If None, name is the
-        concatenation of regex_a and regex_b.
-    operation : {'intersection', 'difference', 'contained'}
-        Operation to perform. See docstring for epoch_{operation} for details.
-    '''
-    if new_name is None:
-        new_name = '{}_{}'.format(regex_a, regex_b)
-
-    mask_a = df['name'].str.contains(regex_a)
-    mask_b = df['name'].str.contains(regex_b)
-    a = df.loc[mask_a, ['start', 'end']].values
-    b = df.loc[mask_b, ['start', 'end']].values
-
-    if operation == 'intersection':
-        c = epoch_intersection(a, b)
-    elif operation == 'difference':
-        c = epoch_difference(a, b)
-    elif operation == 'contained':
-        c = epoch_contained(a, b)
-    else:
-        raise ValueError('Unsupported operation {}'.format(operation))
-
-    if len(c) == 0:
-        return df.copy()
-
-    new_epochs = pd.DataFrame({
-        'name': new_name,
-        'start': c[:, 0],
-        'end': c[:, 1],
-    })
-    result = pd.concat((df, new_epochs))
-    result.sort_values(['start', 'end', 'name'], inplace=True)
-    return result[['name', 'start', 'end']]
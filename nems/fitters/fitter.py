@@ -109,11 +109,14 @@ def coordinate_descent(sigma, cost_fn, step_size=0.1, step_change=0.5,
 
 
 def scipy_minimize(sigma, cost_fn, tolerance=None, max_iter=None,
-                   bounds=None, method='L-BFGS-B', options={}):
+                   bounds=None, method='L-BFGS-B', options={}, jac=False):
     """
     Wrapper for scipy.optimize.minimize to normalize format with
     NEMS fitters.
 
+    If jac is True, cost_fn must return (error, gradient), see
+    nems.analysis.cost_functions.gradient_cost.
+
     TODO: finish this doc
 
     Does not currently use the stepinfo/termination_conditions
@@ -145,7 +148,11 @@ def scipy_minimize(sigma, cost_fn, tolerance=None, max_iter=None,
 
     options['maxfun'] = options['maxiter']*10
     log.info('options %s', options)
-    start_err = cost_fn(sigma)
+    if jac:
+        err_fn = lambda sigma: cost_fn(sigma)[0]
+    else:
+        err_fn = cost_fn
+    start_err = err_fn(sigma)
 
     if np.isnan(np.array(sigma)).any():
         raise ValueError('Sigma contains NaN!')
@@ -153,10 +160,10 @@ def scipy_minimize(sigma, cost_fn, tolerance=None, max_iter=None,
     # convert to format required by scipy
     bounds = list(zip(*bounds))
     log.info("Start sigma: %s", np.round(sigma, 4))
-    result = scp.optimize.minimize(cost_fn, sigma, method=method,
+    result = scp.optimize.minimize(cost_fn, sigma, method=method, jac=jac,
                                    bounds=bounds, options=options)
     sigma = result.x
-    final_err = cost_fn(sigma)
+    final_err = err_fn(sigma)
     log.info("Starting error: %.06f -- Final error: %.06f", start_err, final_err)
     log.info("Final sigma: %s", np.round(sigma, 4))
 
@@ -10,15 +10,15 @@ from copy import deepcopy
 
 import numpy as np
 
-from nems.fitters.util import phi_to_vector, vector_to_phi
+from nems.fitters.util import PhiLayout
 
 
 def to_bounds_array(value, phi, which):
-    if which is 'lower':
+    if which == 'lower':
         default_value = -np.inf
         i = 0
 
-    elif which is 'upper':
+    elif which == 'upper':
         default_value = np.inf
         i = 1
 
@@ -28,14 +28,14 @@ def to_bounds_array(value, phi, which):
         value = np.array(value)
 
     if value is None:
-        return np.full_like(phi, default_value, dtype=np.float)
+        return np.full_like(phi, default_value, dtype=float)
 
     if isinstance(value, np.ndarray):
         if value.shape != phi.shape:
             raise ValueError('Bounds wrong shape')
         return value
 
-    return np.full_like(phi, value, dtype=np.float)
+    return np.full_like(phi, value, dtype=float)
 
 
 def simple_vector(modelspec, subset=None):
@@ -103,26 +103,23 @@ def simple_vector(modelspec, subset=None):
         # Set subset to the full model if not provided
         subset = np.arange(len(modelspec))
 
-    # Create a phi_template only once
+    # Work out the layout of phi in the vector only once
     modelspec_subset = [m for i, m in enumerate(modelspec) if i in subset]
-    phi_template = [m.get('phi', {}) for m in modelspec_subset]
+    layout = PhiLayout([m.get('phi', {}) for m in modelspec_subset])
 
     def packer(modelspec):
         ''' Converts a modelspec to a vector. '''
         nonlocal modelspec_subset
 
-        phi = [m.get('phi', {}) for m in modelspec_subset]
-        return phi_to_vector(phi)
+        return layout.pack([m.get('phi', {}) for m in modelspec_subset])
 
     def unpacker(vec):
         ''' Converts a vector back into a modelspec. '''
-        nonlocal phi_template
         nonlocal modelspec
         nonlocal modelspec_subset
 
-        phi = vector_to_phi(vec, phi_template)
-        for i, p in enumerate(phi):
-            modelspec_subset[i]['phi'] = p
+        for m, p in zip(modelspec_subset, layout.unpack(vec)):
+            m['phi'] = p
 
         return modelspec
 
@@ -143,8 +140,6 @@ def simple_vector(modelspec, subset=None):
             lower.append(module_lb)
             upper.append(module_ub)
 
-        lower = phi_to_vector(lower)
-        upper = phi_to_vector(upper)
-        return lower, upper
+        return layout.pack(lower), layout.pack(upper)
 
     return packer, unpacker, bounds
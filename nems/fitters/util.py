@@ -71,6 +71,118 @@ def vector_to_phi(vector, phi_template):
     return phi
 
 
+class PhiLayout:
+    '''
+    Precomputed layout of a list of phi dictionaries in a vector, in the
+    same order as phi_to_vector: the keys of every dictionary in sorted
+    order, with array values flattened.
+
+    Working out the layout once per modelspec (instead of on every call
+    to phi_to_vector and vector_to_phi) makes packing a single
+    concatenate and unpacking a set of reshaped views of the vector.
+
+    Example
+    -------
+    >>> layout = PhiLayout([{'baseline': 0, 'coefs': [0, 0]}, {}, {'a': 0}])
+    >>> layout.size
+    4
+    >>> layout.pack([{'baseline': 1, 'coefs': [2, 3]}, {}, {'a': 4}])
+    array([1., 2., 3., 4.])
+    '''
+
+    def __init__(self, phi_template):
+        # per dictionary, a list of (key, start, stop, shape) where shape
+        # is None for scalars
+        self.layout = []
+        offset = 0
+        for p_template in phi_template:
+            entries = []
+            for k in sorted((p_template or {}).keys()):
+                value_template = p_template[k]
+                if np.isscalar(value_template):
+                    entries.append((k, offset, offset+1, None))
+                    offset += 1
+                else:
+                    value_template = np.asarray(value_template)
+                    entries.append((k, offset, offset+value_template.size,
+                                    value_template.shape))
+                    offset += value_template.size
+            self.layout.append(entries)
+        self.size = offset
+
+    def pack(self, phi):
+        '''
+        Convert a list of phi dictionaries with this layout to a float64
+        vector.
+        '''
+        values = [np.ravel(p[k]) for p, entries in zip(phi, self.layout)
+                  for k, _, _, _ in entries]
+        if not values:
+            return np.empty(0)
+        return np.concatenate(values).astype(np.float64, copy=False)
+
+    def unpack(self, vector):
+        '''
+        Convert vector back to a list of new phi dictionaries. Array values
+        are views of vector (when vector is an array) and scalar values are
+        its elements.
+        '''
+        vector = np.asarray(vector)
+        if vector.shape != (self.size,):
+            raise ValueError('Expected a vector of {} values, got shape {}'
+                             .format(self.size, vector.shape))
+        return [{k: vector[start] if shape is None
+                 else vector[start:stop].reshape(shape)
+                 for k, start, stop, shape in entries}
+                for entries in self.layout]
+
+
+def check_gradient(cost_fn, sigma, step=1e-6):
+    '''
+    Compare the analytic gradient returned by a cost function against a
+    central finite-difference estimate.
+
+    Parameters
+    ----------
+    cost_fn : function
+        Function of sigma returning (error, gradient), e.g. a
+        nems.analysis.cost_functions.gradient_cost with everything but
+        sigma frozen.
+    sigma : 1D array
+        Point at which to check the gradient.
+    step : float
+        Finite-difference step size.
+
+    Returns
+    -------
+    grad : 1D array
+        Analytic gradient.
+    numeric_grad : 1D array
+        Finite-difference gradient.
+    max_error : float
+        Largest absolute difference between the two, relative to the
+        largest absolute value of numeric_grad (or absolute if that is 0).
+    '''
+    sigma = np.array(sigma, dtype=np.float64)
+    grad = np.asarray(cost_fn(sigma)[1])
+    numeric_grad = np.zeros_like(sigma)
+    for i in range(len(sigma)):
+        s = sigma.copy()
+        s[i] = sigma[i] + step
+        e_plus = cost_fn(s)[0]
+        s[i] = sigma[i] - step
+        e_minus = cost_fn(s)[0]
+        numeric_grad[i] = (e_plus - e_minus) / (2*step)
+    # restore state for cost functions that unpack sigma in place
+    cost_fn(sigma)
+
+    scale = np.max(np.abs(numeric_grad))
+    max_error = np.max(np.abs(grad - numeric_grad))
+    if scale > 0:
+        max_error /= scale
+    return grad, numeric_grad, max_error
+
+
 def initialize_phi(priors, method='mean'):
     '''
     Create an initial set of values for phi given priors
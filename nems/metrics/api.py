@@ -1,5 +1,6 @@
-from .mse import mse, nmse, nmse_shrink, j_nmse
+from .mse import mse, nmse, nmse_shrink, j_nmse, mse_grad, nmse_grad
 from .corrcoef import corrcoef, j_corrcoef, r_floor, r_ceiling
+from .jackknife import j_corrcoef_nmse
 from .loglike import likelihood_poisson
 from .state import state_mod_index, j_state_mod_index
 from .stp import stp_magnitude
@@ -3,6 +3,7 @@ import numpy as np
 import scipy.special
 import scipy.stats as stats
 import nems.epoch as ep
+from nems.metrics.jackknife import jackknife_sums, j_corrcoef_from_sums
 
 import logging
 log = logging.getLogger(__name__)
@@ -87,101 +88,168 @@ def j_corrcoef(result, pred_name='pred', resp_name='resp', njacks=20):
     predmat = result[pred_name].as_continuous()
     respmat = result[resp_name].as_continuous()
 
-    channel_count = predmat.shape[0]
-    cc = np.zeros(channel_count)
-    ee = np.zeros(channel_count)
-    #print("shape predmat:", predmat.shape)
-    for i in range(channel_count):
-        pred = predmat[i, :]
-        resp = respmat[i, :]
-        ff = np.isfinite(pred) & np.isfinite(resp)
-
-        if (np.sum(ff) == 0) or \
-           (np.std(pred[ff]) == 0) or \
-           (len(np.unique(resp[ff])) == 1):
-            cc[i] = 0
-            ee[i] = 0
-        else:
-            pred = pred[ff]
-            resp = resp[ff]
-            chunksize = int(np.ceil(len(pred) / njacks / 10))
-            chunkcount = int(np.ceil(len(pred) / chunksize / njacks))
-            idx = np.zeros((chunkcount, njacks, chunksize))
-            for jj in range(njacks):
-                idx[:, jj, :] = jj
-            idx = np.reshape(idx, [-1])[:len(pred)]
-            jc = np.zeros(njacks)
-            for jj in range(njacks):
-                ff = (idx != jj)
-                jc[jj] = np.corrcoef(pred[ff], resp[ff])[0, 1]
-
-            cc[i] = np.nanmean(jc)
-            ee[i] = np.nanstd(jc) * np.sqrt(njacks-1)
-
-    return cc, ee
-
-
-def r_floor(result, pred_name='pred', resp_name='resp'):
+    # all channels and jackknifes at once, from per-chunk sums
+    sums = jackknife_sums(predmat, respmat, njacks)
+    return j_corrcoef_from_sums(predmat, respmat, sums)
+
+
+def _random_state(rand_seed=None):
+    '''
+    np.random if rand_seed is None, otherwise a RandomState seeded with
+    rand_seed (which draws the same numbers as np.random after
+    np.random.seed(rand_seed), without changing the global state).
+    '''
+    if rand_seed is None:
+        return np.random
+    return np.random.RandomState(rand_seed)
+
+
+def _zscore_rows(X):
+    '''
+    Z-score each row of X (along the last axis) over its finite samples.
+    Constant rows become 0, NaNs stay NaN.
+    '''
+    with np.errstate(invalid='ignore'):
+        m = np.nanmean(X, axis=-1, keepdims=True)
+        s = np.nanstd(X, axis=-1, keepdims=True)
+    s[~(s > 0)] = 1
+    return (X - m) / s
+
+
+def _pairwise_corrcoef(X, Y=None):
+    '''
+    NaN-aware correlation coefficients between the rows of X and Y, as one
+    (batched) matrix product.
+
+    Parameters
+    ----------
+    X : (..., m, T) array
+    Y : (..., k, T) array, defaults to X
+
+    Returns
+    -------
+    cc : (..., m, k) array
+        cc[..., i, j] is the correlation coefficient of X[..., i, :] and
+        Y[..., j, :] over the samples where both are finite. NaN if either
+        is constant over those samples.
+    n, sum_x, sum_y : (..., m, k) arrays
+        Number of samples where both are finite, and the sums of X[i] and
+        Y[j] over them.
+    const_x, const_y : (..., m, k) boolean arrays
+        True where X[i] (Y[j]) is constant over those samples.
+    '''
+    if Y is None:
+        Y = X
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    mx = np.isfinite(X)
+    my = np.isfinite(Y)
+    fx = mx.astype(float)
+    fy = my.astype(float)
+    YT = np.swapaxes(fy, -1, -2)
+    XT = np.swapaxes(fx, -1, -2)
+
+    # each row is z-scored once, so the sums below are well conditioned
+    zx = np.where(mx, _zscore_rows(X), 0)
+    zy = np.where(my, _zscore_rows(Y), 0)
+
+    n = fx @ YT
+    sum_x = np.where(mx, X, 0) @ YT
+    sum_y = np.swapaxes(np.where(my, Y, 0) @ XT, -1, -2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sx = zx @ YT
+        sy = np.swapaxes(zy @ XT, -1, -2)
+        vx = (zx * zx) @ YT - sx * sx / n
+        vy = np.swapaxes((zy * zy) @ XT, -1, -2) - sy * sy / n
+        cov = zx @ np.swapaxes(zy, -1, -2) - sx * sy / n
+
+        # z-scored samples are O(1), so anything this small is rounding error
+        const_x = ~(vx > 1e-10 * n)
+        const_y = ~(vy > 1e-10 * n)
+        cc = cov / np.sqrt(vx * vy)
+    cc[const_x | const_y] = np.nan
+
+    return cc, n, sum_x, sum_y, const_x, const_y
+
+
+def r_floor(result, pred_name='pred', resp_name='resp', rand_seed=None):
     '''
     corr coef floor based on shuffled responses
+
+    For each channel, the correlation between 1000 random draws of (up to)
+    500 samples of pred and of resp, computed for all draws at once. Returns
+    the 95th percentile of the correlations for each channel. If rand_seed
+    is set, the draws come from a RandomState seeded with it instead of the
+    global numpy random state.
     '''
     # if running validation test, also measure r_floor
     X1mat = result[pred_name].as_continuous()
     X2mat = result[resp_name].as_continuous()
     channel_count = X2mat.shape[0]
     r_floor = np.zeros(channel_count)
+    rs = _random_state(rand_seed)
 
     for i in range(channel_count):
-        #import pdb
-        #pdb.set_trace()
         X1 = X1mat[i, :]
         X2 = X2mat[i, :]
 
         # remove all nans from pred and resp
         ff = np.isfinite(X1) & np.isfinite(X2)
-        X1=X1[ff]
-        X2=X2[ff]
+        X1 = X1[ff]
+        X2 = X2[ff]
 
         # figure out how many samples to use in each shuffle
-        if len(X1)>500:
-            n=500
-        else:
-            n=len(X1)
-
-        # compute cc for 1000 shuffles
-        rf = np.zeros([1000, 1])
-        for rr in range(0, len(rf)):
-            n1 = (np.random.rand(n) * len(X1)).astype(int)
-            n2 = (np.random.rand(n) * len(X2)).astype(int)
-            rf[rr] = np.corrcoef(X1[n1], X2[n2])[0, 1]
+        n = min(len(X1), 500)
+        if n == 0:
+            continue
+
+        # cc for 1000 shuffles (the draws are in the same order as drawing
+        # n1 and n2 for each shuffle in turn)
+        draws = rs.rand(1000, 2, n)
+        n1 = (draws[:, 0, :] * len(X1)).astype(int)
+        n2 = (draws[:, 1, :] * len(X2)).astype(int)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z1 = X1[n1] - X1[n1].mean(axis=1, keepdims=True)
+            z2 = X2[n2] - X2[n2].mean(axis=1, keepdims=True)
+            rf = (z1 * z2).sum(axis=1) / \
+                np.sqrt((z1 * z1).sum(axis=1) * (z2 * z2).sum(axis=1))
 
         rf = np.sort(rf[np.isfinite(rf)], 0)
         if len(rf):
-            r_floor[i] = rf[np.int(len(rf) * 0.95)]
+            r_floor[i] = rf[int(len(rf) * 0.95)]
         else:
             r_floor[i] = 0
 
     return r_floor
 
 
-def _r_single(X, N=100,limit=0.01):
+def _r_single(X, N=100, limit=0.01, rand_seed=None, rs=None):
     """
-    Assume X is trials X time raster (channel removed)
+    Assume X is trials X time raster (channel removed), or a stack of them
+    (channels X trials X time).
+
+    Mean correlation between N random pairs of trials. The correlations
+    between all pairs of trials (of all channels) are computed at once,
+    then N pairs per channel are picked at random. Returns one value per
+    channel if X is 3D.
 
     test data from SPN recording
     X=rec['resp'].extract_epoch('STIM_BNB+si464+si1889')[:, chanidx, :]
     """
+    if rs is None:
+        rs = _random_state(rand_seed)
+    single_channel = (X.ndim == 2)
+    if single_channel:
+        X = X[np.newaxis]
 
-    repcount = X.shape[0]
+    chancount, repcount = X.shape[:2]
     if repcount <= 1:
         log.info('repcount<=1, rnorm=0')
         return 0
 
-    paircount = np.int(scipy.special.comb(repcount, 2))
-    pairs = []
-    for p1 in range(repcount):
-        for p2 in range(p1+1, repcount):
-            pairs.append([p1, p2])
+    paircount = int(scipy.special.comb(repcount, 2))
+    pairs = np.triu_indices(repcount, 1)
 
     if paircount < N:
         N = paircount
@@ -190,49 +258,31 @@ def _r_single(X, N=100,limit=0.01):
         # TODO:
         # only two repeats, break up data in time to get a better
         # estimate of single-trial correlations
-        # raise ValueError("2 repeats condition not supported yet.")
-        # N=10;
-        # bstep=size(pred,1)./N;
-        # rac=zeros(N,1);
-        # for nn=1:N,
-        #     tt=round((nn-1).*bstep+1):round(nn*bstep);
-        #     if ~isempty(tt) && std(resp(tt,1))>0 && std(resp(tt,2))>0,
-        #         rac(nn)=xcov(resp(tt,1),resp(tt,2),0,'coeff');
-        #     end
-        # end
         # print('r_ceiling invalid')
         return 0.05
     else:
+        # same draws as picking the pairs one channel at a time
+        sidx = np.argsort(rs.rand(chancount, paircount), axis=1)[:, :N]
+        chan = np.arange(chancount)[:, np.newaxis]
+        p1, p2 = pairs[0][sidx], pairs[1][sidx]
 
-        rac = np.zeros(N)
-        sidx = np.argsort(np.random.rand(paircount))
-        for nn in range(N):
-            X1 = X[pairs[sidx[nn]][0], :]
-            X2 = X[pairs[sidx[nn]][1], :]
-
-            # remove all nans from pred and resp
-            ff = np.isfinite(X1) & np.isfinite(X2)
-            X1 = X1[ff]
-            X2 = X2[ff]
-            #if (np.sum(X1) > 0) and (np.sum(X2) > 0):
-            if    (np.sum(X1) == 0) or (np.sum(X2) == 0) or \
-                   (len(np.unique(X1)) == 1) or \
-                   (len(np.unique(X2)) == 1):
-                rac[nn] = 0
-            else:
-                rac[nn] = np.corrcoef(X1, X2)[0, 1]
-                
+        cc, n, sum_x, sum_y, const_x, const_y = _pairwise_corrcoef(X)
+        rac = cc[chan, p1, p2]
+        rac[(sum_x[chan, p1, p2] == 0) | (sum_y[chan, p1, p2] == 0) |
+            const_x[chan, p1, p2] | const_y[chan, p1, p2]] = 0
 
     # hard limit on single-trial correlation to prevent explosion
     # TODO: better logic for this
-    rac = np.mean(rac)
-    if rac < limit:
-        rac = limit
+    rac = np.mean(rac, axis=1)
+    rac[rac < limit] = limit
 
+    if single_channel:
+        return rac[0]
     return rac
 
 
-def r_ceiling(result, fullrec, pred_name='pred', resp_name='resp', N=100):
+def r_ceiling(result, fullrec, pred_name='pred', resp_name='resp', N=100,
+              rand_seed=None):
     """
     parameter:
         result : recording
@@ -240,6 +290,9 @@ def r_ceiling(result, fullrec, pred_name='pred', resp_name='resp', N=100):
         fullrec : orginal recording that isn't averaged across reps
         N : int
             number of random single trial pairs to test
+        rand_seed : int
+            if set, pick the trial pairs with a RandomState seeded with
+            rand_seed instead of the global numpy random state
 
     returns:
         rnorm: nparray
@@ -255,6 +308,10 @@ def r_ceiling(result, fullrec, pred_name='pred', resp_name='resp', N=100):
     concatenates one rep of each validation stimulus into a long vector for
     calculating a corr coeff across all stimuli. Still repeats this for a
     bunch of pairs to get a good estimate of correlation between single trials
+
+    Epochs are extracted once for all channels, and the single-trial and
+    trial-prediction correlations of every channel are computed as batched
+    matrix products.
     """
 
     epoch_regex = '^STIM_'
@@ -266,61 +323,38 @@ def r_ceiling(result, fullrec, pred_name='pred', resp_name='resp', N=100):
     resp = fullrec[resp_name].rasterize()
 
     chancount = resp.shape[0]
+    rs = _random_state(rand_seed)
+
+    Xall = []
+    p = []
+    for k, d in folded_resp.items():
+        if np.sum(np.isfinite(d)) > 0:
+            _n = folded_pred[k].shape[2]
+            Xall.append(resp.extract_epoch(k)[:, :, :_n])
+            p.append(folded_pred[k])
+
+    if Xall == []:
+        return 0
+
+    minreps = np.min([x.shape[0] for x in Xall])
+    # channels X reps X time
+    X = np.concatenate([x[:minreps] for x in Xall], axis=2).swapaxes(0, 1)
+
+    minpreps = np.min([p0.shape[0] for p0 in p])
+    p = np.concatenate([p0[:minpreps] for p0 in p], axis=2).swapaxes(0, 1)
 
     rnorm = np.zeros(chancount)
-    for chanidx in range(chancount):
-        Xall = []
-        p = []
-        reps = []
-        preps = []
-        for k, d in folded_resp.items():
-            if np.sum(np.isfinite(d)) > 0:
-                _n = folded_pred[k][:, chanidx, :].shape[1]
-                _r = resp.extract_epoch(k)[:, chanidx, :_n]
-                Xall.append(_r)
-                p.append(folded_pred[k][:, chanidx, :])
-                #print(k)
-                #print(_r.shape)
-                #print(folded_pred[k][:, chanidx, :].shape)
-                reps.append(Xall[-1].shape[0])
-                preps.append(p[-1].shape[0])
-
-        if Xall == []:
-            return 0
-
-        minreps = np.min(reps)
-        X = [x[:minreps, :] for x in Xall]
-        X = np.concatenate(X, axis=1)
-
-        minpreps = np.min(preps)
-        p = [p0[:minpreps, :] for p0 in p]
-        p = np.concatenate(p, axis=1)
-        #import pdb
-        #pdb.set_trace()
-        if minreps > 1:
-            rac = _r_single(X, N)
+    if minreps > 1:
+        rac = _r_single(X, N, rs=rs)
+
+        # correlation of each trial with the (first) prediction
+        rs_cc, n, sum_x, _, _, const_y = _pairwise_corrcoef(X, p[:, :1, :])
+        rs_cc = rs_cc[:, :, 0]
+        rs_cc[(n[:, :, 0] == 0) | (sum_x[:, :, 0] == 0) |
+              const_y[:, :, 0]] = 0
+
+        rnorm[:] = np.mean(rs_cc, axis=1) / np.sqrt(rac)
 
-            repcount = X.shape[0]
-            rs = np.zeros(repcount)
-            for nn in range(repcount):
-                X1 = X[nn, :]
-                X2 = p[0, :]
-
-                # remove all nans from pred and resp
-                ff = np.isfinite(X1) & np.isfinite(X2)
-                X1 = X1[ff]
-                X2 = X2[ff]
-
-                if (np.sum(ff) == 0) or \
-                   (np.sum(X1) == 0) or \
-                   (len(np.unique(X2)) == 1):
-                       rs[nn] = 0
-                else:
-                    rs[nn] = np.corrcoef(X1, X2)[0, 1]
-
-            rnorm[chanidx] = np.mean(rs)/np.sqrt(rac)
-        else:
-            rnorm[chanidx] = 0
     return rnorm
 """
     rs_all = np.array([])
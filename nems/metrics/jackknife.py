@@ -0,0 +1,189 @@
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def jackknife_sums(predmat, respmat, njacks=20):
+    '''
+    Sufficient statistics for jackknifed prediction metrics, for every
+    channel at once.
+
+    Samples where pred or resp is not finite are dropped. The remaining
+    samples of each channel are divided into chunks of
+    ceil(n / njacks / 10) samples, and chunk k goes to jackknife
+    k % njacks (the same split as the per-channel loops in j_corrcoef and
+    j_nmse used to make).
+
+    Parameters
+    ----------
+    predmat, respmat : (channel_count, T) arrays
+
+    Returns
+    -------
+    sums : dict
+        'n', 'x', 'y', 'xx', 'yy', 'xy' and 'dd' are
+        (channel_count, njacks) arrays with the number of samples and the
+        sums of pred (x), resp (y), their squares and cross-products, and
+        the squared prediction error, left out by each jackknife. x and y
+        are centered on their channel means first to keep the sums
+        accurate. 'x_const' and 'y_const' flag the jackknifes whose pred or
+        resp samples are all equal (e.g. a sparse response with its only
+        nonzero samples left out), where variances computed from the sums
+        would only be rounding error. 'valid' is the (channel_count, T)
+        mask of finite samples.
+    '''
+    predmat = np.asarray(predmat, dtype=float)
+    respmat = np.asarray(respmat, dtype=float)
+    channel_count = predmat.shape[0]
+
+    ff = np.isfinite(predmat) & np.isfinite(respmat)
+    n = ff.sum(axis=1)
+    chunksize = np.ceil(n / njacks / 10).astype(int)
+    chunksize[chunksize < 1] = 1
+
+    # jackknife of each valid sample, from its rank among the valid samples
+    # of its channel
+    rank = np.cumsum(ff, axis=1) - 1
+    jack = (rank // chunksize[:, np.newaxis]) % njacks
+    jack += np.arange(channel_count)[:, np.newaxis] * njacks
+    jack = jack[ff]
+
+    x = np.where(ff, predmat, 0)
+    y = np.where(ff, respmat, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1, keepdims=True) / n[:, np.newaxis]
+        y_mean = y.sum(axis=1, keepdims=True) / n[:, np.newaxis]
+    xc = (predmat - x_mean)[ff]
+    yc = (respmat - y_mean)[ff]
+    d = (predmat - respmat)[ff]
+
+    def chunk_sum(weights=None):
+        s = np.bincount(jack, weights=weights,
+                        minlength=channel_count * njacks)
+        return s.reshape(channel_count, njacks)
+
+    sums = {'n': chunk_sum(), 'x': chunk_sum(xc), 'y': chunk_sum(yc),
+            'xx': chunk_sum(xc * xc), 'yy': chunk_sum(yc * yc),
+            'xy': chunk_sum(xc * yc), 'dd': chunk_sum(d * d)}
+
+    # leave-one-out sums: everything but the jackknife's own chunks
+    for k, s in sums.items():
+        sums[k] = s.sum(axis=1, keepdims=True) - s
+
+    # a jackknife is constant if the min and max of the other jackknifes'
+    # chunks are equal
+    order = np.argsort(jack, kind='stable')
+    counts = np.bincount(jack, minlength=channel_count * njacks)
+    sums['x_const'] = _loo_constant(predmat[ff][order], counts, njacks)
+    sums['y_const'] = _loo_constant(respmat[ff][order], counts, njacks)
+    sums['valid'] = ff
+
+    return sums
+
+
+def _loo_constant(values, counts, njacks):
+    '''
+    Whether the values left in by each jackknife are all equal. values are
+    sorted by jackknife, with counts[k] values in jackknife k (numbered
+    channel * njacks + jackknife).
+    '''
+    nonempty = counts > 0
+    starts = (np.cumsum(counts) - counts)[nonempty]
+    lo = np.full(len(counts), np.inf)
+    hi = np.full(len(counts), -np.inf)
+    if len(values):
+        lo[nonempty] = np.minimum.reduceat(values, starts)
+        hi[nonempty] = np.maximum.reduceat(values, starts)
+    lo = lo.reshape(-1, njacks)
+    hi = hi.reshape(-1, njacks)
+
+    # min and max over all jackknifes but k, from the running min and max
+    # before and after it
+    pad = np.full((lo.shape[0], 1), np.inf)
+    lo_before = np.minimum.accumulate(np.hstack((pad, lo[:, :-1])), axis=1)
+    lo_after = np.minimum.accumulate(
+        np.hstack((pad, lo[:, :0:-1])), axis=1)[:, ::-1]
+    hi_before = np.maximum.accumulate(np.hstack((-pad, hi[:, :-1])), axis=1)
+    hi_after = np.maximum.accumulate(
+        np.hstack((-pad, hi[:, :0:-1])), axis=1)[:, ::-1]
+    return np.minimum(lo_before, lo_after) == np.maximum(hi_before, hi_after)
+
+
+def _jackknife_mean_se(jc):
+    mean = np.nanmean(jc, axis=1)
+    se = np.nanstd(jc, axis=1) * np.sqrt(jc.shape[1] - 1)
+    return mean, se
+
+
+def j_corrcoef_from_sums(predmat, respmat, sums):
+    '''
+    Jackknifed mean and SE of the correlation coefficient of each channel,
+    from jackknife_sums(predmat, respmat). See j_corrcoef.
+    '''
+    n, x, y = sums['n'], sums['x'], sums['y']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sums['xy'] - x * y / n
+        var = (sums['xx'] - x * x / n) * (sums['yy'] - y * y / n)
+        degenerate = sums['x_const'] | sums['y_const'] | ~(var > 0)
+        jc = np.where(degenerate, np.nan, cov / np.sqrt(var))
+    cc, ee = _jackknife_mean_se(jc)
+
+    # channels with no data, a constant prediction or a constant response
+    ff = sums['valid']
+    no_data = (ff.sum(axis=1) == 0) | \
+        (np.where(ff, predmat, np.inf).min(axis=1) ==
+         np.where(ff, predmat, -np.inf).max(axis=1)) | \
+        (np.where(ff, respmat, np.inf).min(axis=1) ==
+         np.where(ff, respmat, -np.inf).max(axis=1))
+    cc[no_data] = 0
+    ee[no_data] = 0
+
+    return cc, ee
+
+
+def j_nmse_from_sums(predmat, respmat, sums):
+    '''
+    Jackknifed mean and SE of the normalized MSE of each channel, from
+    jackknife_sums(predmat, respmat). See j_nmse.
+    '''
+    n, y = sums['n'], sums['y']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        E = np.sqrt(sums['dd'] / n)
+        respstd = np.sqrt(np.maximum(sums['yy'] / n - (y / n) ** 2, 0))
+        jc = np.where(sums['y_const'] | (respstd == 0), 1, E / respstd)
+    mse, se_mse = _jackknife_mean_se(jc)
+
+    # channels with no data, or where pred or resp sums to zero
+    ff = sums['valid']
+    no_data = (ff.sum(axis=1) == 0) | \
+        (np.where(ff, predmat, 0).sum(axis=1) == 0) | \
+        (np.where(ff, respmat, 0).sum(axis=1) == 0)
+    mse[no_data] = 1
+    se_mse[no_data] = 0
+
+    return mse, se_mse
+
+
+def j_corrcoef_nmse(result, pred_name='pred', resp_name='resp', njacks=20):
+    '''
+    Jackknifed estimates of mean and SE on the correlation coefficient and
+    normalized MSE, computed from one set of jackknife_sums.
+
+    Returns
+    -------
+    cc, ee, mse, se_mse : arrays, one value per channel
+        Same as j_corrcoef followed by j_nmse.
+
+    Example
+    -------
+    >>> result = model.evaluate(data, phi)
+    >>> cc, ee, mse, se_mse = j_corrcoef_nmse(result, 'pred', 'resp')
+    '''
+    predmat = result[pred_name].as_continuous()
+    respmat = result[resp_name].as_continuous()
+    sums = jackknife_sums(predmat, respmat, njacks)
+    cc, ee = j_corrcoef_from_sums(predmat, respmat, sums)
+    mse, se_mse = j_nmse_from_sums(predmat, respmat, sums)
+
+    return cc, ee, mse, se_mse
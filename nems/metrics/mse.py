@@ -1,5 +1,6 @@
 import numpy as np
 import nems.utils
+from nems.metrics.jackknife import jackknife_sums, j_nmse_from_sums
 import logging
 
 log = logging.getLogger(__name__)
@@ -66,6 +67,56 @@ def nmse(result, pred_name='pred', resp_name='resp'):
         return mse / respstd
 
 
+def mse_grad(result, pred_name='pred', resp_name='resp'):
+    '''
+    Same as mse, but also returns the gradient of the error with respect to
+    the prediction, for fitters that use analytic gradients (see
+    nems.modelspec.evaluate_gradient).
+
+    Returns
+    -------
+    mse : float
+    grad : dict
+        {pred_name: array with the shape of the prediction}. The gradient is
+        zero wherever pred or resp is NaN.
+    '''
+    pred = result[pred_name].as_continuous()
+    resp = result[resp_name].as_continuous()
+    diff = pred - resp
+    keepidx = np.isfinite(diff)
+    n = np.sum(keepidx)
+    if n == 0:
+        return np.nan, {pred_name: np.zeros_like(pred)}
+
+    diff = np.where(keepidx, diff, 0)
+    return np.sum(diff**2) / n, {pred_name: 2 * diff / n}
+
+
+def nmse_grad(result, pred_name='pred', resp_name='resp'):
+    '''
+    Same as nmse, but also returns the gradient of the error with respect to
+    the prediction. See mse_grad.
+    '''
+    pred = result[pred_name].as_continuous()
+    resp = result[resp_name].as_continuous()
+    respstd = np.nanstd(resp)
+    diff = pred - resp
+    keepidx = np.isfinite(diff)
+    n = np.sum(keepidx)
+    if respstd == 0:
+        return 1, {pred_name: np.zeros_like(pred)}
+    elif n == 0:
+        return np.nan, {pred_name: np.zeros_like(pred)}
+
+    diff = np.where(keepidx, diff, 0)
+    rmse = np.sqrt(np.sum(diff**2) / n)
+    if rmse == 0:
+        grad = np.zeros_like(pred)
+    else:
+        grad = diff / (n * rmse * respstd)
+    return rmse / respstd, {pred_name: grad}
+
+
 def j_nmse(result, pred_name='pred', resp_name='resp', njacks=20):
     '''
     Jackknifed estimate of mean and SE on normalized MSE
@@ -102,46 +153,9 @@ def j_nmse(result, pred_name='pred', resp_name='resp', njacks=20):
     predmat = result[pred_name].as_continuous()
     respmat = result[resp_name].as_continuous()
 
-    channel_count = predmat.shape[0]
-    mse = np.zeros(channel_count)
-    se_mse = np.zeros(channel_count)
-
-    for i in range(channel_count):
-        pred = predmat[i, :]
-        resp = respmat[i, :]
-        ff = np.isfinite(pred) & np.isfinite(resp)
-
-        if (np.sum(ff) == 0) or (np.sum(pred[ff]) == 0) or (np.sum(resp[ff]) == 0):
-            mse[i] = 1
-            se_mse[i] = 0
-        else:
-            pred = pred[ff]
-            resp = resp[ff]
-            chunksize = int(np.ceil(len(pred) / njacks / 10))
-            chunkcount = int(np.ceil(len(pred) / chunksize / njacks))
-            idx = np.zeros((chunkcount, njacks, chunksize))
-            for jj in range(njacks):
-                idx[:, jj, :] = jj
-            idx = np.reshape(idx, [-1])[:len(pred)]
-            jc = np.zeros(njacks)
-            for jj in range(njacks):
-                ff = (idx != jj)
-
-                X1 = pred[ff]
-                X2 = resp[ff]
-
-                respstd = np.nanstd(X2)
-                squared_errors = (X1-X2)**2
-                E = np.sqrt(np.nanmean(squared_errors))
-                if respstd == 0:
-                    jc[jj] = 1
-                else:
-                    jc[jj] = E / respstd
-
-            mse[i] = np.nanmean(jc)
-            se_mse[i] = np.nanstd(jc) * np.sqrt(njacks-1)
-
-    return mse, se_mse
+    # all channels and jackknifes at once, from per-chunk sums
+    sums = jackknife_sums(predmat, respmat, njacks)
+    return j_nmse_from_sums(predmat, respmat, sums)
 
 
 def nmse_shrink(result, pred_name='pred', resp_name='resp', shrink=0.1):
@@ -1,12 +1,15 @@
 """Defines modelspec object and helper functions."""
 
 import copy
+import hashlib
 import importlib
 import json
 import logging
 import os
 import re
+import time
 import typing
+from collections import OrderedDict
 from functools import partial
 import inspect
 
@@ -94,6 +97,8 @@ class ModelSpec:
         self.fast_eval = False
         self.fast_eval_start = 0
         self.freeze_rec = None
+        self.eval_cache = None
+        self.eval_profile = None
 
         # cache the tf model if it exists
         self.tf_model = None
@@ -933,6 +938,46 @@ class ModelSpec:
         self.freeze_rec = None
         self.fast_eval_start = 0
 
+    def eval_cache_on(self, max_bytes=None):
+        """Cache the output of each module during evaluation.
+
+        While on, `evaluate` skips every module whose inputs and parameters
+        are unchanged since an earlier call and resumes from the deepest
+        cached module. See `EvalCache`.
+
+        :param max_bytes: Memory budget for cached signal data. Defaults to
+            the EVAL_CACHE_MAX_MB setting.
+        """
+        if max_bytes is None:
+            max_bytes = nems.get_setting('EVAL_CACHE_MAX_MB') * 1024**2
+        self.eval_cache = EvalCache(max_bytes)
+
+    def eval_cache_off(self):
+        """Turn off the evaluation cache and free up its memory."""
+        if self.eval_cache is not None:
+            log.debug('Evaluation cache: %s', self.eval_cache)
+        self.eval_cache = None
+
+    def profile_on(self):
+        """Record where the time goes in `evaluate` and the cost functions.
+
+        While on, every module evaluation, recording copy and cost function
+        stage is timed and counted. See `EvalProfile`.
+
+        :return: The new `EvalProfile`.
+        """
+        self.eval_profile = EvalProfile()
+        return self.eval_profile
+
+    def profile_off(self):
+        """Stop profiling.
+
+        :return: The `EvalProfile` recorded since `profile_on`, or None.
+        """
+        profile = self.eval_profile
+        self.eval_profile = None
+        return profile
+
     def generate_tensor(self, data, phi):
         """Evaluate the module given the input data and phi.
 
@@ -1362,6 +1407,231 @@ def load_modelspecs(directory, basename, regex=None):
 lookup_table = {}  # TODO: Replace with real memoization/joblib later
 
 
+def _fingerprint(h, value):
+    """Feed a stable representation of `value` into hash object `h`."""
+    if isinstance(value, np.ndarray):
+        h.update(str((value.dtype, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value.keys(), key=str):
+            h.update(str(k).encode())
+            _fingerprint(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for v in value:
+            _fingerprint(h, v)
+        h.update(b']')
+    else:
+        h.update(repr(value).encode())
+
+
+class EvalCache:
+    """LRU cache of module outputs used by `evaluate`.
+
+    Each entry holds the recording's signals as they are after a module has
+    run. Entries are keyed by a hash chain: the key for module `i` combines
+    the key for module `i-1` with the module's `fn`, `fn_kwargs` and `phi`,
+    and the chain starts from the identity of the signals in the input
+    recording. A module's key is therefore unchanged only if neither it nor
+    any module before it has changed, and evaluation can resume after the
+    deepest module whose key is in the cache.
+
+    Only signals produced by the cached module count towards `max_bytes`,
+    since all other signals are shared with earlier entries or the input.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return ('EvalCache(entries={}, nbytes={}, max_bytes={}, hits={}, '
+                'misses={})'.format(len(self), self.nbytes, self.max_bytes,
+                                    self.hits, self.misses))
+
+    def __deepcopy__(self, memo):
+        # cached signals belong to the recording being fit, not the model,
+        # so a copied modelspec starts out with an empty cache
+        return EvalCache(self.max_bytes)
+
+    @staticmethod
+    def root_key(signals):
+        """Key for an input recording, from the identity of its signals."""
+        h = hashlib.blake2b(digest_size=20)
+        for name in sorted(signals.keys()):
+            h.update('{}:{};'.format(name, id(signals[name])).encode())
+        return h.digest()
+
+    @staticmethod
+    def module_key(prev_key, module):
+        """Key for the output of `module`, given the key of its input."""
+        h = hashlib.blake2b(prev_key, digest_size=20)
+        h.update(module['fn'].encode())
+        _fingerprint(h, module.get('fn_kwargs', {}))
+        _fingerprint(h, module.get('phi', {}))
+        return h.digest()
+
+    def get(self, key):
+        """Return the cached signals dict for `key`, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, signals, new_signals, root_signals):
+        """Cache `signals` (a dict) under `key`.
+
+        `new_signals` are the signals produced by the module, used to size
+        the entry. `root_signals` are kept alive with the entry so that the
+        ids used in `root_key` can't be reused by other objects.
+        """
+        nbytes = _signals_nbytes(new_signals)
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        self._entries[key] = (dict(signals), nbytes, tuple(root_signals))
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, old_bytes, _) = self._entries.popitem(last=False)
+            self.nbytes -= old_bytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class EvalProfile:
+    """Call counts, wall time and allocated bytes of each step of a fit.
+
+    Steps are nested, and each is recorded under its path of step names
+    joined by ';', e.g. 'cost;evaluate;2:nems.modules.fir.basic' for the
+    module at index 2 evaluated inside a cost function call. The bytes of
+    a module are those of the signal data it returned.
+
+    Turned on with `ModelSpec.profile_on`. `evaluate` and the cost
+    functions in `nems.analysis.cost_functions` only check whether the
+    modelspec has a profile, so it costs next to nothing while off.
+    """
+
+    def __init__(self, stats=None, evals=0, wall_time=0.0):
+        # path -> [calls, seconds, bytes]
+        self.stats = OrderedDict() if stats is None else stats
+        self.evals = evals
+        self.wall_time = wall_time
+        self._stack = []
+        self._first_eval = None
+
+    def __repr__(self):
+        return ('EvalProfile(evals={}, eval_rate={:.1f}/s, steps={})'
+                .format(self.evals, self.eval_rate, len(self.stats)))
+
+    @property
+    def eval_rate(self):
+        """Cost function evaluations per second of wall time."""
+        return self.evals / self.wall_time if self.wall_time else 0.0
+
+    def start(self, name):
+        """Start timing step `name`, nested in the current step."""
+        self._stack.append((name, time.perf_counter()))
+
+    def stop(self, nbytes=0):
+        """Stop timing the current step, which allocated `nbytes`."""
+        name, t0 = self._stack.pop()
+        elapsed = time.perf_counter() - t0
+        path = ';'.join([n for n, _ in self._stack] + [name])
+        s = self.stats.get(path)
+        if s is None:
+            s = self.stats[path] = [0, 0.0, 0]
+        s[0] += 1
+        s[1] += elapsed
+        s[2] += nbytes
+
+    def start_eval(self):
+        """Start timing one cost function evaluation."""
+        # steps left open by an exception in an earlier evaluation
+        self._stack.clear()
+        now = time.perf_counter()
+        if self._first_eval is None:
+            self._first_eval = now - self.wall_time
+        self.start('cost')
+
+    def stop_eval(self):
+        """Stop timing the current cost function evaluation."""
+        self.stop()
+        self.evals += 1
+        self.wall_time = time.perf_counter() - self._first_eval
+
+    def to_dict(self):
+        """Profile as a JSON-compatible dict, e.g. for modelspec meta."""
+        return {
+            'evals': self.evals,
+            'eval_rate': self.eval_rate,
+            'wall_time': self.wall_time,
+            'stats': {path: {'calls': s[0], 'time': s[1], 'bytes': s[2]}
+                      for path, s in self.stats.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Rebuild a profile from `to_dict`, e.g. meta['profile']."""
+        stats = OrderedDict((path, [s['calls'], s['time'], s['bytes']])
+                            for path, s in d['stats'].items())
+        return cls(stats, evals=d['evals'], wall_time=d['wall_time'])
+
+    def to_json(self, filename=None):
+        """Profile as a JSON string, also written to `filename` if given."""
+        s = json.dumps(self.to_dict(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(s)
+        return s
+
+    def to_folded(self, filename=None):
+        """Profile in the folded stack format of flamegraph.pl/speedscope.
+
+        One line per step, its path followed by its self time (excluding
+        nested steps) in microseconds. Also written to `filename` if given.
+        """
+        self_time = {path: s[1] for path, s in self.stats.items()}
+        for path, s in self.stats.items():
+            parent = path.rpartition(';')[0]
+            if parent in self_time:
+                self_time[parent] -= s[1]
+        lines = ['{} {}'.format(path, max(int(round(t * 1e6)), 0))
+                 for path, t in self_time.items()]
+        s = '\n'.join(lines) + '\n'
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(s)
+        return s
+
+    def summary(self):
+        """Table of the steps, slowest first."""
+        lines = ['{:>10} {:>10} {:>10} {:>12}  {}'.format(
+            'calls', 'time (s)', 'ms/call', 'bytes', 'step')]
+        for path, s in sorted(self.stats.items(), key=lambda x: -x[1][1]):
+            lines.append('{:>10d} {:>10.3f} {:>10.4f} {:>12d}  {}'.format(
+                s[0], s[1], s[1] * 1e3 / s[0], s[2], path))
+        lines.append('{} evaluations, {:.1f}/s'.format(self.evals,
+                                                      self.eval_rate))
+        return '\n'.join(lines)
+
+
+def _signals_nbytes(signals):
+    return sum(getattr(getattr(s, '_data', None), 'nbytes', 0)
+               for s in signals)
+
+
 def _lookup_fn_at(fn_path, ignore_table=False):
     """Private function that returns a function handle found at a given module.
 
@@ -1416,6 +1686,8 @@ def fit_mode_on(modelspec, rec=None, subset=None):
     if rec is None:
         raise ValueError('rec must be specified')
     modelspec.fast_eval_on(rec, subset)
+    if nems.get_setting('EVAL_CACHE_MAX_MB') > 0:
+        modelspec.eval_cache_on()
 
 
 def fit_mode_off(modelspec):
@@ -1432,6 +1704,7 @@ def fit_mode_off(modelspec):
             m['norm']['recalc'] = 0
     """
     modelspec.fast_eval_off()
+    modelspec.eval_cache_off()
 
 
 def eval_ms_layer(data: np.ndarray,
@@ -1499,6 +1772,11 @@ def evaluate(rec, modelspec, start=None, stop=None):
     :param stop: Stop at this module.
     :return: `Recording` copy of input with `pred` updated with prediction.
     """
+    profile = modelspec.eval_profile
+    if profile is not None:
+        profile.start('evaluate')
+        profile.start('copy')
+
     if modelspec.fast_eval:
         # still kind of testing this out, though it seems to work
         start = modelspec.fast_eval_start
@@ -1510,7 +1788,39 @@ def evaluate(rec, modelspec, start=None, stop=None):
         # if evaluation tries to modify a signal in place
         d = rec.copy()
 
-    for m in modelspec[start:stop]:
+    if profile is not None:
+        profile.stop()
+    modules = modelspec[start:stop]
+    first = start or 0
+    cache = modelspec.eval_cache
+    if cache is not None:
+        if profile is not None:
+            profile.start('cache_lookup')
+        # find the deepest module whose output is already cached, and
+        # pick up evaluation from there
+        root_signals = list(d.signals.values())
+        keys = [cache.root_key(d.signals)]
+        for m in modules:
+            keys.append(cache.module_key(keys[-1], m))
+        done = 0
+        for i in range(len(modules), 0, -1):
+            cached = cache.get(keys[i])
+            if cached is not None:
+                d.signals.clear()
+                d.signals.update(cached)
+                done = i
+                break
+        if done:
+            cache.hits += 1
+        else:
+            cache.misses += 1
+        modules = modules[done:]
+        keys = keys[done+1:]
+        first += done
+        if profile is not None:
+            profile.stop()
+
+    for mod_idx, m in enumerate(modules):
         if type(m) is dict:
             fn = _lookup_fn_at(m['fn'])
         else:
@@ -1518,7 +1828,12 @@ def evaluate(rec, modelspec, start=None, stop=None):
         fn_kwargs = m.get('fn_kwargs', {})
         phi = m.get('phi', {})
         kwargs = {**fn_kwargs, **phi}  # Merges both dicts
+        if profile is not None:
+            profile.start('{}:{}'.format(first + mod_idx,
+                                         m.get('fn', type(m).__name__)))
         new_signals = fn(rec=d, **kwargs)
+        if profile is not None:
+            profile.stop(_signals_nbytes(new_signals))
 
         # if type(new_signals) is not list:
         #     raise ValueError('Fn did not return list of signals: {}'.format(m))
@@ -1550,9 +1865,114 @@ def evaluate(rec, modelspec, start=None, stop=None):
             d.add_signal(s)
         d.signal_views[d.view_idx] = d.signals
 
+        if cache is not None:
+            cache.put(keys[mod_idx], d.signals, new_signals, root_signals)
+
+    if profile is not None:
+        profile.stop()
     return d
 
 
+def _lookup_backward(m):
+    """Return the backward function for module `m`, or None if it has none.
+
+    For a module with fn 'nems.modules.fir.basic' this is
+    'nems.modules.fir.basic_backward'.
+    """
+    if type(m) is not dict:
+        return getattr(m, 'backward', None)
+    fn_path = m['fn'] + '_backward'
+    if fn_path not in lookup_table:
+        api, fn_name = nems.utils.split_to_api_and_fn(fn_path)
+        try:
+            lookup_table[fn_path] = getattr(importlib.import_module(api),
+                                            fn_name, None)
+        except ImportError:
+            lookup_table[fn_path] = None
+    return lookup_table[fn_path]
+
+
+def evaluate_gradient(rec, modelspec, metric_grad):
+    """Evaluate a modelspec and backpropagate the gradient of an error metric.
+
+    Each module along the path from the fitted parameters to the prediction
+    must have a backward function, found next to the module function with a
+    `_backward` suffix (e.g. `nems.modules.fir.basic_backward`). It is
+    called as `backward(rec, grad, **fn_kwargs, **phi)`, where `rec` is the
+    module's input recording and `grad` the gradient with respect to its
+    output signal, and returns `(input_grads, phi_grads)`: dicts of gradients
+    keyed by input signal and by parameter name.
+
+    Like `evaluate`, starts from `freeze_rec` if `fast_eval` is on.
+
+    :param rec: Recording object.
+    :param modelspec: Modelspec object.
+    :param metric_grad: Function of the evaluated recording that returns
+        `(error, grads)`, where grads maps signal names to the gradient of
+        error with respect to that signal, e.g. `nems.metrics.mse.nmse_grad`.
+    :return: `(error, phi_grad)` where phi_grad is a list of dicts with the
+        same keys and shapes as `modelspec.phi()`.
+    :raises NotImplementedError: If a module that affects the error has no
+        backward function.
+    """
+    if modelspec.fast_eval:
+        start = modelspec.fast_eval_start
+        d = modelspec.freeze_rec.copy()
+    else:
+        start = 0
+        d = rec.copy()
+
+    modules = modelspec.modules
+    inputs = []
+    for m in modules[start:]:
+        inputs.append(d.copy())
+        if type(m) is dict:
+            fn = _lookup_fn_at(m['fn'])
+        else:
+            fn = m.eval
+        kwargs = {**m.get('fn_kwargs', {}), **m.get('phi', {})}
+        for s in fn(rec=d, **kwargs):
+            d.add_signal(s)
+        d.signal_views[d.view_idx] = d.signals
+
+    error, grads = metric_grad(d)
+
+    phi_grad = []
+    for m in modules:
+        phi = m.get('phi') or {}
+        phi_grad.append({k: np.zeros_like(v, dtype=np.float64)
+                         for k, v in phi.items()})
+    fitted = [j for j in range(start, len(modules)) if phi_grad[j]]
+    if not fitted:
+        return error, phi_grad
+
+    for j in range(len(modules)-1, fitted[0]-1, -1):
+        m = modules[j]
+        kwargs = {**m.get('fn_kwargs', {}), **m.get('phi', {})}
+        o = kwargs.get('o')
+        if o not in grads:
+            # output doesn't reach the error
+            continue
+        backward = _lookup_backward(m)
+        if backward is None:
+            raise NotImplementedError('No backward function for module %s'
+                                      % m.get('fn'))
+        input_grads, dphi = backward(rec=inputs[j-start], grad=grads.pop(o),
+                                     **kwargs)
+        for name, g in input_grads.items():
+            if name in grads:
+                grads[name] = grads[name] + g
+            else:
+                grads[name] = g
+        for k, v in phi_grad[j].items():
+            if k not in dphi:
+                raise NotImplementedError('No gradient for %s in module %s'
+                                          % (k, m.get('fn')))
+            phi_grad[j][k] = np.reshape(dphi[k], np.shape(v))
+
+    return error, phi_grad
+
+
 def evaluate_tf(rec, modelspec, epoch_name='REFERENCE', **kwargs):
     input_name = modelspec[0]['fn_kwargs']['i']
     output_name = modelspec[-1]['fn_kwargs']['o']
@@ -3,10 +3,35 @@ import glob
 import importlib
 import logging
 
+import numpy as np
+
 from nems.registry import xform, xmodule
 
 log = logging.getLogger(__name__)
 
+
+def sum_to_shape(grad, value):
+    """
+    Sum a gradient that was broadcast against a parameter back down to the
+    shape of that parameter, e.g. the gradient for a (n_chans, 1) level
+    that is added to every time bin. Used by module backward functions.
+
+    :param grad: gradient with the shape of the broadcast result
+    :param value: parameter (array or scalar) whose shape is wanted
+    :return: grad summed to np.shape(value)
+    """
+    shape = np.shape(value)
+    grad = np.asarray(grad)
+    n_extra = grad.ndim - len(shape)
+    if n_extra > 0:
+        grad = grad.sum(axis=tuple(range(n_extra)))
+    axes = tuple(k for k, n in enumerate(shape)
+                 if n == 1 and grad.shape[k] != 1)
+    if axes:
+        grad = grad.sum(axis=axes, keepdims=True)
+    return grad.reshape(shape)
+
+
 class NemsModule(object):
     """
     NemsModule parent object
@@ -1,6 +1,7 @@
 from itertools import chain, repeat
 
 import numpy as np
+import scipy.fft
 import scipy.signal
 from scipy import interpolate
 from scipy.ndimage.filters import convolve1d
@@ -119,6 +120,196 @@ def per_channel(x, coefficients, bank_count=1, non_causal=0, rate=1,
             out[i_out] += r
     return out
 
+
+# Kernels with at most this many taps are convolved directly (as matrix
+# multiplies). Longer kernels go through block FFT (overlap-add).
+_DIRECT_MAX_TAPS = 16
+# Number of elements in each chunk of lagged input used by the direct method.
+_DIRECT_CHUNK_SIZE = 2**20
+# Target FFT length for overlap-add blocks on long signals.
+_OA_FFT_LEN = 4096
+
+
+def _channel_layout(n_in, n_filters, bank_count, cross_channels):
+    '''
+    Work out how input channels map onto filters, using the same rules
+    as per_channel(). Returns 'cross', 'per_filter' or 'shared'.
+    '''
+    if cross_channels:
+        return 'cross'
+    elif n_filters == n_in:
+        return 'per_filter'
+    elif n_filters == n_in * bank_count:
+        return 'shared'
+
+    if bank_count > 0:
+        n_banks = int(n_filters / bank_count)
+    else:
+        n_banks = n_filters
+    if bank_count == 1:
+        desc = '%i FIR filters' % n_filters
+    else:
+        desc = '%i FIR filter banks' % n_banks
+    raise ValueError(
+        'Dimension mismatch. %s channels provided for %s.' % (n_in, desc))
+
+
+def _direct_filter(x, c, layout):
+    '''
+    Causal convolution, summed over the filters in each bank. For a shared
+    input this is a matrix multiply against lagged copies of the input,
+    otherwise it is done one tap at a time with each step a single
+    vectorized multiply-add over all banks and channels.
+
+    x : (n_in, T) for 'shared' and 'cross', (bank_count, n_banks, T)
+        for 'per_filter'
+    c : (bank_count, n_banks, n_taps) or, for 'cross', (n_filters, n_taps)
+    '''
+    T = x.shape[-1]
+    n_taps = c.shape[-1]
+    if layout == 'cross':
+        out = np.zeros((x.shape[0], c.shape[0], T))
+    else:
+        out = np.zeros((c.shape[0], T))
+
+    if layout == 'shared':
+        # Lay out the lagged copies of x as (n_in * n_taps, time) so that
+        # each chunk of output is a single matrix multiply. Chunking keeps
+        # the lagged copy to a few MB.
+        n_in = x.shape[0]
+        xp = np.concatenate((np.zeros((n_in, n_taps-1)), x), axis=1)
+        lagged = np.lib.stride_tricks.sliding_window_view(xp, n_taps, axis=1)
+        c_flat = c[:, :, ::-1].reshape(c.shape[0], -1)
+        chunk = max(1, _DIRECT_CHUNK_SIZE // (n_in*n_taps))
+        for t0 in range(0, T, chunk):
+            t1 = min(T, t0+chunk)
+            x_chunk = lagged[:, t0:t1, :].transpose(0, 2, 1)
+            out[:, t0:t1] = c_flat @ x_chunk.reshape(n_in*n_taps, t1-t0)
+        return out
+
+    for k in range(min(n_taps, T)):
+        xk = x[..., :T-k]
+        if layout == 'per_filter':
+            out[:, k:] += np.einsum('ob,obt->ot', c[:, :, k], xk)
+        else:
+            out[:, :, k:] += (xk[:, np.newaxis, :] *
+                              c[np.newaxis, :, k, np.newaxis])
+
+    return out
+
+
+def _fft_filter(x, c, layout):
+    '''
+    Same as _direct_filter, but convolves with FFTs. Long signals are cut
+    into blocks and recombined by overlap-add, and the sum across filters
+    in a bank is taken in the frequency domain so that only one inverse
+    transform is needed per output channel.
+    '''
+    T = x.shape[-1]
+    n_taps = c.shape[-1]
+    full_len = T + n_taps - 1
+    if full_len <= max(_OA_FFT_LEN, 8*n_taps):
+        # short enough to do in one block
+        nfft = scipy.fft.next_fast_len(full_len, True)
+        block_len = T
+    else:
+        nfft = scipy.fft.next_fast_len(max(_OA_FFT_LEN, 8*n_taps), True)
+        block_len = nfft - n_taps + 1
+    n_blocks = int(np.ceil(T / block_len))
+
+    pad = [(0, 0)] * (x.ndim - 1) + [(0, n_blocks*block_len - T)]
+    xb = np.pad(x, pad).reshape(x.shape[:-1] + (n_blocks, block_len))
+    xf = scipy.fft.rfft(xb, nfft, axis=-1)
+    cf = scipy.fft.rfft(c, nfft, axis=-1)
+
+    if layout == 'shared':
+        # (freq, bank, in) @ (freq, in, block) -> (bank, block, freq)
+        yf = np.matmul(cf.transpose(2, 0, 1), xf.transpose(2, 0, 1))
+        yf = yf.transpose(1, 2, 0)
+    elif layout == 'per_filter':
+        yf = np.einsum('obf,obnf->onf', cf, xf)
+    else:
+        yf = xf[:, np.newaxis, :, :] * cf[np.newaxis, :, np.newaxis, :]
+
+    yb = scipy.fft.irfft(yf, nfft, axis=-1)
+    out = yb[..., :block_len].copy()
+    if n_blocks > 1:
+        # overlap-add the tail of each block onto the start of the next
+        out[..., 1:, :n_taps-1] += yb[..., :-1, block_len:block_len+n_taps-1]
+    out = out.reshape(out.shape[:-2] + (n_blocks*block_len,))
+
+    return out[..., :T]
+
+
+def batch_filter(x, coefficients, bank_count=1, non_causal=0, rate=1,
+                 cross_channels=False, method='auto'):
+    '''
+    Vectorized equivalent of per_channel(). All channels and banks are
+    filtered in one pass instead of one lfilter call per filter.
+
+    Parameters
+    ----------
+    x, coefficients, bank_count, non_causal, rate, cross_channels :
+        See per_channel().
+    method : {'auto', 'direct', 'fft'}
+        Convolution strategy. 'direct' does one matrix multiply per tap and
+        is fastest for short kernels. 'fft' uses overlap-add FFT convolution
+        and is fastest for long kernels. 'auto' picks between them based on
+        kernel length, and always uses 'direct' if ``x`` contains NaN or inf
+        values, since the FFT would spread them across the whole block.
+
+    Returns
+    -------
+    signal : array (bank_count, n_times)
+        Filtered signal, or (n_channels * n_filters, n_times) if
+        ``cross_channels`` is True.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    if rate > 1:
+        coefficients = _insert_zeros(coefficients, rate)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+
+    n_in, T = x.shape
+    n_filters, n_taps = coefficients.shape
+    layout = _channel_layout(n_in, n_filters, bank_count, cross_channels)
+
+    if layout == 'cross':
+        c = coefficients
+    else:
+        if bank_count > 0:
+            n_banks = int(n_filters / bank_count)
+        else:
+            n_banks = n_filters
+        c = coefficients.reshape(bank_count, n_banks, n_taps)
+        if non_causal:
+            # reverse model (using future values of input to predict)
+            x = np.roll(x, -non_causal, axis=1)
+        if layout == 'per_filter' and bank_count == 1:
+            # a single bank is the same as one shared set of inputs
+            layout = 'shared'
+        elif layout == 'per_filter':
+            x = x.reshape(bank_count, n_banks, T)
+
+    if method == 'auto':
+        if n_taps <= _DIRECT_MAX_TAPS or not np.all(np.isfinite(x)):
+            method = 'direct'
+        else:
+            method = 'fft'
+
+    if method == 'direct':
+        out = _direct_filter(x, c, layout)
+    elif method == 'fft':
+        out = _fft_filter(x, c, layout)
+    else:
+        raise ValueError("method must be 'auto', 'direct' or 'fft', got: %s"
+                         % method)
+
+    if layout == 'cross':
+        out = out.reshape(n_in*n_filters, T)
+
+    return out
+
+
 def fir_conv2(x, coefficients, bank_count=1, non_causal=0, rate=1):
     '''
     Parameters
@@ -230,12 +421,47 @@ def basic(rec, i='pred', o='pred', non_causal=0, coefficients=[], rate=1,
     if not np.all(offsets == 0):
         fs = rec[i].fs
         coefficients = _offset_coefficients(coefficients, offsets, fs)
-    fn = lambda x: per_channel(x, coefficients, non_causal=non_causal,
-                               rate=1)
+    fn = lambda x: batch_filter(x, coefficients, non_causal=non_causal,
+                                rate=1)
 
     return [rec[i].transform(fn, o)]
 
 
+def basic_backward(rec, grad, i='pred', o='pred', non_causal=0,
+                   coefficients=[], rate=1, offsets=0, **kwargs):
+    """
+    Backward pass of `basic`. `grad` is the gradient of the error with
+    respect to the (1 x time) output. Returns the gradients with respect to
+    the input signal and to `coefficients`.
+
+    Only implemented for offsets == 0.
+    """
+    if not np.all(offsets == 0):
+        raise NotImplementedError('fir.basic gradient with offsets')
+
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    x = np.nan_to_num(rec[i].as_continuous())
+    if non_causal:
+        x = np.roll(x, -non_causal, axis=1)
+    n_taps = coefficients.shape[1]
+    T = x.shape[1]
+
+    # y[t] = sum_c sum_k h[c, k] * x[c, t-k], so the coefficient gradient is
+    # the cross-correlation of x with grad and the input gradient is the
+    # cross-correlation of grad with h
+    g = grad.sum(axis=0)
+    dc = np.zeros_like(coefficients)
+    dx = np.zeros_like(x)
+    for k in range(min(n_taps, T)):
+        dc[:, k] = x[:, :T-k] @ g[k:]
+        dx[:, :T-k] += coefficients[:, k, np.newaxis] * g[k:]
+
+    if non_causal:
+        dx = np.roll(dx, non_causal, axis=1)
+
+    return {i: dx}, {'coefficients': dc}
+
+
 def _offset_coefficients(coefficients, offsets, fs, pad_bins=False):
     '''
     Compute new coefficients with the same shape that are offset by some time.
@@ -433,8 +659,8 @@ def damped_oscillator(rec, i='pred', o='pred', f1s=1, taus=0.5, delays=1,
     coefficients = do_coefficients(f1s=f1s, taus=taus, delays=delays,
                                    gains=gains, n_coefs=n_coefs)
 
-    fn = lambda x: per_channel(x, coefficients, bank_count=bank_count,
-                               cross_channels=cross_channels, rate=1)
+    fn = lambda x: batch_filter(x, coefficients, bank_count=bank_count,
+                                cross_channels=cross_channels, rate=1)
     return [rec[i].transform(fn, o)]
 
 
@@ -509,9 +735,9 @@ def filter_bank(rec, i='pred', o='pred', non_causal=0, coefficients=[],
     TODO: test, optimize. maybe structure coefficients more logically?
     TODO: filterbanks all handled properly?
     """
-    fn = lambda x: per_channel(x, coefficients, bank_count,
-                               non_causal=non_causal, rate=rate,
-                               cross_channels=cross_channels)
+    fn = lambda x: batch_filter(x, coefficients, bank_count,
+                                non_causal=non_causal, rate=rate,
+                                cross_channels=cross_channels)
     return [rec[i].transform(fn, o)]
 
 
@@ -1,7 +1,7 @@
 import numpy as np
 import re
 
-from nems.modules import NemsModule
+from nems.modules import NemsModule, sum_to_shape
 from nems.registry import xmodule
 
 
@@ -14,6 +14,14 @@ def levelshift(rec, i, o, level, **kwargs):
     fn = lambda x: x + level
     return [rec[i].transform(fn, o)]
 
+
+def levelshift_backward(rec, grad, i, o, level, **kwargs):
+    '''
+    Backward pass of `levelshift`. Returns the gradients with respect to the
+    input signal and `level`.
+    '''
+    return {i: grad}, {'level': sum_to_shape(grad, level)}
+
 class levelshift_new(NemsModule):
     """
     Add a constant to a NEMS signal
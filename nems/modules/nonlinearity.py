@@ -3,6 +3,8 @@ import copy
 import numpy as np
 from numpy import exp
 
+from nems.modules import sum_to_shape
+
 
 def _logistic_sigmoid(x, base, amplitude, shift, kappa):
     ''' This "logistic" function only has a single negative exponent '''
@@ -61,6 +63,29 @@ def double_exponential(rec, i, o, base, amplitude, shift, kappa, **kwargs):
     return [rec[i].transform(fn, o)]
 
 
+def double_exponential_backward(rec, grad, i, o, base, amplitude, shift,
+                                kappa, **kwargs):
+    '''
+    Backward pass of `double_exponential`. Returns the gradients with respect
+    to the input signal and to base, amplitude, shift and kappa.
+    '''
+    x = np.nan_to_num(rec[i].as_continuous())
+    k = exp(kappa)
+    with np.errstate(over='ignore', invalid='ignore'):
+        u = exp(-k * (x - shift))
+        e = exp(-u)
+        # u*e -> 0 where u overflows
+        ue = np.where(np.isinf(u), 0, u * e)
+    dydx = amplitude * k * ue
+
+    dx = grad * dydx
+    dphi = {'base': sum_to_shape(grad, base),
+            'amplitude': sum_to_shape(grad * e, amplitude),
+            'shift': sum_to_shape(-dx, shift),
+            'kappa': sum_to_shape(dx * (x - shift), kappa)}
+    return {i: dx}, dphi
+
+
 def _dlog(x, offset):
     """
     Log compression helper function
@@ -99,6 +124,30 @@ def dlog(rec, i, o, offset, **kwargs):
     return [rec[i].transform(fn, o)]
 
 
+def dlog_backward(rec, grad, i, o, offset, **kwargs):
+    '''
+    Backward pass of `dlog`. Returns the gradients with respect to the input
+    signal and `offset`.
+    '''
+    inflect = 2
+    if isinstance(offset, int):
+        offset = np.array([[offset]])
+
+    # mirror the offset compression in _dlog
+    adjoffset = offset.copy()
+    adjoffset[offset > inflect] = inflect + (offset[offset > inflect]-inflect) / 50
+    adjoffset[offset < -inflect] = -inflect + (offset[offset < -inflect]+inflect) / 50
+    dadj = np.where(np.abs(offset) > inflect, 1/50, 1)
+    d = 10.0**adjoffset
+
+    x = np.nan_to_num(rec[i].as_continuous())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = grad / (x + d)
+        dx[~np.isfinite(dx)] = 0
+    dd = sum_to_shape(dx - grad / d, d)
+    return {i: dx}, {'offset': dd * d * np.log(10) * dadj}
+
+
 def _relu(x, offset):
     """
     Linear rectifier helper function
@@ -128,6 +177,16 @@ def relu(rec, i, o, offset):
     return [rec[i].transform(fn, o)]
 
 
+def relu_backward(rec, grad, i, o, offset):
+    '''
+    Backward pass of `relu`. Returns the gradients with respect to the input
+    signal and `offset`.
+    '''
+    x = rec[i].as_continuous()
+    dx = np.where(x > offset, grad, 0)
+    return {i: dx}, {'offset': sum_to_shape(-dx, offset)}
+
+
 def _relub(x, offset, baseline):
     """
     Linear rectifier helper function
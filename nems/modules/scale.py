@@ -1,3 +1,8 @@
+import numpy as np
+
+from nems.modules import sum_to_shape
+
+
 def scale(rec, i, o, a):
     '''
     Intended to be applied immediately preceding levelshift, so that the
@@ -11,6 +16,15 @@ def scale(rec, i, o, a):
     fn = lambda x: x * a
     return [rec[i].transform(fn, o)]
 
+
+def scale_backward(rec, grad, i, o, a):
+    '''
+    Backward pass of `scale`. Returns the gradients with respect to the
+    input signal and `a`.
+    '''
+    x = np.nan_to_num(rec[i].as_continuous())
+    return {i: grad * a}, {'a': sum_to_shape(grad * x, a)}
+
 def null(rec, i, o, **kwargs):
     """
     do nothing - can be subbed in for excluded module
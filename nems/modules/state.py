@@ -47,6 +47,43 @@ def state_dc_gain(rec, i='pred', o='pred', s='state', include_lv=False, c=None,
         new_signal.name = o
         return [new_signal]
 
+
+def state_dc_gain_backward(rec, grad, i='pred', o='pred', s='state',
+                           include_lv=False, c=None, g=None, d=0, **kwargs):
+    '''
+    Backward pass of `state_dc_gain`. Returns the gradients with respect to
+    the input and state signals and to `g` and `d`.
+    '''
+    x = np.nan_to_num(rec[i].as_continuous())
+    st = np.nan_to_num(rec[s].as_continuous())
+    if include_lv:
+        st = np.concatenate((st, np.nan_to_num(rec['lv'].as_continuous())),
+                            axis=0)
+
+    dx = grad.copy()
+    if c is None:
+        mod_chans = slice(None)
+    else:
+        mod_chans = np.setdiff1d(range(0, x.shape[0]), c)
+    gm = grad[mod_chans, :]
+    xm = x[mod_chans, :]
+    dx[mod_chans, :] = np.matmul(g, st) * gm
+
+    gx = gm * xm
+    dg = gx @ st.T
+    dd = gm @ st.T
+    dst = np.matmul(np.transpose(g), gx) + np.matmul(np.transpose(d), gm)
+
+    if include_lv:
+        n_state = rec[s].shape[0]
+        dinputs = {i: dx, s: dst[:n_state], 'lv': dst[n_state:]}
+    else:
+        dinputs = {i: dx, s: dst}
+    if s == i:
+        dinputs[i] = dx + dst
+
+    return dinputs, {'g': dg, 'd': dd}
+
 def state_gain(rec, i='pred', o='pred', s='state', include_lv=False,
                fix_across_channels=0, c=None, g=None, **kwargs):
     '''
@@ -4,6 +4,11 @@ from scipy.integrate import cumtrapz
 from scipy.signal import boxcar
 import logging
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 log = logging.getLogger(__name__)
 
 
@@ -46,13 +51,176 @@ def short_term_plasticity2(rec, i, o, u, u2, tau, tau2, urat=0.5, x0=None, cross
     return [rec[i].transform(fn, o)]
 
 
-def _cumtrapz(x, dx=1., initial=0., axis=1):
-    x = (x[:, :-1] + x[:, 1:]) / 2.0
-    x = np.pad(x, ((0, 0), (1, 0)), 'constant', constant_values=(initial,initial))
+def _cumtrapz(x, dx=1., initial=0., axis=-1):
+    x = (x[..., :-1] + x[..., 1:]) / 2.0
+    pad = [(0, 0)] * (x.ndim - 1) + [(1, 0)]
+    x = np.pad(x, pad, 'constant', constant_values=(initial, initial))
     #x = tf.pad(x, ((0, 0), (1, 0), (0, 0)), constant_values=initial)
     return np.cumsum(x, axis=axis) * dx
 
 
+# Channel count above which stepping all channels at once with NumPy beats
+# looping over channels with Python floats.
+_NUMPY_MIN_CHANS = 32
+
+
+def _stp_recursion_loop(ustim, a, lower, upper):
+    """
+    Depression/facilitation recurrence for every channel of ustim:
+        td[t] = td[t-1] + (a - td[t-1] * ustim[t-1]), clipped to [lower, upper]
+    with td[0] = 1. Plain loops, compiled with numba when it is installed.
+    """
+    n, T = ustim.shape
+    td = np.ones((n, T))
+    for i in range(n):
+        for tt in range(1, T):
+            d = td[i, tt - 1] + (a[i] - td[i, tt - 1] * ustim[i, tt - 1])
+            if d < lower[i]:
+                d = lower[i]
+            elif d > upper[i]:
+                d = upper[i]
+            td[i, tt] = d
+    return td
+
+
+def _stp_recursion_python(ustim, a, lower, upper):
+    """
+    Same as _stp_recursion_loop, but on Python floats, which is much faster
+    than indexing NumPy arrays one element at a time.
+    """
+    n, T = ustim.shape
+    td = np.ones((n, T))
+    for i in range(n):
+        us = ustim[i].tolist()
+        ai, lo, hi = float(a[i]), float(lower[i]), float(upper[i])
+        out = [1.0] * T
+        d = 1.0
+        for tt in range(1, T):
+            d = d + (ai - d * us[tt - 1])
+            if d < lo:
+                d = lo
+            elif d > hi:
+                d = hi
+            out[tt] = d
+        td[i] = out
+    return td
+
+
+def _stp_recursion_numpy(ustim, a, lower, upper):
+    """
+    Pure NumPy version of _stp_recursion_loop. Still steps through time, but
+    each step updates all channels at once. Only faster than
+    _stp_recursion_python when there are many channels.
+    """
+    n, T = ustim.shape
+    if n < _NUMPY_MIN_CHANS:
+        return _stp_recursion_python(ustim, a, lower, upper)
+
+    us = np.ascontiguousarray(ustim.T)
+    td = np.ones((T, n))
+    for tt in range(1, T):
+        prev = td[tt - 1]
+        cur = td[tt]
+        np.multiply(prev, us[tt - 1], out=cur)
+        np.subtract(a, cur, out=cur)
+        np.add(prev, cur, out=cur)
+        np.maximum(cur, lower, out=cur)
+        np.minimum(cur, upper, out=cur)
+    return td.T
+
+
+if njit is not None:
+    _stp_recursion = njit(cache=True)(_stp_recursion_loop)
+else:
+    _stp_recursion = _stp_recursion_numpy
+
+
+def _stp_dynamics(ustim, a, ui, max_fac=5):
+    """
+    Run the STP recurrence for all channels. Channels with ui > 0 depress
+    (td floored at 0), ui < 0 facilitate (td capped at max_fac) and ui == 0
+    pass through (td = 1).
+    """
+    ui = np.reshape(ui, -1)
+    n = len(ui)
+    ustim = np.ascontiguousarray(np.broadcast_to(ustim, (n, ustim.shape[-1])),
+                                 dtype=np.float64)
+    a = np.ascontiguousarray(np.broadcast_to(np.reshape(a, -1), n),
+                             dtype=np.float64)
+    dep = ui > 0
+    lower = np.where(dep, 0, -np.inf)
+    upper = np.where(dep, np.inf, max_fac)
+    td = _stp_recursion(ustim, a, lower, upper)
+    td[ui == 0, :] = 1
+    return td
+
+
+def _stp_quick(x, a, reset_times):
+    """
+    quick_eval version of the STP recurrence, integrated separately in each
+    chunk [reset_times[j], reset_times[j+1]). Chunks of similar length are
+    integrated together, laid out as (channel, chunk, time in chunk), so
+    that only the carry-over from one chunk to the next needs a loop over
+    chunks. Bins before reset_times[0] are left at td = 1.
+    """
+    n, T = x.shape
+    starts = reset_times[:-1]
+    lengths = np.diff(reset_times)
+    n_chunks = len(starts)
+    td = np.ones_like(x)
+    if n_chunks == 0:
+        return td
+
+    a = np.reshape(a, (-1, 1, 1))
+    x0 = np.zeros((n, n_chunks))
+    x0[:, 1:] = x[:, starts[1:] - 1]
+
+    # group chunks so that padding each group to its longest chunk at
+    # most doubles its size
+    order = np.argsort(lengths, kind='stable')
+    groups = []
+    g0 = 0
+    for g1 in range(1, n_chunks + 1):
+        if g1 == n_chunks or lengths[order[g1]] > 2 * lengths[order[g0]]:
+            groups.append(order[g0:g1])
+            g0 = g1
+
+    imu_end = np.zeros((n, n_chunks))
+    mu_end = np.zeros((n, n_chunks))
+    results = []
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for chunks in groups:
+            m = np.arange(lengths[chunks].max())
+            valid = m < lengths[chunks, np.newaxis]
+            idx = np.minimum(starts[chunks, np.newaxis] + m, T - 1)
+            last = lengths[chunks] - 1
+            xi = np.where(valid, x[:, idx], 0)
+            xc = x0[:, chunks, np.newaxis]
+
+            ix = _cumtrapz(a + xi, dx=1, initial=0) + a + (xc + xi[:, :, :1]) / 2
+            mu = np.exp(ix)
+            imu = _cumtrapz(mu * xi, dx=1, initial=0) + (xc + mu[:, :, :1] * xi[:, :, :1]) / 2
+
+            k = np.arange(len(chunks))
+            imu_end[:, chunks] = imu[:, k, last]
+            mu_end[:, chunks] = mu[:, k, last]
+            results.append((chunks, idx, valid, mu, imu))
+
+        # carry the normalized integral over from the end of each chunk
+        imu0 = np.zeros((n, n_chunks))
+        for j in range(1, n_chunks):
+            imu0[:, j] = (imu_end[:, j - 1] + imu0[:, j - 1]) / mu_end[:, j - 1]
+
+        for chunks, idx, valid, mu, imu in results:
+            imu += imu0[:, chunks, np.newaxis]
+            ff = (mu > 0) & (imu > 0) & valid
+            _td = np.ones_like(mu)
+            _td[ff] = 1 - np.exp(np.log(imu[ff]) - np.log(mu[ff]))
+            td[:, idx[valid]] = _td[:, valid]
+
+    return td
+
+
 def _stp(X, u, tau, x0=None, crosstalk=0, fs=1, reset_signal=None, quick_eval=False, dep_only=False,
          chunksize=5):
     """
@@ -115,154 +283,32 @@ def _stp(X, u, tau, x0=None, crosstalk=0, fs=1, reset_signal=None, quick_eval=Fa
     if len(ui.shape)==1:
         ui = np.expand_dims(ui, axis=1)
         taui = np.expand_dims(taui, axis=1)
-    for i in range(0, len(u)):
-        if quick_eval:
-
-            a = 1 / taui
-            x = ui * tstim
-
-            if reset_signal is None:
-                reset_times = np.arange(0, s[1] + chunksize - 1, chunksize)
-            else:
-                reset_times = np.argwhere(reset_signal[0, :])[:, 0]
-                reset_times = np.append(reset_times, s[1])
-
-            td = np.ones_like(x)
-            x0, imu0 = 0., 0.
-            for j in range(len(reset_times) - 1):
-                si = slice(reset_times[j], reset_times[j + 1])
-                xi = x[:, si]
-
-                ix = _cumtrapz(a + xi, dx=1, initial=0, axis=1) + a + (x0 + xi[:, :1]) / 2
-
-                mu = np.exp(ix)
-                imu = _cumtrapz(mu * xi, dx=1, initial=0, axis=1) + (x0 + mu[:, :1] * xi[:, :1]) / 2 + imu0
-
-                ff = np.bitwise_and(mu > 0, imu > 0)
-                _td = np.ones_like(mu)
-                _td[ff] = 1 - np.exp(np.log(imu[ff]) - np.log(mu[ff]))
-                td[:, si] = _td
-
-                x0 = xi[:, -1:]
-                imu0 = imu[:, -1:] / mu[:, -1:]
-
-            # shift td forward in time by one to allow STP to kick in after the stimulus changes (??)
-            #stim_out = tstim * td
-
-            # offset depression by one to allow transients
-            stim_out = tstim * np.pad(td[:, :-1], ((0,0), (1,0)), 'constant', constant_values=(1, 1))
-
-            """ 
-            a = 1 / taui[i]
-            x = ui[i] * tstim[i, :]  # / fs
-
-            #if reset_signal is None:
-            reset_times = np.arange(0, len(x) + chunksize - 1, chunksize)
-            #else:
-            #    reset_times = np.argwhere(reset_signal[0, :])[:, 0]
-            #    reset_times = np.append(reset_times, len(x))
-            td = np.ones_like(x)
-            td0, mu0, imu0, x0 = 1., 1., 0., 0.
-            for j in range(len(reset_times) - 1):
-                si = slice(reset_times[j], reset_times[j + 1])
-                #mu = np.zeros_like(x[si])
-                #imu = np.zeros_like(x[si])
-
-                # ix = _cumtrapz(a + x[si])
-                ix = cumtrapz(a + x[si], dx=1, initial=0)
-                ix += np.log(mu0) + a + (x0 + x[si][0]) / 2
-
-                mu = np.exp(ix)
-                # imu = _cumtrapz(mu*x[si]) + td0
-                imu = cumtrapz(mu * x[si], dx=1, initial=0)  # /mu0 + imu0/mu0
-                imu += imu0 + (mu0 * x0 + mu[0] * x[si][0]) / 2
-
-                ff = np.bitwise_and(mu > 0, imu > 0)
-                _td = np.ones_like(mu)
-                # _td[mu>0] = 1 - imu[mu>0]/mu[mu>0]
-                _td[ff] = 1 - np.exp(np.log(imu[ff]) - np.log(mu[ff]))
-                td[si] = _td
-
-                x0 = x[si][-1]
-                mu0 = mu[-1]
-                imu0 = imu[-1]
-                td0 = _td[-1]
-                mu0, imu0 = 1, imu0 / mu0
-
-                # if i==0:
-                #    plt.figure(figsize=(16,3))
-                #    plt.plot(x[si])
-                #    plt.plot(_td)
-            if crosstalk:
-                stim_out *= np.expand_dims(td, 0)
-            else:
-                stim_out[i, :] *= td
-            """
-            """
-            if quick_eval and (reset_signal is not None):
-
-            a = 1 / taui[i]
-            x = ui[i] * tstim[i, :] / fs
-
-            if reset_signal is None:
-                reset_times = np.array([0, len(x)])
-            else:
-                reset_times = np.argwhere(reset_signal[0, :])[:, 0]
-                reset_times = np.append(reset_times, len(x))
-
-            mu = np.zeros_like(x)
-            imu = np.zeros_like(x)
-            for j in range(len(reset_times)-1):
-                si = slice(reset_times[j], reset_times[j+1])
-
-                ix = cumtrapz(a + x[si], dx=1, initial=0)
-
-                mu[si] = np.exp(ix)
-                imu[si] = cumtrapz(mu[si]*x[si], dx=1, initial=0)
-
-            td = np.ones_like(x)
-            ff = np.bitwise_and(mu>0, imu>0)
-            td[ff] = 1 - np.exp(np.log(imu[ff]) - np.log(mu[ff]))
-            #td[mu>0] = 1 - imu[mu>0]/mu[mu>0]
-
-            if crosstalk:
-                stim_out *= np.expand_dims(td, 0)
-            else:
-                stim_out[i, :] *= td           
-            """
+
+    if quick_eval:
+        a = 1 / taui
+        x = ui * tstim
+
+        if reset_signal is None:
+            reset_times = np.arange(0, s[1] + chunksize - 1, chunksize)
+            reset_times[-1] = min(reset_times[-1], s[1])
         else:
+            reset_times = np.argwhere(reset_signal[0, :])[:, 0]
+            reset_times = np.append(reset_times, s[1])
+
+        td = _stp_quick(x, a, reset_times)
+
+        # offset depression by one to allow transients
+        stim_out = tstim * np.pad(td[:, :-1], ((0,0), (1,0)), 'constant', constant_values=(1, 1))
+
+    else:
+        n = len(u)
+        ustim = 1.0 / taui[:n] + ui[:n] * tstim[:n, :]
+        td = _stp_dynamics(ustim, 1 / taui[:n], ui[:n])
 
-            a = 1 / taui[i]
-            ustim = 1.0 / taui[i] + ui[i] * tstim[i, :]
-            # ustim = ui[i] * tstim[i, :]
-            td = np.ones_like(ustim)  # initialize dep state vector
-
-            if ui[i] == 0:
-                # passthru, no STP, preserve stim_out = tstim
-                pass
-            elif ui[i] > 0:
-                # depression
-                for tt in range(1, s[1]):
-                    # td = di[i, tt - 1]  # previous time bin depression
-                    # delta = (1 - td) / taui[i] - ui[i] * td * tstim[i, tt - 1]
-                    # delta = 1/taui[i] - td * (1/taui[i] - ui[i] * tstim[i, tt - 1])
-                    # then a=1/taui[i] and ustim=1/taui[i] - ui[i] * tstim[i,:]
-                    delta = a - td[tt - 1] * ustim[tt - 1]
-                    td[tt] = td[tt - 1] + delta
-                    if td[tt] < 0:
-                        td[tt] = 0
-            else:
-                # facilitation
-                for tt in range(1, s[1]):
-                    delta = a - td[tt - 1] * ustim[tt - 1]
-                    td[tt] = td[tt - 1] + delta
-                    if td[tt] > 5:
-                        td[tt] = 5
-
-            if crosstalk:
-                stim_out *= np.expand_dims(td, 0)
-            else:
-                stim_out[i, :] *= td
+        if crosstalk:
+            stim_out *= np.prod(td, axis=0, keepdims=True)
+        else:
+            stim_out[:n, :] *= td
 
     if np.sum(np.isnan(stim_out)):
         #    import pdb
@@ -299,7 +345,7 @@ def _stp2(X, u, u2, tau, tau2, urat=0.5, x0=None, crosstalk=0, fs=1, reset_signa
     # limits, assumes input (X) range is approximately -1 to +1
     if dep_only or quick_eval:
         ui = np.abs(u.copy())
-        ui2 = np.abs(ui2)
+        ui2 = np.abs(u2.copy())
     else:
         ui = u.copy()
         ui2 = u2.copy()
@@ -328,45 +374,27 @@ def _stp2(X, u, u2, tau, tau2, urat=0.5, x0=None, crosstalk=0, fs=1, reset_signa
         # assumes dim of u is 1 !
         tstim = np.mean(tstim, axis=0, keepdims=True)
 
-    for i in range(0, len(u)):
-
-        a = 1 / taui[i]
-        ustim = 1.0 / taui[i] + ui[i] * tstim[i, :]
-        # ustim = ui[i] * tstim[i, :]
-        td = np.ones_like(ustim)  # initialize dep state vector
-        td2 = np.ones_like(ustim)  # initialize dep state vector
-
-        if ui[i] == 0:
-            # passthru, no STP, preserve stim_out = tstim
-            pass
-        elif ui[i] > 0:
-            # depression
-            for tt in range(1, s[1]):
-                # td = di[i, tt - 1]  # previous time bin depression
-                delta = (1 - td[tt - 1]) / taui[i] - ui[i] * td[tt - 1] * tstim[i, tt - 1]
-                delta2 = (1 - td2[tt - 1]) / taui2[i] - ui2[i] * td2[tt - 1] * tstim[i, tt - 1]
-
-                # delta = 1/taui[i] - td * (1/taui[i] - ui[i] * tstim[i, tt - 1])
-                # then a=1/taui[i] and ustim=1/taui[i] - ui[i] * tstim[i,:]
-                # delta = a - td[tt - 1] * ustim[tt - 1]
-                td[tt] = td[tt - 1] + delta
-                td2[tt] = td2[tt - 1] + delta2
-                if td[tt] < 0:
-                    td[tt] = 0
-                if td2[tt] < 0:
-                    td2[tt] = 0
-        else:
-            # facilitation
-            for tt in range(1, s[1]):
-                delta = a - td[tt - 1] * ustim[tt - 1]
-                td[tt] = td[tt - 1] + delta
-                if td[tt] > 5:
-                    td[tt] = 5
+    n = len(u)
+    ui = np.reshape(ui, -1)[:n]
+    ui2 = np.reshape(ui2, -1)[:n]
+    taui = np.reshape(taui, -1)[:n]
+    taui2 = np.reshape(taui2, -1)[:n]
+    x = np.broadcast_to(tstim[:n, :], (n, s[1]))
+
+    # depressing channels have two time constants, facilitating channels
+    # only use the first
+    ustim = (1.0 / taui)[:, np.newaxis] + ui[:, np.newaxis] * x
+    td = _stp_dynamics(ustim, 1 / taui, ui)
+    dep = ui > 0
+    td2 = np.ones_like(td)
+    if np.any(dep):
+        ustim2 = (1.0 / taui2[dep])[:, np.newaxis] + ui2[dep, np.newaxis] * x[dep]
+        td2[dep] = _stp_dynamics(ustim2, 1 / taui2[dep], np.ones(np.sum(dep)))
 
-        if crosstalk:
-            stim_out *= np.expand_dims(td, 0)
-        else:
-            stim_out[i, :] *= td * urat + td2 * (1 - urat)
+    if crosstalk:
+        stim_out *= np.prod(td, axis=0, keepdims=True)
+    else:
+        stim_out[:n, :] *= td * urat + td2 * (1 - urat)
 
     if np.sum(np.isnan(stim_out)):
         import pdb
@@ -7,3 +7,13 @@ def sum_channels(rec, i, o):
     '''
     fn = lambda x: np.nansum(x, axis=0, keepdims=True)
     return [rec[i].transform(fn, o)]
+
+
+def sum_channels_backward(rec, grad, i, o):
+    '''
+    Backward pass of `sum_channels`. NaN channels did not contribute to the
+    sum, so they get no gradient.
+    '''
+    x = rec[i].as_continuous()
+    dx = np.where(np.isfinite(x), grad, 0)
+    return {i: dx}, {}
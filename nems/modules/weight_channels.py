@@ -29,6 +29,19 @@ def gaussian_coefficients(mean, sd, n_chan_in, **kwargs):
     return coefficients
 
 
+def _normalized_coefficients_backward(coefficients, dc):
+    '''
+    Gradient with respect to `coefficients` of the row-normalized
+    coefficients c = coefficients / sum(abs(coefficients)), given the
+    gradient `dc` with respect to c.
+    '''
+    sc = np.sum(np.abs(coefficients), axis=1, keepdims=True)
+    sc[sc == 0] = 1
+    c = coefficients / sc
+    return (dc - np.sign(coefficients) *
+            np.sum(dc * c, axis=1, keepdims=True)) / sc
+
+
 #-------------------------------------------------------------------------------
 # Module functions
 #-------------------------------------------------------------------------------
@@ -55,6 +68,28 @@ def basic(rec, i, o, coefficients, normalize_coefs=False, **kwargs):
     return [rec[i].transform(fn, o)]
 
 
+def basic_backward(rec, grad, i, o, coefficients, normalize_coefs=False,
+                   **kwargs):
+    '''
+    Backward pass of `basic`. `grad` is the gradient of the error with
+    respect to the output signal. Returns the gradients with respect to the
+    input signal and to `coefficients`.
+    '''
+    x = np.nan_to_num(rec[i].as_continuous())
+    if normalize_coefs:
+        sc = np.sum(np.abs(coefficients), axis=1, keepdims=True)
+        sc[sc == 0] = 1
+        c = coefficients / sc
+    else:
+        c = coefficients
+
+    dc = grad @ x.T
+    if normalize_coefs:
+        dc = _normalized_coefficients_backward(coefficients, dc)
+
+    return {i: c.T @ grad}, {'coefficients': dc}
+
+
 def basic_with_offset(rec, i, o, coefficients, offset, normalize_coefs=False):
     '''
     Parameters
@@ -125,3 +160,29 @@ def gaussian(rec, i, o, n_chan_in, mean, sd, **kw_args):
     coefficients = gaussian_coefficients(mean, sd, n_chan_in)
     fn = lambda x: coefficients @ x
     return [rec[i].transform(fn, o)]
+
+
+def gaussian_backward(rec, grad, i, o, n_chan_in, mean, sd, **kw_args):
+    '''
+    Backward pass of `gaussian`. Returns the gradients with respect to the
+    input signal, `mean` and `sd`.
+    '''
+    x = np.nan_to_num(rec[i].as_continuous())
+    coefficients = gaussian_coefficients(mean, sd, n_chan_in)
+    dc = grad @ x.T
+
+    # coefficients = e / sum(e), with e = exp(-0.5 * z**2)
+    chans = np.arange(n_chan_in)/n_chan_in
+    m = np.asanyarray(mean)[..., np.newaxis]
+    s = np.asanyarray(sd)[..., np.newaxis]
+    z = (chans - m) / s
+    e = np.exp(-0.5 * z**2)
+    csum = np.sum(e, axis=-1, keepdims=True)
+    csum[csum == 0] = 1
+    de = (dc - np.sum(dc * coefficients, axis=-1, keepdims=True)) / csum
+    de_dz = de * e * z / s
+
+    dmean = np.reshape(np.sum(de_dz, axis=-1), np.shape(mean))
+    dsd = np.reshape(np.sum(de_dz * z, axis=-1), np.shape(sd))
+
+    return {i: coefficients.T @ grad}, {'mean': dmean, 'sd': dsd}
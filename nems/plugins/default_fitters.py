@@ -112,19 +112,28 @@ def basic(fitkey):
     cd : Use coordinate_descent for fitting (default is scipy_minimize)
     miN : Set maximum iterations to N, where N is any positive integer.
     tN : Set tolerance to 10**-N, where N is any positive integer.
+    rbN : Fit N random initial conditions and keep the best one.
+    wN : Fit up to N initial conditions/jackknifes at a time in N processes.
+    esN : Give up initial conditions whose error is more than N times the
+          best error behind the best one (d-sub for decimals, eg es0d5).
 
     '''
 
     xfspec = []
 
     options = _extract_options(fitkey)
-    max_iter, tolerance, fitter, choose_best, rand_count = _parse_basic(options)
+    max_iter, tolerance, fitter, choose_best, rand_count, n_workers, \
+        early_stop = _parse_basic(options)
+    fit_kwargs = {'max_iter': max_iter, 'fitter': fitter,
+                  'tolerance': tolerance}
+    if n_workers is not None:
+        fit_kwargs['n_workers'] = n_workers
+    if early_stop is not None:
+        fit_kwargs['early_stop'] = early_stop
     xfspec = []
     if rand_count>1:
         xfspec.append(['nems.initializers.rand_phi', {'rand_count': rand_count}])
-    xfspec.append(['nems.xforms.fit_basic',
-                  {'max_iter': max_iter,
-                   'fitter': fitter, 'tolerance': tolerance}])
+    xfspec.append(['nems.xforms.fit_basic', fit_kwargs])
     if choose_best:
         xfspec.append(['nems.analysis.test_prediction.pick_best_phi', {'criterion': 'mse_fit'}])
 
@@ -168,6 +177,7 @@ def newtf(fitkey):
     rand_count = 0
     pick_best = False
     epoch_name = "REFERENCE"
+    streaming = False
 
     options = _extract_options(fitkey)
 
@@ -218,6 +228,8 @@ def newtf(fitkey):
                 initializer = 'lecun_normal'
         elif op=='cont':
             epoch_name = ""
+        elif op == 'stream':
+            streaming = True
     xfspec = []
     if rand_count > 0:
         xfspec.append(['nems.initializers.rand_phi', {'rand_count': rand_count}])
@@ -237,6 +249,7 @@ def newtf(fitkey):
                        'initializer': initializer,
                        'seed': seed,
                        'epoch_name': epoch_name,
+                       'streaming': streaming,
                    }])
 
     if pick_best:
@@ -705,6 +718,8 @@ def _parse_basic(options):
     fitter = 'scipy_minimize'
     choose_best = False
     rand_count = 1
+    n_workers = None
+    early_stop = None
     for op in options:
         if op.startswith('mi'):
             pattern = re.compile(r'^mi(\d{1,})')
@@ -725,8 +740,13 @@ def _parse_basic(options):
             else:
                 rand_count = int(op[2:])
             choose_best = True
+        elif op.startswith('w'):
+            n_workers = int(op[1:])
+        elif op.startswith('es'):
+            early_stop = float(op[2:].replace('d', '.'))
 
-    return max_iter, tolerance, fitter, choose_best, rand_count
+    return (max_iter, tolerance, fitter, choose_best, rand_count, n_workers,
+            early_stop)
 
 
 def _parse_iter(options):
@@ -102,141 +102,204 @@ def average_away_epoch_occurrences(recording, epoch_regex='^STIM_', use_mask=Tru
     if use_mask:
         recording = recording.remove_masked_epochs()
 
-    # need to edit the epochs dataframe, so make a working copy
-    temp_epochs = recording['resp'].epochs.copy()
-
-    # only pull out matching epochs
-    regex_mask = temp_epochs['name'].str.contains(pat=epoch_regex, na=False, regex=True)
-    epoch_stims = temp_epochs[regex_mask]
-
-    # get a list of the unique epoch names
-    epoch_names = temp_epochs.loc[regex_mask, 'name'].sort_values().unique()
+    epochs = recording['resp'].epochs
 
     # what to round to when checking if epoch timings match
     d = int(np.ceil(np.log10(recording[list(recording.signals.keys())[0]].fs))+1)
 
-    # build a series with an interval index, to lookup where epochs fall
-    s_name = pd.Series(epoch_stims['name'].values, pd.IntervalIndex.from_arrays(epoch_stims['start'], epoch_stims['end'], closed='both'))
-    s_cat = pd.Series(np.arange(len(epoch_stims['start']), dtype='int'), pd.IntervalIndex.from_arrays(epoch_stims['start'], epoch_stims['end'], closed='both'))
-
-    # add helper columns using the interval index lookups
-    temp_epochs['cat'] = temp_epochs['start'].map(s_cat)
-    temp_epochs['cat_end'] = temp_epochs['end'].map(s_cat)
-    temp_epochs['stim'] = temp_epochs['start'].map(s_name)
-
-    # only want epochs that fall within a stim epoch, so drop the ones that don't
-    drop_mask = temp_epochs['cat'] != temp_epochs['cat_end']
-    trial_mask = temp_epochs['name'] == 'TRIAL'  # also dorp this
-    temp_epochs = temp_epochs.loc[~drop_mask & ~trial_mask, ['name', 'start', 'end', 'cat', 'stim']]
-
-    temp_epochs['cat'] = temp_epochs['cat'].astype(int)  # cast back to int to make into index
-
-    # build another helper series, to map in times to subtract from start/end
-    work_mask = temp_epochs['name'].str.contains(pat=epoch_regex, na=False, regex=True)
-    s_starts = pd.Series(temp_epochs.loc[work_mask, 'start'].values, temp_epochs.loc[work_mask, 'cat'].values)
-
-    temp_epochs['start'] -= temp_epochs['cat'].map(s_starts)
-    temp_epochs['end'] -= temp_epochs['cat'].map(s_starts)
-    temp_epochs = temp_epochs.round(d)
-
-    concat = []
-
-    offset = 0
-    for name, group in temp_epochs.groupby('stim'):
-        # build a list of epoch names where all the values are equal
-        m_equal =(group.groupby('name').agg({
-            'start': lambda x: len(set(x)) == 1,
-            'end': lambda x: len(set(x)) == 1,
-        }).all(axis=1)
-           )
-        m_equal = m_equal.index[m_equal].values
-
-        # find the epoch names that are common to every group
-        s = set()
-        for idx, (cat_name, cat_group) in enumerate(group.groupby('cat')):
-            if idx == 0:
-                s.update(cat_group['name'])
-            else:
-                s.intersection_update(cat_group['name'])
-
-        # drop where values across names aren't equal, or where a group is missing an epoch
-        keep_mask = (group['name'].isin(m_equal)) & (group['name'].isin(s))
-
-        g = group[keep_mask].drop(['cat', 'stim'], axis=1).drop_duplicates()
-        max_end = g['end'].max()
-        g[['start', 'end']] += offset
-        offset += max_end
-
-        concat.append(g)
-
-    new_epochs = pd.concat(concat).sort_values(['start', 'end', 'name']).reset_index(drop=True)
-
-    # make name the temp_epochs index for quick start/end lookup in loop below
-    temp_epochs = (temp_epochs[['name', 'start', 'end']]
-                   .drop_duplicates()
-                   .set_index('name')
-                   .assign(dur=lambda x: (x['end'] - x['start']).astype(float))
-                   .drop(['start', 'end'], axis='columns')
-                   )
+    epoch_names, dur, new_epochs, offset = \
+        _average_away_epoch_layout(epochs, epoch_regex, d)
 
-    #averaged_recording = recording.copy()
     averaged_signals = {}
     for signal_name, signal in recording.signals.items():
         # TODO: this may be better done as a method in signal subclasses since
         # some subclasses may have more efficient approaches (e.g.,
         # TiledSignal)
 
-        # Extract all occurences of each epoch, returning a dict where keys are
-        # stimuli and each value in the dictionary is (reps X cell X bins)
-        #print(signal_name)
-        epoch_data = signal.rasterize().extract_epochs(epoch_names)
-
-        fs = signal.fs
-        # Average over all occurrences of each epoch
-        data = []
-        #import pdb; pdb.set_trace()
-        for epoch_name in epoch_names:
-            epoch = epoch_data[epoch_name]
-
-            # TODO: fix empty matrix error. do epochs align properly?
-            if epoch.dtype == bool:
-                epoch = epoch[0,...]
-            elif np.sum(np.isfinite(epoch)):
-                epoch = np.nanmean(epoch, axis=0)
-            else:
-                epoch = epoch[0,...]
-
-            elen = int(round((temp_epochs.loc[epoch_name, 'dur'] * fs)))
-
-            if epoch.shape[-1] > elen:
-                log.info('truncating epoch_data for epoch %s', epoch_name)
-                epoch = epoch[..., :elen]
-            elif epoch.shape[-1]<elen:
-                pad = np.zeros((epoch.shape[0], elen-epoch.shape[1])) * np.nan
-                epoch = np.concatenate((epoch, pad), axis=1)
-                log.info('padding epoch_data for epoch %s with nan', epoch_name)
-
-            data.append(epoch)
+        # Extract all occurences of all epochs in one (reps X cell X bins)
+        # block, the occurrences of each stimulus are stored together
+        epoch_data, epoch_index = \
+            signal.rasterize().extract_epoch_block(epoch_names)
 
-        data = np.concatenate(data, axis=-1)
+        elen = np.round(dur * signal.fs).astype(int)
+        data = _average_epoch_block(epoch_data, epoch_index, elen)
         if data.shape[-1] != round(signal.fs * offset):
             raise ValueError('Misalignment issue in averaging signal')
 
         averaged_signal = signal._modified_copy(data, epochs=new_epochs)
         averaged_signals[signal_name] = averaged_signal
 
-#        # TODO: Eventually need a smarter check for this in case it's named
-#        #       something else. Basically just want to preserve spike data.
-#        if signal.name == 'resp':
-#            spikes = signal.copy()
-#            spikes.name = signal.name + ' spikes'
-#            averaged_recording.add_signal(spikes)
     averaged_recording = Recording(averaged_signals,
                                    meta=recording.meta,
                                    name=recording.name)
     return averaged_recording
 
 
+def _average_away_epoch_layout(epochs, epoch_regex, d):
+    '''
+    Works out the epochs of the signals built by
+    average_away_epoch_occurrences.
+
+    Every epoch that falls within one occurrence of a stimulus (an epoch
+    matching epoch_regex) is placed relative to the start of that
+    occurrence, rounded to d decimals. An epoch is kept if it occurs, with
+    the same relative start and end, in every occurrence of the stimulus.
+    The stimuli are then laid end to end in order of name.
+
+    Returns
+    -------
+    epoch_names : array
+        Sorted names of the stimuli.
+    dur : array
+        Duration (in seconds) of each stimulus.
+    new_epochs : DataFrame
+        Epochs of the averaged signals.
+    offset : float
+        Total duration of the averaged signals.
+    '''
+    names = epochs['name'].values
+    start = epochs['start'].values.astype(float)
+    end = epochs['end'].values.astype(float)
+
+    # the stimulus occurrences, sorted by time
+    regex_mask = epochs['name'].str.contains(pat=epoch_regex, na=False,
+                                             regex=True).values
+    stim_order = np.argsort(start[regex_mask], kind='stable')
+    stim_start = start[regex_mask][stim_order]
+    stim_end = end[regex_mask][stim_order]
+    if np.any(stim_start[1:] < stim_end[:-1]):
+        raise ValueError('Epochs matching {} overlap'.format(epoch_regex))
+    epoch_names, stim_id = np.unique(names[regex_mask][stim_order],
+                                     return_inverse=True)
+
+    # occurrence containing every epoch; only keep epochs that fall within
+    # exactly one occurrence (not e.g. zero-length epochs where two meet)
+    parent, child = ep.epoch_contained_pairs(
+        np.stack((stim_start, stim_end), axis=1), np.stack((start, end), axis=1))
+    cat = np.zeros(len(names), dtype=int)
+    cat[child] = parent
+    keep = (np.bincount(child, minlength=len(names)) == 1) & (names != 'TRIAL')
+    names = names[keep]
+    cat = cat[keep]
+    start = np.round(start[keep] - stim_start[cat], d)
+    end = np.round(end[keep] - stim_start[cat], d)
+    stim = stim_id[cat]
+
+    # group the epochs by stimulus and name, in order of occurrence
+    name_list, name_id = np.unique(names.astype(str), return_inverse=True)
+    key = stim * len(name_list) + name_id
+    order = np.lexsort((np.arange(len(key)), key))
+    key = key[order]
+    first = np.flatnonzero(np.diff(key, prepend=-1))
+    group = order[first]
+
+    # a name is kept if it has the same timing in every occurrence...
+    def group_range(x):
+        x = x[order]
+        return np.minimum.reduceat(x, first) == np.maximum.reduceat(x, first)
+    equal = group_range(start) & group_range(end)
+
+    # ...and occurs in every occurrence of its stimulus
+    occurrences = np.unique(np.stack([stim, cat]), axis=1)
+    stim_count = np.bincount(occurrences[0], minlength=len(epoch_names))
+    name_cat = np.unique(np.stack([key, cat[order]]), axis=1)
+    name_count = np.bincount(np.searchsorted(key[first], name_cat[0]),
+                             minlength=len(first))
+    common = name_count == stim_count[stim[group]]
+
+    group = group[equal & common]
+    g_stim = stim[group]
+    g_end = end[group]
+
+    # lay the stimuli end to end
+    max_end = np.full(len(epoch_names), np.nan)
+    np.fmax.at(max_end, g_stim, g_end)
+    stim_offset = np.cumsum(np.concatenate([[0], max_end]))
+    offset = stim_offset[-1]
+    new_epochs = pd.DataFrame({
+        'name': names[group],
+        'start': start[group] + stim_offset[g_stim],
+        'end': g_end + stim_offset[g_stim],
+        })
+    order = np.lexsort((name_id[group], new_epochs['end'].values,
+                        new_epochs['start'].values))
+    new_epochs = new_epochs.iloc[order].reset_index(drop=True)
+
+    # duration of every stimulus, which must be the same in all occurrences
+    is_stim = np.isin(names, epoch_names)
+    timing, idx = np.unique(np.stack([name_id[is_stim], start[is_stim],
+                                      end[is_stim]]), axis=1,
+                            return_index=True)
+    stim_timing = np.searchsorted(epoch_names, names[is_stim][idx])
+    timing_count = np.bincount(stim_timing, minlength=len(epoch_names))
+    if np.any(timing_count == 0):
+        raise KeyError(epoch_names[np.argmax(timing_count == 0)])
+    if np.any(timing_count > 1):
+        raise ValueError('Occurrences of epochs matching {} differ in '
+                         'duration'.format(epoch_regex))
+    dur = np.empty(len(epoch_names))
+    dur[stim_timing] = timing[2] - timing[1]
+
+    return epoch_names, dur, new_epochs, offset
+
+
+def _average_epoch_block(epoch_data, epoch_index, elen):
+    '''
+    Averages the occurrences of every epoch in epoch_data, as returned by
+    extract_epoch_block, and concatenates the averages in time, each
+    truncated or NaN-padded to elen samples.
+
+    Boolean data, and epochs without any finite value, take their first
+    occurrence instead of the average.
+    '''
+    first = epoch_index['offset'].values
+    count = epoch_index['count'].values
+    length = epoch_index['length'].values
+    if np.any(count == 0):
+        raise KeyError(epoch_index['name'].values[np.argmax(count == 0)])
+
+    if epoch_data.dtype == bool:
+        average = epoch_data[first]
+    else:
+        # sum and count the non-NaN values of all epochs at once, adding up
+        # occurrences in order as np.nanmean would for each epoch (so the
+        # result is the same to the last bit)
+        nan = np.isnan(epoch_data)
+        values = np.where(nan, 0, epoch_data)
+        total = values[first]
+        for i in range(1, count.max()):
+            more = count > i
+            total[more] += values[first[more] + i]
+        n = np.add.reduceat(~nan, first, axis=0, dtype=np.intp)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = total / n
+
+        finite = np.add.reduceat(np.isfinite(epoch_data), first, axis=0,
+                                 dtype=np.intp)
+        in_epoch = np.arange(epoch_data.shape[-1]) < length[:, np.newaxis]
+        finite = (finite.sum(axis=1) * in_epoch).sum(axis=1) > 0
+        average[~finite] = epoch_data[first[~finite]]
+
+    for i in np.flatnonzero(length > elen):
+        log.info('truncating epoch_data for epoch %s',
+                 epoch_index['name'].values[i])
+    for i in np.flatnonzero(length < elen):
+        log.info('padding epoch_data for epoch %s with nan',
+                 epoch_index['name'].values[i])
+
+    # gather the first elen samples of every average, or NaN past its end
+    epoch = np.repeat(np.arange(len(elen)), elen)
+    t = np.arange(len(epoch)) - np.repeat(np.cumsum(elen) - elen, elen)
+    valid = t < length[epoch]
+    if valid.all():
+        data = np.empty((epoch_data.shape[1], len(epoch)), dtype=average.dtype)
+    else:
+        data = np.full((epoch_data.shape[1], len(epoch)), np.nan)
+    data[:, valid] = average[epoch[valid], :, t[valid]].T
+
+    return data
+
+
 def remove_invalid_segments(rec):
     """
     Currently a specialized function for removing incorrect trials from data
@@ -482,7 +545,9 @@ def mask_all_but_targets(rec, include_incorrect=True):
     # called "REFERENCE"
     #import pdb;pdb.set_trace()
     for k in newrec.signals.keys():
-        newrec[k].epochs.name = newrec[k].epochs.name.str.replace("TARGET", "REFERENCE")
+        epochs = newrec[k].epochs.copy()
+        epochs['name'] = epochs['name'].str.replace("TARGET", "REFERENCE")
+        newrec[k].epochs = epochs
     return newrec
 
 def mask_incorrect(rec):
@@ -843,11 +908,14 @@ def generate_psth_from_resp(rec, resp_sig='resp', epoch_regex='^STIM_',
 
         newrec['resp'].epochs = resp.epochs.copy()
 
-    if 'mask' in newrec.signals.keys():
-        folded_matrices = resp.extract_epochs(epochs_to_extract, mask=newrec['mask'])
-
-    else:
-        folded_matrices = resp.extract_epochs(epochs_to_extract)
+    # extract all matching epochs at once, each value in folded_matrices is
+    # the (reps X cell X bins) slice of epoch_data for one stimulus
+    epoch_data, epoch_index = resp.extract_epoch_block(epochs_to_extract,
+                                                       mask=mask)
+    folded_matrices = {
+        name: epoch_data[offset:offset+count, :, :length]
+        for name, offset, count, length in epoch_index.itertuples(index=False)
+        if count > 0}
     log.info('generating PSTHs for %d epochs', len(folded_matrices.keys()))
 
     # 2. Average over all reps of each stim and save into dict called psth.
@@ -1229,6 +1297,79 @@ def resp_to_pc(rec, pc_idx=None, resp_sig='resp', pc_sig='pca',
     return {'rec': rec0}
 
 
+def sliding_band_power(x, fs, nperseg, n_bins=4, window=('tukey', 0.25)):
+    """
+    Power spectral density of the lowest n_bins frequency bins of x in a
+    window of nperseg samples that slides one sample at a time. This is
+    what scipy.signal.spectrogram(x, fs, window=window, nperseg=nperseg,
+    noverlap=nperseg-1) returns for those bins (detrended, density
+    scaling), without an FFT per sample.
+
+    Removing the window mean and taking the windowed DFT at bin m is a
+    linear filter on x, so each bin is one FFT correlation of x with the
+    kernel w[n] * exp(-2j*pi*m*n/nperseg) - (its sum / nperseg). The cost
+    is O(T log(nperseg)) per bin rather than O(T nperseg log(nperseg)).
+
+    The output is aligned with x: the power at sample t is that of the
+    window centered on t, and the first and last values are repeated where
+    the window does not fit. Windows that contain a NaN give NaN.
+
+    Parameters
+    ----------
+    x : 1D array
+        Signal, e.g. a pupil trace.
+    fs : float
+        Sampling rate of x.
+    nperseg : int
+        Window length in samples.
+    n_bins : int
+        Number of frequency bins, starting at 0 Hz.
+    window : str or tuple
+        Window, see scipy.signal.get_window.
+
+    Returns
+    -------
+    f : 1D array
+        Frequency of each bin.
+    power : 2D array (n_bins x len(x))
+        Power spectral density of each bin at each sample.
+    """
+    x = np.asarray(x, dtype=float)
+    n_windows = len(x) - nperseg + 1
+    if n_windows < 1:
+        raise ValueError('Signal is shorter than the window ({} < {} samples)'
+                         .format(len(x), nperseg))
+
+    win = ss.get_window(window, nperseg)
+    scale = 1.0 / (fs * np.sum(win * win))
+    m = np.arange(n_bins)[:, np.newaxis]
+    kernel = win * np.exp(-2j * np.pi * m * np.arange(nperseg) / nperseg)
+    kernel -= kernel.sum(axis=1, keepdims=True) / nperseg
+
+    # the kernels sum to zero, so subtracting the mean of x changes nothing
+    # but keeps the FFT correlation accurate
+    missing = np.isnan(x)
+    x = np.where(missing, 0, x - np.nanmean(x))
+    dft = ss.oaconvolve(x[np.newaxis, :], kernel[:, ::-1], mode='valid',
+                        axes=1)
+    power = (dft.real ** 2 + dft.imag ** 2) * scale
+    # one-sided spectrum: double all but the 0 Hz and Nyquist bins
+    double = (m > 0) & (m < nperseg / 2)
+    power[double[:, 0]] *= 2
+
+    if np.any(missing):
+        n_missing = np.convolve(missing, np.ones(nperseg, dtype=int), 'valid')
+        power[:, n_missing > 0] = np.nan
+
+    pre = nperseg // 2
+    post = len(x) - n_windows - pre
+    power = np.concatenate((np.repeat(power[:, :1], pre, axis=1), power,
+                            np.repeat(power[:, -1:], post, axis=1)), axis=1)
+    f = np.arange(n_bins) * fs / nperseg
+
+    return f, power
+
+
 def make_state_signal(rec, state_signals=['pupil'], permute_signals=[],
                       new_signalname='state'):
     """
@@ -1273,20 +1414,11 @@ def make_state_signal(rec, state_signals=['pupil'], permute_signals=[],
     if ('pupil_psd') in state_signals:
         pup = newrec['pupil'].as_continuous().copy()
         fs = newrec['pupil'].fs
-        # get spectrogram of pupil
+        # get spectrogram of pupil, keeping only the first 4 channels
         nperseg = int(60*fs)
-        noverlap = nperseg-1
-        f, time, Sxx = ss.spectrogram(pup.squeeze(), fs=fs, nperseg=nperseg,
-                                      noverlap=noverlap)
         max_chan = 4 # (np.abs(f - 0.1)).argmin()
-        # Keep only first five channels of spectrogram
-        #f = interpolate.interp1d(np.arange(0, Sxx.shape[1]), Sxx[:max_chan, :], axis=1)
-        #newspec = f(np.linspace(0, Sxx.shape[-1]-1, pup.shape[-1]))
-        pad1 = np.ones((max_chan,int(nperseg/2)))*Sxx[:max_chan,[0]]
-        pad2 = np.ones((max_chan,int(nperseg/2-1)))*Sxx[:max_chan,[-1]]
-        newspec = np.concatenate((pad1,Sxx[:max_chan, :],pad2), axis=1)
-
-        # = np.concatenate((Sxx[:max_chan, :], np.tile(Sxx[:max_chan,-1][:, np.newaxis], [1, noverlap])), axis=1)
+        f, newspec = sliding_band_power(pup.squeeze(), fs, nperseg,
+                                        n_bins=max_chan)
         newspec -= np.nanmean(newspec, axis=1, keepdims=True)
         newspec /= np.nanstd(newspec, axis=1, keepdims=True)
 
@@ -1,11 +1,11 @@
 import copy
+import functools
+import gzip
 import io
 import json
 import logging
 import os
-import shutil
 import tarfile
-import tempfile
 import time
 import warnings
 from pathlib import Path
@@ -16,14 +16,100 @@ import requests
 
 import nems.epoch as ep
 from nems import get_setting
-from nems.signal import SignalBase, RasterizedSignal, PointProcess, merge_selections, \
-    list_signals, load_signal, load_signal_from_streams
-from nems.uri import local_uri, http_uri, targz_uri
+from nems.signal import SignalBase, RasterizedSignal, PointProcess, FitSignal, IntervalMask, merge_selections, \
+    list_signals, load_signal, load_signal_from_streams, load_signal_from_npy
+from nems.uri import local_uri, http_uri, targz_uri, npy_uri
 from nems.utils import recording_filename_hash
 
 log = logging.getLogger(__name__)
 
 
+class LazySignal:
+    '''
+    Placeholder for a signal of a Recording that hasn't been read yet. Holds
+    only the name and recording name (from the signal's JSON metadata) and a
+    function that loads the signal. See LazySignalDict.
+    '''
+
+    def __init__(self, name, recording, loader):
+        self.name = name
+        self.recording = recording
+        self._loader = loader
+        self._signal = None
+
+    @property
+    def loaded(self):
+        return self._signal is not None
+
+    def load(self):
+        '''
+        Returns the signal, reading it the first time this is called.
+        '''
+        if self._signal is None:
+            log.debug('Loading signal %s', self.name)
+            self._signal = self._loader()
+            self._loader = None
+        return self._signal
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't set on this object
+        if name.startswith('__') or name in ('_signal', '_loader'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+class LazySignalDict(dict):
+    '''
+    Dictionary of signals where some values may be LazySignal placeholders.
+    A placeholder is replaced by its signal the first time the signal is
+    retrieved (rec[name], rec.signals[name], .values(), .items(), ...), so
+    signals that are never used are never read. Keys, len() and "in" don't
+    load anything.
+    '''
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazySignal):
+            value = value.load()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __iter__(self):
+        # Overriding __iter__ makes dict(d), {**d} and d.update() go through
+        # keys() and __getitem__ instead of copying the placeholders.
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *default)
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def copy(self):
+        # keeps the placeholders, which are shared so each signal is still
+        # only read once
+        other = LazySignalDict()
+        dict.update(other, dict.items(self))
+        return other
+
+    def loaded(self, key):
+        '''
+        True if the signal has already been read.
+        '''
+        value = dict.__getitem__(self, key)
+        return not isinstance(value, LazySignal) or value.loaded
+
+
 class Recording:
 
     def __init__(self, signals, meta=None, name=None, signal_views=None):
@@ -39,7 +125,8 @@ class Recording:
         self.view_idx = 0
 
         # Verify that all signals are from the same recording
-        recordings = [s.recording for s in self.signals.values()]
+        # (dict.values doesn't load the signals of a LazySignalDict)
+        recordings = [s.recording for s in dict.values(self.signals)]
         if not recordings:
             raise ValueError('A recording must contain at least 1 signal')
         if not len(set(recordings)) == 1:
@@ -467,6 +554,9 @@ class Recording:
         # Save it to the nems_db running on potoroo, specific filename
         rec.save('http://potoroo/recordings/my_recording.tgz')
 
+        # Save it to a local directory of binary files (see save_npy)
+        rec.save('/home/username/recordings/my_recording.nrec')
+
         # Save it to AWS (TODO, Not Implemented, Needs credentials)
         rec.save('s3://nems.amazonaws.com/somebucket/')
         '''
@@ -480,7 +570,9 @@ class Recording:
         if local_uri(uri):
             uri = local_uri(uri)
             log.info("Saving recording to : %s", uri)
-            if targz_uri(uri):
+            if npy_uri(uri):
+                return self.save_npy(uri)
+            elif targz_uri(uri):
                 return self.save_targz(uri)
             elif uncompressed:
                 return self.save_dir(uri)
@@ -535,6 +627,54 @@ class Recording:
 
         return directory
 
+    def save_npy(self, directory):
+        '''
+        Saves this recording as a directory of binary files that
+        load_recording can memory-map:
+
+          recording.json             name, meta, signal attributes and views
+          <signal>.npy               data matrix of each signal (.npz for
+                                     PointProcess and TiledSignal)
+          NN.<signal>.npy            signals that differ in view NN
+          epochs.K.npy, .name.npy    start/end times and name codes of each
+                                     distinct epochs table
+
+        Directory names ending in .nrec are detected automatically by
+        Recording.save and load_recording.
+        '''
+        if os.path.exists(directory) and os.listdir(directory):
+            m = 'File named {} exists; unable to create dir'.format(directory)
+            raise ValueError(m)
+        os.makedirs(directory, exist_ok=True)
+
+        epoch_tables = []
+        saved = {}
+        views = []
+        signals = []
+        for i, v in enumerate(self.signal_views):
+            view = {}
+            for k, s in v.items():
+                if id(s) not in saved:
+                    prefix = '' if i == 0 else f"{i:02d}."
+                    basepath = os.path.join(directory, prefix + s.name)
+                    filepath = s._save_data_to_npy(basepath)
+                    js = s._json_attributes()
+                    js['file'] = os.path.basename(filepath)
+                    js['epochs'] = _save_epochs_npy(s.epochs, directory,
+                                                    epoch_tables)
+                    saved[id(s)] = len(signals)
+                    signals.append(js)
+                view[k] = saved[id(s)]
+            views.append(view)
+
+        md = {'format': 'nems.npy', 'version': 1, 'name': self.name,
+              'meta': self.meta, 'signals': signals, 'views': views,
+              'epochs': [e for e, _ in epoch_tables]}
+        with open(os.path.join(directory, NPY_RECORDING_FILE), 'w') as md_fh:
+            json.dump(md, md_fh)
+
+        return directory
+
     def save_targz(self, uri):
         '''
         Saves all the signals (CSV/JSON pairs) in this recording
@@ -839,8 +979,7 @@ class Recording:
         else:
             rec = self.copy()
 
-        # initialize mask to be all True
-        m_data = rec['mask'].as_continuous().copy()
+        mask = IntervalMask.from_mask(rec['mask'])
 
         # find all matching epochs
         epochs = self.get_epoch_indices(epoch_name, allow_partial_epochs=allow_partial_epochs)
@@ -866,20 +1005,16 @@ class Recording:
         else:
             idx_data = idx_data.reshape(njacks, nrows)
 
-        # jmask = bins that should be excluded, on top of whatever is already
-        # False in m_data
-        jmask = np.zeros_like(m_data, dtype=np.bool)
-        for idx in idx_data[jack_idx].tolist():
-            if idx < occurrences:
-                lb, ub = epochs[idx]
-                jmask[:, lb:ub] = True
+        # jmask = bins that are kept, on top of whatever is already False in
+        # the mask: everything but this jackknife's epochs, or only those
+        # epochs if inverting
+        jidx = [idx for idx in idx_data[jack_idx].tolist() if idx < occurrences]
+        jmask = mask._interval_copy(epochs[jidx])
 
-        if invert:
-            jmask = ~jmask
-
-        m_data[jmask] = False
+        if not invert:
+            jmask = jmask.invert()
 
-        rec['mask'] = rec['mask']._modified_copy(m_data)
+        rec['mask'] = mask.intersect(jmask)
 
         return rec
 
@@ -912,13 +1047,13 @@ class Recording:
         else:
             rec = self.copy()
 
-        m_data = rec['mask'].as_continuous().copy()
+        mask = IntervalMask.from_mask(rec['mask'])
 
         if tiled != True:
             raise NotImplemented
 
         # Figure out the length of the non-nan data
-        times = m_data.sum()
+        times = int(np.sum(mask.intervals[:, 1] - mask.intervals[:, 0]))
 
         # Full length of jackknife window
         window_len = int((times/njacks))
@@ -926,40 +1061,27 @@ class Recording:
         # Length of a val chunk within a jackknife window
         val_length = int(((window_len/times) * window_len))
 
-        # The mask, either true/false will only be applied on the val_chunks
-        template_inds = np.arange(0, val_length)
-
         # Shift the beginning of this chunk based on which jack_idx
         shift = int(jack_idx*val_length)
-        template_inds += shift
-
-        # Find all locations where the current mask is True
-        mask_true = np.argwhere(m_data==True)[:,1]
 
-        # If invert, set all mask to False. Only val chunks will be set to True
-        if invert == True:
-            m_data[0, mask_true] = False
-
-        # Look over all jackknife windows and update the mask accordingly
+        # Val chunks, as ranges of the samples where the current mask is
+        # True. The last jackknife's chunks run to the end of each window
+        # (and of the data, for the last window).
+        val_ranks = []
         for i in range(0, njacks):
+            lb = shift + int((i*window_len))
             if (jack_idx==(njacks-1)):
-                ti = template_inds+int((i*window_len))
-                e = int((i+1)*window_len)
-                args = mask_true[ti[0]:e]
-                if (i == njacks-1):
-                    args = mask_true[ti[0]:times]
-            else:
-                ti = template_inds+int((i*window_len))
-                np.append(ti, ti[-1]+1)
-                args = mask_true[ti]
-
-            if invert == True:
-                m_data[0, args] = True
+                ub = times if (i == njacks-1) else int((i+1)*window_len)
             else:
-                m_data[0, args] = False
+                ub = lb + val_length
+            val_ranks.append(mask.rank_intervals(lb, ub))
+        val_mask = mask._interval_copy(np.concatenate(val_ranks))
 
-        # pass modified mask back into the 'mask' signal and add to the rec
-        rec['mask'] = rec['mask']._modified_copy(m_data)
+        # If invert, only val chunks are True, otherwise they are set False
+        if invert == True:
+            rec['mask'] = val_mask
+        else:
+            rec['mask'] = mask.intersect(val_mask.invert())
 
         return rec
 
@@ -1144,13 +1266,7 @@ class Recording:
             sig_name = list(rec.signals.keys())[0]
             base_signal = rec[sig_name]
 
-        mask = base_signal.generate_epoch_mask(epoch)
-
-        try:
-            mask_sig = base_signal._modified_copy(mask)
-        except AttributeError:
-            # Only rasterized signals support _modified_copy
-            mask_sig = base_signal.rasterize()._modified_copy(mask)
+        mask_sig = IntervalMask.from_signal(base_signal, epoch)
         mask_sig.name = 'mask'
 
         rec.add_signal(mask_sig)
@@ -1172,15 +1288,15 @@ class Recording:
             rec = self.create_mask(False)
         else:
             rec = self.copy()
-        or_mask = rec['mask'].generate_epoch_mask(epoch)
+        mask = IntervalMask.from_mask(rec['mask'])
+        or_mask = IntervalMask.from_signal(mask, epoch)
 
         # Invert
         if invert:
-            or_mask = ~or_mask
+            or_mask = or_mask.invert()
 
         # apply or_mask to existing mask
-        m = rec['mask'].as_continuous()
-        rec['mask'] = rec['mask']._modified_copy(m | or_mask)
+        rec['mask'] = mask.union(or_mask)
 
         return rec
 
@@ -1201,15 +1317,15 @@ class Recording:
             rec = self.create_mask(True)
         else:
             rec = self.copy()
-        and_mask = rec['mask'].generate_epoch_mask(epoch)
+        mask = IntervalMask.from_mask(rec['mask'])
+        and_mask = IntervalMask.from_signal(mask, epoch)
 
         # Invert
         if invert:
-            and_mask = ~and_mask
+            and_mask = and_mask.invert()
 
         # apply and_mask to existing mask
-        m = rec['mask'].as_continuous()
-        rec['mask'] = rec['mask']._modified_copy(m & and_mask)
+        rec['mask'] = mask.intersect(and_mask)
 
         return rec
 
@@ -1225,17 +1341,20 @@ class Recording:
         rec = self.copy()
         sig = rec['mask']
 
-        if np.sum(sig._data == False) == 0:
+        if _mask_all_true(sig):
             # mask is all true, passthrough
             return rec
 
-        m = rec['mask']._data[0, :].copy()
-        z = np.array([0])
-        m = np.concatenate((z, m, z))
-        s, = np.nonzero(np.diff(m) > 0)
-        e, = np.nonzero(np.diff(m) < 0)
+        if isinstance(sig, IntervalMask):
+            times = sig.intervals / sig.fs
+        else:
+            m = rec['mask']._data[0, :].copy()
+            z = np.array([0])
+            m = np.concatenate((z, m, z))
+            s, = np.nonzero(np.diff(m) > 0)
+            e, = np.nonzero(np.diff(m) < 0)
 
-        times = (np.vstack((s, e))/sig.fs).T
+            times = (np.vstack((s, e))/sig.fs).T
         # if times[-1,1]==times[-1,0]:
         #    times = times[:-1,:]
         # log.info('masking')
@@ -1258,7 +1377,7 @@ class Recording:
         rec = self.copy()
         m = rec['mask'].copy()
 
-        if np.sum(m._data == False) == 0:
+        if _mask_all_true(m):
             # mask is all true, passthrough
             return rec
 
@@ -1282,7 +1401,7 @@ class Recording:
         rec = self.copy()
         m = rec['mask'].copy()
 
-        if np.sum(m._data == False) == 0:
+        if _mask_all_true(m):
             # mask is all true, passthrough
             return rec
 
@@ -1291,27 +1410,110 @@ class Recording:
 
         return rec
 
+class FitRecording(Recording):
+    '''
+    Lightweight stand-in for a Recording, used while fitting.
+
+    Only the current view is kept, and every signal is held as a FitSignal,
+    so copying the recording and adding the output of each module during
+    evaluation doesn't rebuild any signal metadata. Use to_recording() to get
+    a regular Recording of RasterizedSignals back once the fit is done.
+    '''
+
+    def __init__(self, rec):
+        self.signals = {}
+        for name, sig in rec.signals.items():
+            if not isinstance(sig, FitSignal):
+                sig = FitSignal(sig.rasterize(), name=name)
+            self.signals[name] = sig
+        self.signal_views = [self.signals]
+        self.view_idx = 0
+        self.name = rec.name
+        self.uri = rec.uri
+        self.meta = rec.meta
+
+    def copy(self):
+        '''
+        Returns a copy of this recording. Signals are shared, not copied.
+        '''
+        other = copy.copy(self)
+        other.signals = self.signals.copy()
+        other.signal_views = [other.signals]
+        return other
+
+    def add_signal(self, signal):
+        '''
+        Adds the signal equal to this recording, converting it to a FitSignal
+        if needed. Any existing signal with the same name will be overwritten.
+        No return value.
+        '''
+        if not isinstance(signal, FitSignal):
+            if not isinstance(signal, SignalBase):
+                raise TypeError("Recording signals must be instances of"
+                                " a Signal class. signal {} was type: {}"
+                                .format(signal.name, type(signal)))
+            signal = FitSignal(signal.rasterize())
+        self.signals[signal.name] = signal
+
+    def to_recording(self):
+        '''
+        Returns a Recording with the same signals, as RasterizedSignals.
+        '''
+        signals = {k: s.as_signal() for k, s in self.signals.items()}
+        return Recording(signals, meta=self.meta, name=self.name)
+
+
 ## I/O functions
-def load_recording_from_targz(targz):
+def _mask_all_true(mask):
+    if isinstance(mask, IntervalMask):
+        return mask.all_true()
+    return np.sum(mask._data == False) == 0
+
+
+def load_recording_from_targz(targz, signals=None, lazy=True):
     if os.path.exists(targz):
         with open(targz, 'rb') as stream:
-            return load_recording_from_targz_stream(stream)
+            return load_recording_from_targz_stream(stream, signals=signals,
+                                                    lazy=lazy)
     else:
         m = 'Not a .tgz file: {}'.format(targz)
         raise ValueError(m)
 
 
-def load_recording_from_targz_stream(tgz_stream):
+def _lazy_signal(js, loader, lazy=True):
+    '''
+    Returns a LazySignal for the signal described by JSON metadata js, or
+    the loaded signal if lazy is False.
+    '''
+    signal = LazySignal(js['name'], js['recording'], loader)
+    return signal if lazy else signal.load()
+
+
+def load_recording_from_targz_stream(tgz_stream, signals=None, lazy=True):
     '''
     Loads the recording object from the given .tgz stream, which
     is expected to be a io.BytesIO object.
-    For hdf5 files, copy to temporary directory and load with hdf5 utility
+
+    signals : {None, list of strings}
+        If given, only load these signals. Other members of the archive are
+        skipped without being decoded.
+    lazy : {True, False}
+        If True, only the JSON metadata of each signal is read here. The
+        compressed archive is kept and decompressed when the first signal is
+        used. The data and epochs of a signal are parsed the first time the
+        signal is used (see LazySignalDict).
     '''
-    tpath=None
+    archive = None
+    if lazy:
+        archive = _TgzArchive(tgz_stream.read())
+        tgz_stream = io.BytesIO(archive.compressed)
+
     meta = {}
-    streams = [{}]  # For holding file streams as we unpack
+    members = [{}]  # For holding the members of each signal as we unpack
     with tarfile.open(fileobj=tgz_stream, mode='r:gz') as t:
-        for member in t.getmembers():
+        # walk the archive in order, getmembers() would read all the headers
+        # first and extractfile() then has to decompress it all over again
+        for member in t:
             if member.size == 0:  # Skip empty files
                 continue
             basename = os.path.basename(member.name)
@@ -1328,67 +1530,204 @@ def load_recording_from_targz_stream(tgz_stream):
                 signame = str(_pieces[1:])
             #signame = str(basename.split('.')[0:2])
 
+            binary = False
             if basename.endswith('meta.json'):
-                f = io.StringIO(t.extractfile(member).read().decode('utf-8'))
-                meta = json.load(f)
-                f = None
+                meta = json.loads(t.extractfile(member).read().decode('utf-8'))
+                continue
+            elif (signals is not None) and (_pieces[-1] not in signals):
+                # file belongs to a signal that wasn't requested
+                continue
             elif basename.endswith('epoch.csv'):
                 keyname = 'epoch_stream'
-                f = io.StringIO(t.extractfile(member).read().decode('utf-8'))
-
             elif basename.endswith('.csv'):
                 keyname = 'data_stream'
-                f = io.StringIO(t.extractfile(member).read().decode('utf-8'))
-
             elif basename.endswith('.h5'):
                 keyname = 'data_stream'
-                #f_in = io.BytesIO(t.extractfile(member).read())
-
-                # current non-optimal solution. extract hdf5 file to disk and then load
-                if not tpath:
-                    tpath=tempfile.mktemp()
-                t.extract(member,tpath)
-                f = tpath+'/'+member.name
-
+                # h5py can read from a file-like object, so no need to
+                # extract to a temporary directory
+                binary = True
             elif basename.endswith('.json'):
                 keyname = 'json_stream'
-                f = io.StringIO(t.extractfile(member).read().decode('utf-8'))
-
             else:
                 m = 'Unexpected file found in tgz: {} (size={})'.format(member.name, member.size)
                 raise ValueError(m)
 
-            if f is not None:
-                # Ensure that we can doubly nest the streams dict
-                if len(streams) < (v+1):
-                    streams.append({})
-                if signame not in streams[v]:
-                    streams[v][signame] = {}
-                # Read out a stringIO object for each file now while it's open
-                #f = io.StringIO(t.extractfile(member).read().decode('utf-8'))
-                streams[v][signame][keyname] = f
-
-    # Now that the streams are organized, convert them into signals
-    # log.debug({k: streams[k].keys() for k in streams})
-    signal_views = []
-    previous_dict = {}
-    for stream in streams:
-        _sigs = [load_signal_from_streams(**sg) for sg in stream.values()]
-        signals_dict = {s.name: s for s in _sigs}
+            if lazy and (keyname != 'json_stream'):
+                # only note where the member is, it's read by the loader
+                archive.add(member.offset_data, member.size)
+                data = functools.partial(archive.read, member.offset_data)
+            else:
+                data = t.extractfile(member).read()
+
+            # Ensure that we can doubly nest the members dict
+            if len(members) < (v+1):
+                members.append({})
+            if signame not in members[v]:
+                members[v][signame] = {}
+            members[v][signame][keyname] = (data, binary)
 
+    # Now that the members are organized, convert them into signals. Only the
+    # JSON metadata are parsed here, see LazySignal.
+    signal_views = []
+    previous_dict = LazySignalDict()
+    for view_members in members:
         signal_views.append(previous_dict.copy())
-        signal_views[-1].update(signals_dict)
+        for sg in view_members.values():
+            js = json.loads(sg['json_stream'][0].decode('utf-8'))
+            loader = functools.partial(_load_signal_from_tgz_members, sg)
+            dict.__setitem__(signal_views[-1], js['name'],
+                             _lazy_signal(js, loader, lazy))
 
         previous_dict = signal_views[-1]
 
     rec = Recording(signals={}, meta=meta, signal_views=signal_views)
 
-    if tpath:
-        shutil.rmtree(tpath)  # clean up if tpath is not None
-
     return rec
 
-def load_recording(uri):
+
+class _TgzArchive:
+    '''
+    The bytes of a .tgz file, for reading its members lazily. The whole
+    archive is decompressed once, when the first member is read. Each member
+    is kept until it's read and then released, so the archive is only held
+    in memory until all its signals are loaded.
+    '''
+
+    def __init__(self, compressed):
+        self.compressed = compressed
+        self.sizes = {}
+        self.members = None
+
+    def add(self, offset, size):
+        '''
+        Registers the member at offset (in the uncompressed tar archive).
+        '''
+        self.sizes[offset] = size
+
+    def read(self, offset):
+        '''
+        Returns the bytes of the member at offset. Each member can be read
+        once.
+        '''
+        if self.members is None:
+            # in order of offset, so the stream is decompressed in one pass
+            self.members = {}
+            with gzip.GzipFile(fileobj=io.BytesIO(self.compressed)) as f:
+                for o in sorted(self.sizes):
+                    f.seek(o)
+                    self.members[o] = f.read(self.sizes[o])
+            self.compressed = None
+        return self.members.pop(offset)
+
+
+def _load_signal_from_tgz_members(members):
+    '''
+    Loads a signal from its members of a .tgz archive, as collected by
+    load_recording_from_targz_stream: a dict of keyword of
+    load_signal_from_streams -> (data, binary), where data is the bytes of
+    the member or a function that reads them.
+    '''
+    streams = {}
+    for keyname, (data, binary) in members.items():
+        if callable(data):
+            data = data()
+        if binary:
+            streams[keyname] = io.BytesIO(data)
+        else:
+            streams[keyname] = io.StringIO(data.decode('utf-8'))
+    return load_signal_from_streams(**streams)
+
+
+NPY_RECORDING_FILE = 'recording.json'
+
+
+def _save_epochs_npy(epochs, directory, epoch_tables):
+    '''
+    Writes epochs to a compact binary table in directory, unless an equal
+    table was already written. epoch_tables is a list of (metadata, epochs)
+    for the tables written so far. Returns the number of the table.
+    '''
+    if epochs is None:
+        return None
+    for k, (_, other) in enumerate(epoch_tables):
+        if other is epochs or other.equals(epochs):
+            return k
+
+    k = len(epoch_tables)
+    basepath = os.path.join(directory, 'epochs.{}'.format(k))
+    codes, names = pd.factorize(epochs['name'])
+    np.save(basepath + '.npy', epochs[['start', 'end']].values.astype(float))
+    np.save(basepath + '.name.npy', codes.astype(np.int32))
+    other_columns = [c for c in epochs.columns
+                     if c not in ('start', 'end', 'name')]
+    md = {'file': 'epochs.{}'.format(k),
+          'columns': list(epochs.columns),
+          'names': names.tolist(),
+          'other': {c: epochs[c].tolist() for c in other_columns}}
+    epoch_tables.append((md, epochs))
+    return k
+
+
+def _load_epochs_npy(directory, md):
+    basepath = os.path.join(directory, md['file'])
+    bounds = np.load(basepath + '.npy')
+    codes = np.load(basepath + '.name.npy')
+    # code -1 (from factorize) is a missing name
+    names = np.array(md['names'] + [np.nan], dtype=object)[codes]
+    epochs = pd.DataFrame({'start': bounds[:, 0], 'end': bounds[:, 1],
+                           'name': names, **md['other']})
+    return epochs[md['columns']]
+
+
+def is_npy_recording(directory):
+    '''
+    True if directory holds a recording saved by Recording.save_npy.
+    '''
+    return os.path.isfile(os.path.join(directory, NPY_RECORDING_FILE))
+
+
+def load_recording_from_npy(directory, signals=None, mmap_mode='c'):
+    '''
+    Loads a recording saved by Recording.save_npy. Signal data are
+    memory-mapped copy-on-write (see np.load) so only the parts of the files
+    that are actually used get read from disk, and the files are never
+    changed. Use mmap_mode=None to read all data
+    into memory instead. If signals (a list of signal names) is given, the
+    other signals are left out.
+    '''
+    with open(os.path.join(directory, NPY_RECORDING_FILE), 'r') as md_fh:
+        md = json.load(md_fh)
+    if md.get('format') != 'nems.npy':
+        m = 'Not a binary recording directory: {}'.format(directory)
+        raise ValueError(m)
+
+    epoch_tables = [_load_epochs_npy(directory, e) for e in md['epochs']]
+    used = set()
+    loaded = {}
+    for i, js in enumerate(md['signals']):
+        if (signals is not None) and (js['name'] not in signals):
+            continue
+        k = js['epochs']
+        if k is None:
+            epochs = None
+        elif k in used:
+            # each signal gets its own copy, since epochs are sometimes
+            # edited in place
+            epochs = epoch_tables[k].copy()
+        else:
+            epochs = epoch_tables[k]
+            used.add(k)
+        filepath = os.path.join(directory, js['file'])
+        loaded[i] = load_signal_from_npy(filepath, js, epochs,
+                                         mmap_mode=mmap_mode)
+
+    signal_views = [{k: loaded[i] for k, i in view.items() if i in loaded}
+                    for view in md['views']]
+    return Recording(signals={}, meta=md['meta'], name=md['name'],
+                     signal_views=signal_views)
+
+
+def load_recording(uri, signals=None):
     '''
     Loads from a local .tgz file, a local directory, from s3,
     or from an HTTP URL containing a .tgz file. Examples:
@@ -1400,6 +1739,9 @@ def load_recording(uri):
     # Load the local tar gz directory.
     rec = Recording.load('file:///home/myuser/gus016c-a2.tgz')
 
+    # Load (memory-map) a directory saved by Recording.save_npy
+    rec = Recording.load('/home/myuser/gus016c-a2.nrec')
+
     # Load a tgz file served from a flat filesystem
     rec = Recording.load('http://potoroo/recordings/gus016c-a2.tgz')
 
@@ -1408,14 +1750,23 @@ def load_recording(uri):
 
     # Load from S3:
     rec = Recording.load('s3://nems.lbhb... TODO')
+
+    # Only load the stim and resp signals
+    rec = load_recording('/home/myuser/gus016c-a2.tgz',
+                         signals=['stim', 'resp'])
+
+    Signals are read the first time they are used, and signals left out of
+    the signals list (if given) are never read.
     '''
     if local_uri(uri):
         if targz_uri(uri):
-            rec = load_recording_from_targz(local_uri(uri))
+            rec = load_recording_from_targz(local_uri(uri), signals=signals)
+        elif is_npy_recording(local_uri(uri)):
+            rec = load_recording_from_npy(local_uri(uri), signals=signals)
         else:
-            rec = load_recording_from_dir(local_uri(uri))
+            rec = load_recording_from_dir(local_uri(uri), signals=signals)
     elif http_uri(uri):
-        rec = load_recording_from_url(http_uri(uri))
+        rec = load_recording_from_url(http_uri(uri), signals=signals)
     elif uri[0:6] == 's3://':
         raise NotImplementedError
     else:
@@ -1424,22 +1775,30 @@ def load_recording(uri):
 
     return rec
 
-def load_recording_from_dir(directory_or_targz):
+def load_recording_from_dir(directory_or_targz, signals=None, lazy=True):
     '''
     Loads all the signals (CSV/JSON pairs) found in DIRECTORY or
     .tgz file, and returns a Recording object containing all of them.
+    See load_recording_from_targz_stream for signals and lazy.
     '''
     if os.path.isdir(directory_or_targz):
         files = list_signals(directory_or_targz)
         basepaths = [os.path.join(directory_or_targz, f) for f in files]
-        signals = [load_signal(f) for f in basepaths]
-        signals_dict = {s.name: s for s in signals}
+        signals_dict = LazySignalDict()
+        for basepath in basepaths:
+            with open(basepath + '.json', 'r') as f:
+                js = json.load(f)
+            if (signals is not None) and (js['name'] not in signals):
+                continue
+            loader = functools.partial(load_signal, basepath)
+            dict.__setitem__(signals_dict, js['name'],
+                             _lazy_signal(js, loader, lazy))
         return Recording(signals=signals_dict)
     else:
         m = 'Not a directory: {}'.format(directory_or_targz)
         raise ValueError(m)
 
-def load_recording_from_url(url):
+def load_recording_from_url(url, signals=None):
     '''
     Loads the recording object from a URL. File must be tgz format.
     '''
@@ -1461,7 +1820,7 @@ def load_recording_from_url(url):
         log.error(m)
         raise Exception(m)
     obj = io.BytesIO(r.raw.read()) # Not sure why I need this!
-    return load_recording_from_targz_stream(obj)
+    return load_recording_from_targz_stream(obj, signals=signals)
 
 def load_recording_from_arrays(arrays, rec_name, fs, sig_names=None,
                      signal_kwargs={}):
@@ -10,10 +10,11 @@ import warnings
 
 import pandas as pd
 import numpy as np
+import scipy.sparse
 import h5py
 
 from nems.epoch import (remove_overlap, merge_epoch, epoch_contained,
-                        epoch_intersection, epoch_names_matching)
+                        epoch_intersection, epoch_names_matching, EpochIndex)
 
 log = logging.getLogger(__name__)
 
@@ -265,12 +266,32 @@ class SignalBase:
         '''
 
         self.epochs.to_csv(epoch_fh, sep=',', index=False)
+        json.dump(self._json_attributes(), md_fh)
+
+    def _json_attributes(self):
+        '''
+        Attributes saved to the JSON sidecar (everything except epochs).
+        '''
         attributes = self._get_attributes()
         del attributes['epochs']
-        attributes['segments'] = attributes['segments'].tolist()
-        attributes['norm_baseline'] = attributes['norm_baseline'].tolist()
-        attributes['norm_gain'] = attributes['norm_gain'].tolist()
-        json.dump(attributes, md_fh)
+        attributes['segments'] = np.asarray(attributes['segments']).tolist()
+        attributes['norm_baseline'] = np.asarray(attributes['norm_baseline']).tolist()
+        attributes['norm_gain'] = np.asarray(attributes['norm_gain']).tolist()
+        return attributes
+
+    def _save_data_to_npy(self, basepath):
+        '''
+        Save the data matrix of this signal as a raw .npy file (or one .npz
+        archive for signals holding a dictionary of arrays), which can be
+        memory-mapped when loading. Returns the path of the file.
+        '''
+        if isinstance(self._data, dict):
+            filepath = basepath + '.npz'
+            np.savez(filepath, **self._data)
+        else:
+            filepath = basepath + '.npy'
+            np.save(filepath, self.as_continuous())
+        return filepath
 
     def _save_metadata_to_dirpath(self, dirpath, fmt='%.18e'):
         # create files
@@ -307,6 +328,32 @@ class SignalBase:
         '''
         return copy.copy(self)
 
+    @property
+    def epoch_index(self):
+        '''
+        EpochIndex for the current epochs DataFrame. Built on first use and
+        cached until self.epochs is replaced or its name, start or end
+        columns are edited in place.
+        '''
+        if self.epochs is None:
+            m = "Signal does not have any epochs defined"
+            raise ValueError(m)
+        index = getattr(self, '_epoch_index', None)
+        if index is None or not index.is_current(self.epochs):
+            index = EpochIndex(self.epochs)
+            self._epoch_index = index
+        return index
+
+    def _share_epoch_index(self, sig):
+        '''
+        Hand the cached epoch index to a copy of this signal if the copy kept
+        the same epochs DataFrame.
+        '''
+        index = getattr(self, '_epoch_index', None)
+        if index is not None and index.is_current(sig.epochs):
+            sig._epoch_index = index
+        return sig
+
     def get_epoch_bounds(self, epoch, boundary_mode='exclude',
                          fix_overlap=None, overlapping_epoch=None, mask=None):
         '''
@@ -349,23 +396,14 @@ class SignalBase:
         '''
         # If string, pull the epochs out of the internal dataframe.
         if isinstance(epoch, str):
-            if self.epochs is None:
-                m = "Signal does not have any epochs defined"
-                raise ValueError(m)
-            _mask = self.epochs['name'] == epoch
-            bounds = self.epochs.loc[_mask, ['start', 'end']].values
-            bounds = np.round(bounds.astype(float) * self.fs) / self.fs
+            bounds = self.epoch_index.bounds(epoch)
+            bounds = np.round(bounds * self.fs) / self.fs
         elif isinstance(epoch, list):
             # list of strings
-            if self.epochs is None:
-                m = "Signal does not have any epochs defined"
-                raise ValueError(m)
-            bounds = np.zeros((0,2))
-            for e in epoch:
-                _mask = self.epochs['name'] == e
-                _bounds = self.epochs.loc[_mask, ['start', 'end']].values
-                _bounds = np.round(_bounds.astype(float) * self.fs) / self.fs
-                bounds = np.concatenate((bounds, _bounds), axis=0)
+            index = self.epoch_index
+            bounds = [np.zeros((0, 2))] + [index.bounds(e) for e in epoch]
+            bounds = np.concatenate(bounds, axis=0)
+            bounds = np.round(bounds * self.fs) / self.fs
 
         elif isinstance(epoch, pd.core.series.Series):
             bounds = self.epochs.loc[epoch, ['start', 'end']].values
@@ -458,6 +496,119 @@ class SignalBase:
         '''
         bounds = self.get_epoch_bounds(epoch, boundary_mode, fix_overlap,
                                        overlapping_epoch)
+        segments = np.asarray(self.segments, dtype=float)
+        if len(bounds) and (segments.ndim == 2) and (len(segments) > 0) and \
+                np.all(segments[:, 0] < segments[:, 1]) and \
+                np.all(segments[:-1, 1] <= segments[1:, 0]):
+            indices = self._segment_indices(np.asarray(bounds, dtype=float),
+                                            segments)
+        else:
+            indices = self._segment_indices_loop(bounds)
+
+        # exclude segments without data
+        if (indices.size != 0) & allow_incomplete:
+            zero_data_mask = (indices[:, 0] - indices[:, 1])!=0
+            indices = indices[zero_data_mask, :]
+
+        if mask is not None:
+            # remove instances of the epoch that do not fall in the mask
+            if indices.size == 0:
+                return np.zeros((0, 2), dtype='i')
+
+            if isinstance(mask, IntervalMask):
+                keep = mask.contains(indices[:, 0], indices[:, 1])
+            else:
+                # epochs entirely inside the mask, found with a cumulative
+                # count of masked-in samples instead of testing each epoch
+                # separately
+                m_in = mask.as_continuous()[0] != 0
+                n_in = np.concatenate(([0], np.cumsum(m_in)))
+                lb = indices[:, 0]
+                ub = np.minimum(indices[:, 1], len(m_in))
+                keep = ((ub <= lb) | (n_in[ub] - n_in[lb] == ub - lb)) & m_in[lb]
+
+            # get a "reference epoch mask" for safety checking below
+            standard_mask = None
+
+            candidates = np.flatnonzero(~keep) if allow_incomplete else []
+            if len(candidates):
+                m_data = mask.as_continuous()
+            for i in candidates:
+                lb, ub = indices[i]
+                if np.sum(m_data[0, lb:ub]) > 0:
+                    # "safety" checks
+                    if standard_mask is None:
+                        standard_mask = m_data[0, lb:ub]
+                    if (m_data[0, lb:ub].sum()!=standard_mask.sum()):
+                        raise ValueError("For allow_incomplete=True, masks must all be the same size on each epoch")
+                    #if (m_data[0, lb:ub].shape!=standard_mask.shape):
+                    #    raise ValueError("For allow_incomplete=True, epochs must all be the same size")
+                    #if  ~np.all(m_data[0, lb:ub] == standard_mask):
+                    #    raise ValueError("Mask must be identical on each epoch when using allow_incomplete=True")
+
+                    # define new indices
+                    idx = np.where(m_data[0, lb:ub])
+                    lb_partial = lb + idx[0][0]
+                    ub_partial = lb + idx[0][-1] + 1
+                    # check to make sure all True in this new range (i.e. can't extract non-continuous chunks of an epoch)
+                    if np.all(m_data[0, lb_partial:ub_partial]):
+                        keep[i] = True
+                        indices[i, :] = [lb_partial, ub_partial]
+
+            indices = indices[keep]
+
+        return indices
+
+    def _segment_indices(self, bounds, segments):
+        '''
+        Convert epoch bounds (in seconds) to indices into the segmented data.
+        Vectorized version of _segment_indices_loop for the usual case of
+        segments that are sorted and do not overlap.
+        '''
+        s_lb, s_ub = segments[:, 0], segments[:, 1]
+        e_lb, e_ub = bounds[:, 0], bounds[:, 1]
+        n_segments = len(segments)
+
+        # segment the epoch starts in (at most one, since segments are
+        # disjoint) ...
+        k = np.searchsorted(s_lb, e_lb, side='right') - 1
+        starts_in = (k >= 0) & (e_lb < s_ub[np.maximum(k, 0)])
+        # ... and the contiguous run of segments j..m that the epoch spans
+        j = np.searchsorted(s_lb, e_lb, side='left')
+        m = np.searchsorted(s_ub, e_ub, side='right') - 1
+        m[np.isnan(e_ub)] = -1
+
+        # the loop version keeps a cursor on the current segment and assigns
+        # each epoch to the first matching segment at or after the cursor. It
+        # stops at the first epoch with no such segment.
+        first = np.where(starts_in, k, j)
+        last = np.where(starts_in, np.maximum(k, m), m)
+        first[~starts_in & (j > m)] = n_segments
+        seg = np.maximum.accumulate(first)
+        stop = np.flatnonzero(seg > last)
+        n = stop[0] if len(stop) else len(bounds)
+        if n == 0:
+            return np.asarray([], dtype='i')
+        seg, e_lb, e_ub = seg[:n], e_lb[:n], e_ub[:n]
+
+        # Be sure to round otherwise an index of 1.999...999 will get
+        # converted to 1 rather than 2.
+        lengths = np.round((s_ub - s_lb) * self.fs)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[seg]
+        s_lb, s_ub = s_lb[seg], s_ub[seg]
+        spans = (e_lb <= s_lb) & (e_ub >= s_ub)
+        lb = np.where(spans, 0, np.round((e_lb - s_lb) * self.fs))
+        ub = np.where(spans, lengths[seg],
+                      np.round((np.minimum(e_ub, s_ub) - s_lb) * self.fs))
+        indices = np.stack((lb, ub), axis=1) + offsets[:, np.newaxis]
+        return indices.astype('i')
+
+    def _segment_indices_loop(self, bounds):
+        '''
+        Convert epoch bounds (in seconds) to indices into the segmented data
+        by walking through segments and epochs together. Works for any
+        segments; see _segment_indices.
+        '''
         # Indices of segments and epochs
         s = 0
         e = 0
@@ -508,54 +659,8 @@ class SignalBase:
                     break
                 if e >= n_epochs:
                     break
-        
-        indices = np.asarray(indices, dtype='i')  
-        
-        # exclude segments without data
-        if (indices.size != 0) & allow_incomplete:
-            zero_data_mask = (indices[:, 0] - indices[:, 1])!=0
-            indices = indices[zero_data_mask, :]
 
-        if mask is not None:
-            # remove instances of the epoch that do not fall in the mask
-            m_data = mask.as_continuous()
-
-            # get a "reference epoch mask" for safety checking below
-            standard_mask = None 
-
-            keepidx = []
-            for i, (lb, ub) in enumerate(indices):
-                #                samples = ub-lb
-                if np.all(m_data[0, lb:ub]) & np.all(m_data[0, lb]):
-                    keepidx.append(i)
-            
-                elif (np.sum(m_data[0, lb:ub]) > 0) & allow_incomplete:
-                    # "safety" checks
-                    if standard_mask is None:
-                        standard_mask = m_data[0, lb:ub]
-                    if (m_data[0, lb:ub].sum()!=standard_mask.sum()):
-                        raise ValueError("For allow_incomplete=True, masks must all be the same size on each epoch")
-                    #if (m_data[0, lb:ub].shape!=standard_mask.shape):
-                    #    raise ValueError("For allow_incomplete=True, epochs must all be the same size")
-                    #if  ~np.all(m_data[0, lb:ub] == standard_mask):
-                    #    raise ValueError("Mask must be identical on each epoch when using allow_incomplete=True")
-
-                    # define new indices
-                    idx = np.where(m_data[0, lb:ub])
-                    lb_partial = lb + idx[0][0]
-                    ub_partial = lb + idx[0][-1] + 1
-                    # check to make sure all True in this new range (i.e. can't extract non-continuous chunks of an epoch)
-                    if np.all(m_data[0, lb_partial:ub_partial]):
-                        keepidx.append(i)
-                        indices[i, :] = [lb_partial, ub_partial]
-
-            if len(keepidx) > 0:
-                keepidx = np.array(keepidx)
-                indices = indices[keepidx]
-            else:
-                indices = np.zeros((0,2), dtype='i')
-
-        return indices
+        return np.asarray(indices, dtype='i')
 
     def reset_segmented_epochs(self):
         epochs = np.unique(self.epochs.name)
@@ -851,6 +956,11 @@ class SignalBase:
                       overlapping_epoch=None, mask=None):
         raise NotImplementedError
 
+    def extract_epoch_block(self, epoch_names, boundary_mode='exclude',
+                            fix_overlap='first', overlapping_epoch=None,
+                            mask=None, allow_incomplete=False, copy=True):
+        raise NotImplementedError
+
     def remove_epochs(self, mask):
         """
         delete epochs falling in False region of mask signal.
@@ -865,12 +975,17 @@ class SignalBase:
         temp_epochs['start'] = (temp_epochs['start'] * fs).astype(int)
         temp_epochs['end'] = (temp_epochs['end'] * fs).astype(int)
 
-        new_mask = np.full(len(temp_epochs), False)
-        mask_data = mask._data[0]
+        if isinstance(mask, IntervalMask):
+            start = temp_epochs['start'].values
+            end = np.minimum(temp_epochs['end'].values, mask.ntimes)
+            new_mask = (end <= start) | mask.contains(start, end)
+        else:
+            new_mask = np.full(len(temp_epochs), False)
+            mask_data = mask._data[0]
 
-        for idx, (start, end) in enumerate(temp_epochs[['start', 'end']].values):
-            if mask_data[start:end].all():
-                new_mask[idx] = True
+            for idx, (start, end) in enumerate(temp_epochs[['start', 'end']].values):
+                if mask_data[start:end].all():
+                    new_mask[idx] = True
 
         signal.epochs = self.epochs.loc[new_mask]
         return signal
@@ -940,37 +1055,23 @@ class SignalBase:
         TODO: add channel selection option?
         """
 
-        # create dictionary of extracted epochs
-        folded_signal = self.extract_epochs(
-                epoch_names, overlapping_epoch=overlapping_epoch, mask=mask)
-        if type(epoch_names) is list:
-            keys = epoch_names
-        else:
-            keys = list(folded_signal.keys())
-            keys.sort()
+        # extract all occurrences of all epochs at once
+        epoch_data, index = self.extract_epoch_block(
+            epoch_names, overlapping_epoch=overlapping_epoch, mask=mask)
+        if type(epoch_names) is not list:
+            index = index.loc[index['count'] > 0]
 
-        reps = []
-        chans = []
-        lens = []
-        for k in keys:
-            if k in folded_signal.keys():
-                reps.append(folded_signal[k].shape[0])
-                chans.append(folded_signal[k].shape[1])
-                lens.append(folded_signal[k].shape[2])
-            else:
-                reps.append(0)
-                chans.append(0)
-                lens.append(0)
-
-        max_rep = np.max(np.array(reps))
-        max_chan = np.max(np.array(chans))
-        max_len = np.max(np.array(lens))
-        d = np.empty((len(keys),max_rep,max_chan,max_len))
+        max_rep = np.max(index['count'].values)
+        max_chan = epoch_data.shape[1] if max_rep > 0 else 0
+        max_len = np.max(index['length'].values)
+        d = np.empty((len(index),max_rep,max_chan,max_len))
         d[:] = np.nan
 
-        for i, k in enumerate(keys):
-            if k in folded_signal.keys():
-                d[i,:reps[i],:chans[i],:lens[i]]=folded_signal[k]
+        for i, (k, offset, count, length) in enumerate(
+                index.itertuples(index=False)):
+            if count > 0:
+                d[i, :count, :, :length] = \
+                    epoch_data[offset:offset+count, :, :length]
 
         return d
 
@@ -1156,7 +1257,8 @@ class RasterizedSignal(SignalBase):
         '''
         attributes = self._get_attributes()
         attributes.update(kwargs)
-        return RasterizedSignal(data=data, safety_checks=False, **attributes)
+        sig = RasterizedSignal(data=data, safety_checks=False, **attributes)
+        return self._share_epoch_index(sig)
 
     def extract_epoch(self, epoch, boundary_mode='exclude',
                       fix_overlap='first', allow_empty=False,
@@ -1175,8 +1277,8 @@ class RasterizedSignal(SignalBase):
             allow_empty: if true, returns empty matrix if no valid epoch
             matches. otherwise, throw error when this happens
 
-        boundary_mode, fix_overlap: parameters passed through to
-            get_epoch_indices
+        boundary_mode, fix_overlap, overlapping_epoch: parameters passed
+            through to get_epoch_indices
 
         allow_empty: {False, boolean}
 
@@ -1201,6 +1303,7 @@ class RasterizedSignal(SignalBase):
             epoch_indices = self.get_epoch_indices(epoch,
                                                    boundary_mode=boundary_mode,
                                                    fix_overlap=fix_overlap,
+                                                   overlapping_epoch=overlapping_epoch,
                                                    mask=mask,
                                                    allow_incomplete=allow_incomplete)
         else:
@@ -1214,31 +1317,125 @@ class RasterizedSignal(SignalBase):
                                  "In signal: %s", epoch, self.name)
 
         n_samples = np.max(epoch_indices[:, 1]-epoch_indices[:, 0])
-        n_epochs = len(epoch_indices)
+        return self._gather_epochs(epoch_indices, n_samples)
 
+    def _gather_epochs(self, epoch_indices, n_samples, copy=True):
+        '''
+        Copies the data between each (lb, ub) pair in epoch_indices into an
+        array of shape (occurrence, chan, n_samples), padded with NaN (False
+        for boolean data). Index ranges running past the end of the data are
+        truncated.
+
+        If copy is False and every occurrence is n_samples long and starts a
+        fixed number of samples after the previous one (e.g. back-to-back
+        trials), a read-only strided view of the data is returned instead.
+        '''
         data = self.as_continuous()
-        n_chans = data.shape[0]
+        epoch_indices = np.asarray(epoch_indices)
+        lb = epoch_indices[:, 0].astype(int)
+        ub = np.minimum(epoch_indices[:, 1], data.shape[-1]).astype(int)
+        if np.any(lb < 0) or np.any(ub < lb):
+            raise ValueError('Trying to extract invalid range from signal for epoch (out of bounds or negative duration?).')
+
         if data.dtype == bool:
-            epoch_data = np.full((n_epochs, n_chans, n_samples), False,
-                                 dtype=bool)
+            fill = False
         else:
-            epoch_data = np.full((n_epochs, n_chans, n_samples), np.nan)
-        # print(epoch)
-
-        for i, (lb, ub) in enumerate(epoch_indices):
-            if ub > data.shape[-1]:
-                ub = data.shape[-1]
-            samples = ub-lb
-            #print(samples)
-            #print([lb, ub])
-            #print(data[..., lb:ub].shape)
-            #print(epoch_data[i, ..., :samples].shape)
-            try:
-                epoch_data[i, ..., :samples] = data[..., lb:ub]
-            except:
-                raise ValueError('Trying to extract invalid range from signal for epoch (out of bounds or negative duration?).')
+            fill = np.nan
+            data = data.astype(float, copy=False)
+
+        if not copy and np.all(ub - lb == n_samples):
+            step = np.diff(lb)
+            if len(lb) == 1 or (step[0] >= 0 and np.all(step == step[0])):
+                step = step[0] if len(step) else 0
+                t_stride = data.strides[-1]
+                return np.lib.stride_tricks.as_strided(
+                    data[:, lb[0]:], shape=(len(lb), data.shape[0], n_samples),
+                    strides=(step * t_stride, data.strides[0], t_stride),
+                    writeable=False)
+
+        # gather all occurrences with one fancy index into a (time, chan,
+        # sample) view of sliding windows over the data
+        n_epochs, n_chans, n_times = len(lb), data.shape[0], data.shape[-1]
+        epoch_data = np.empty((n_epochs, n_chans, n_samples), dtype=data.dtype)
+        fits = lb <= n_times - n_samples
+        if np.any(fits):
+            windows = np.lib.stride_tricks.sliding_window_view(
+                data, n_samples, axis=-1)
+            epoch_data[fits] = windows.transpose(1, 0, 2)[lb[fits]]
+        for i in np.flatnonzero(~fits):
+            # windows running past the end of the data
+            epoch_data[i, :, :ub[i]-lb[i]] = data[:, lb[i]:ub[i]]
+
+        # pad the occurrences that are shorter than n_samples
+        short = np.flatnonzero(ub - lb < n_samples)
+        if len(short):
+            pad = np.arange(n_samples) >= (ub - lb)[short, np.newaxis]
+            sub = epoch_data[short]
+            sub[np.broadcast_to(pad[:, np.newaxis, :], sub.shape)] = fill
+            epoch_data[short] = sub
         return epoch_data
 
+    def extract_epoch_block(self, epoch_names, boundary_mode='exclude',
+                            fix_overlap='first', overlapping_epoch=None,
+                            mask=None, allow_incomplete=False, copy=True):
+        '''
+        Extracts all occurrences of several epochs into one array.
+
+        Parameters
+        ----------
+        epoch_names : list OR string
+            if list, list of epoch names to extract.
+            if string, will find matches via nems.epoch.epoch_names_matching
+        boundary_mode, fix_overlap, overlapping_epoch, mask, allow_incomplete :
+            passed through to get_epoch_indices for each epoch name, as in
+            extract_epoch
+        copy : {True, False}
+            If False, return a read-only strided view of the signal data
+            instead of a copy when that's possible (all occurrences have the
+            same length and are evenly spaced, e.g. a single epoch name with
+            back-to-back trials). The view keeps the dtype of the signal
+            data.
+
+        Returns
+        -------
+        epoch_data : 3D array
+            Array of shape O, C, T where O is the total number of occurrences
+            of all epochs, C is the number of channels, and T is the maximum
+            length of any occurrence in samples. Occurrences of each epoch are
+            stored together, in the order of epoch_names, and shorter
+            occurrences are padded with NaN.
+        index : DataFrame
+            One row per epoch name with columns 'name', 'offset', 'count' and
+            'length'. The occurrences of epoch name are
+            epoch_data[offset:offset+count, :, :length], which matches
+            extract_epoch(name).
+        '''
+        if type(epoch_names) is str:
+            epoch_names = epoch_names_matching(self.epochs, epoch_names)
+
+        indices = [self.get_epoch_indices(name, boundary_mode=boundary_mode,
+                                          fix_overlap=fix_overlap,
+                                          overlapping_epoch=overlapping_epoch,
+                                          mask=mask,
+                                          allow_incomplete=allow_incomplete)
+                   for name in epoch_names]
+        counts = np.array([len(i) for i in indices], dtype=int)
+        lengths = np.array([np.max(i[:, 1] - i[:, 0]) if len(i) else 0
+                            for i in indices], dtype=int)
+        index = pd.DataFrame({
+            'name': list(epoch_names),
+            'offset': np.cumsum(counts) - counts,
+            'count': counts,
+            'length': lengths,
+        })
+
+        n_samples = int(np.max(lengths)) if len(lengths) else 0
+        indices = [i for i in indices if len(i)]
+        if not indices:
+            return np.empty([0, self.nchans, 0]), index
+        indices = np.concatenate(indices, axis=0)
+        return self._gather_epochs(indices, n_samples, copy=copy), index
+
     def normalize(self, normalization='minmax'):
         '''
         Returns a copy of this signal with each channel normalized to have a
@@ -1384,23 +1581,19 @@ class RasterizedSignal(SignalBase):
         data = self.as_continuous().copy()
 #        sig_valid_start = np.sum(np.isfinite(data[0,:]))
 
-        mask = np.zeros_like(data, dtype=np.bool)
-        mask2 = np.zeros_like(data, dtype=np.bool)
-
-        for ep in epochs:
-            lb, ub = ep
-            mask2[:,lb:ub]=1
-
-        for idx in idx_data[jack_idx].tolist():
-            if idx < occurrences:
-                lb, ub = epochs[idx]
-                mask[:, lb:ub] = 1
-
-        if invert:
-            mask = ~mask
+        # keep the samples in any epoch, minus those in this jackknife's
+        # epochs (or only those, if inverting), and NaN out the rest
+        jidx = [idx for idx in idx_data[jack_idx].tolist() if idx < occurrences]
+        in_epochs = _normalize_intervals(epochs, self.ntimes)
+        in_jack = _normalize_intervals(epochs[jidx], self.ntimes)
+        if not invert:
+            in_jack = _invert_intervals(in_jack, self.ntimes)
+        nan_intervals = np.concatenate((
+            _invert_intervals(in_epochs, self.ntimes),
+            _invert_intervals(in_jack, self.ntimes)))
 
-        data[mask] = np.nan
-        data[~mask2] = np.nan
+        for lb, ub in nan_intervals:
+            data[:, lb:ub] = np.nan
 
         return self._modified_copy(data)
 
@@ -1969,7 +2162,11 @@ class RasterizedSignal(SignalBase):
         :return: copy of self with nan mask applied
         """
         m = self.as_continuous().copy()
-        m[:, mask._data[0, :] == False] = np.nan
+        if isinstance(mask, IntervalMask):
+            for lb, ub in _invert_intervals(mask.intervals, mask.ntimes):
+                m[:, lb:ub] = np.nan
+        else:
+            m[:, mask._data[0, :] == False] = np.nan
         if remove_epochs:
             return self._modified_copy(m).remove_epochs(mask)
         else:
@@ -2021,6 +2218,251 @@ class RasterizedSignal(SignalBase):
             return self._data[:, mask.as_continuous()[0, :]]
 
 
+class IntervalMask(RasterizedSignal):
+    '''
+    Boolean, single channel mask signal stored as the [start, end) sample
+    intervals where it is True, rather than as a (1, T) boolean array.
+
+    An IntervalMask can be used wherever a mask signal is accepted. Set
+    operations (union, intersect, invert) work on the interval lists, and
+    Recording.apply_mask/nan_mask, remove_epochs and
+    get_epoch_indices(mask=...) read the intervals directly. Code that asks
+    for the data (as_continuous, _data) gets a dense boolean array built on
+    demand, and a modified copy with 1-channel boolean data is again an
+    IntervalMask. Saved masks are written (and load back) as regular
+    RasterizedSignals.
+    '''
+
+    def __init__(self, fs, intervals, ntimes, name, recording, chans=None,
+                 epochs=None, segments=None, meta=None, safety_checks=True,
+                 normalization='none', **other_attributes):
+        '''
+        Parameters
+        ----------
+        intervals : Nx2 array of [start, end) sample indices where the mask
+            is True. They are sorted and merged, and clipped to ntimes.
+        ntimes : number of samples in the mask
+        '''
+        self.fs = fs
+        self.name = name
+        self.recording = recording
+        self.chans = chans
+        self.epochs = epochs
+        self.meta = meta
+        self.signal_type = str(RasterizedSignal)
+        self.normalization = normalization
+        self.norm_baseline = np.array([[0]])
+        self.norm_gain = np.array([[1]])
+        self.nchans = 1
+        self.ntimes = int(ntimes)
+        self.intervals = _normalize_intervals(intervals, self.ntimes)
+
+        if segments is None:
+            segments = np.array([[0, self.ntimes]])
+        self.segments = segments
+
+        if epochs is None:
+            self.add_epoch("SIGNAL", np.array([[0, self.ntimes/self.fs]]))
+
+        self.iloc = SimpleSignalIndexer(self)
+        self.loc = LabelSignalIndexer(self)
+
+        if safety_checks:
+            self._run_safety_checks()
+
+    @classmethod
+    def from_array(cls, fs, data, name, recording, **kwargs):
+        '''
+        IntervalMask that is True wherever data (T or 1xT array) is nonzero.
+        '''
+        data = np.asarray(data)
+        ntimes = data.shape[-1]
+        return cls(fs, _intervals_from_array(data.reshape(-1)), ntimes,
+                   name, recording, **kwargs)
+
+    @classmethod
+    def from_signal(cls, signal, epoch=True):
+        '''
+        IntervalMask with the attributes (fs, epochs, etc.) of signal that
+        is True for epoch. See SignalBase.generate_epoch_mask for the
+        formats of epoch.
+        '''
+        attributes = signal._get_attributes()
+        del attributes['signal_type']
+        mask = cls(intervals=np.zeros((0, 2), dtype=np.int64),
+                   ntimes=signal.ntimes, safety_checks=False, **attributes)
+        mask = signal._share_epoch_index(mask)
+        return mask._interval_copy(mask.epoch_intervals(epoch))
+
+    @classmethod
+    def from_mask(cls, mask):
+        '''
+        Returns mask (a boolean mask signal) as an IntervalMask.
+        '''
+        if isinstance(mask, IntervalMask):
+            return mask
+        return cls.from_signal(mask, None)._interval_copy(
+                _intervals_from_array(mask.as_continuous()[0]))
+
+    @property
+    def _data(self):
+        # +1 at each start and -1 at each end (merged intervals never share
+        # a boundary), so the running sum is 1 inside the mask
+        marks = np.zeros(self.ntimes + 1, dtype=np.int8)
+        marks[self.intervals[:, 0]] = 1
+        marks[self.intervals[:, 1]] = -1
+        data = np.cumsum(marks[:-1]).astype(bool)[np.newaxis, :]
+        data.flags.writeable = False
+        return data
+
+    def _modified_copy(self, data, **kwargs):
+        '''
+        For internal use when making various immutable copies of this signal.
+        Returns an IntervalMask if data is boolean with one channel and a
+        RasterizedSignal otherwise.
+        '''
+        attributes = self._get_attributes()
+        attributes.update(kwargs)
+        if (data.dtype == bool) and (data.ndim == 2) and (data.shape[0] == 1):
+            del attributes['signal_type']
+            sig = IntervalMask(intervals=_intervals_from_array(data[0]),
+                               ntimes=data.shape[1], safety_checks=False,
+                               **attributes)
+        else:
+            sig = RasterizedSignal(data=data, safety_checks=False, **attributes)
+        return self._share_epoch_index(sig)
+
+    def _interval_copy(self, intervals, ntimes=None, **kwargs):
+        sig = copy.copy(self)
+        for k, v in kwargs.items():
+            setattr(sig, k, v)
+        if ntimes is not None:
+            sig.ntimes = int(ntimes)
+        sig.intervals = _normalize_intervals(intervals, sig.ntimes)
+        return sig
+
+    def epoch_intervals(self, epoch=True):
+        '''
+        Intervals where generate_epoch_mask(epoch) is True, without building
+        the mask.
+        '''
+        if (epoch is None) or (epoch is False):
+            return np.zeros((0, 2), dtype=np.int64)
+        elif type(epoch) is str:
+            return self.get_epoch_indices(epoch).reshape(-1, 2)
+        elif (type(epoch) is list) and (type(epoch[0]) is tuple):
+            return np.array(epoch)
+        elif (type(epoch) is list) and (type(epoch[0]) is str):
+            return np.concatenate([self.get_epoch_indices(e).reshape(-1, 2)
+                                   for e in epoch])
+        elif (type(epoch) is np.ndarray) and (epoch.ndim == 2):
+            return epoch
+        elif (type(epoch) is np.ndarray) and (epoch.ndim == 1):
+            return _intervals_from_array(self.generate_epoch_mask(epoch)[0])
+        elif epoch == True:
+            return np.array([[0, self.ntimes]])
+        else:
+            raise RuntimeError('Invalid epoch passed to generate_epoch_mask')
+
+    def all_true(self):
+        return (self.ntimes == 0) or ((len(self.intervals) == 1) and
+                                      (self.intervals[0, 0] == 0) and
+                                      (self.intervals[0, 1] == self.ntimes))
+
+    def invert(self):
+        '''
+        Mask that is True where this one is False.
+        '''
+        return self._interval_copy(_invert_intervals(self.intervals,
+                                                     self.ntimes))
+
+    def union(self, other):
+        '''
+        Mask that is True where either mask is True. other may be another
+        mask signal or an Nx2 array of intervals.
+        '''
+        return self._interval_copy(np.concatenate(
+                (self.intervals, _as_intervals(other))))
+
+    def intersect(self, other):
+        '''
+        Mask that is True where both masks are True. other may be another
+        mask signal or an Nx2 array of intervals.
+        '''
+        other = _normalize_intervals(_as_intervals(other), self.ntimes)
+        # complement of the union of the complements
+        outside = np.concatenate((_invert_intervals(self.intervals, self.ntimes),
+                                  _invert_intervals(other, self.ntimes)))
+        outside = _normalize_intervals(outside, self.ntimes)
+        return self._interval_copy(_invert_intervals(outside, self.ntimes))
+
+    def contains(self, lb, ub):
+        '''
+        For arrays of sample bounds lb, ub, True where [lb, ub) lies entirely
+        within the mask (and lb itself is in the mask). Bounds past the end
+        of the mask are clipped.
+        '''
+        lb = np.asarray(lb)
+        ub = np.minimum(ub, self.ntimes)
+        starts, ends = self.intervals[:, 0], self.intervals[:, 1]
+        k = np.searchsorted(starts, lb, side='right') - 1
+        ends_k = ends[np.maximum(k, 0)] if len(ends) else np.zeros_like(lb)
+        inside = (k >= 0) & (lb < ends_k)
+        return inside & ((ub <= lb) | (ub <= ends_k))
+
+    def rank_intervals(self, lb, ub):
+        '''
+        Intervals holding the lb-th to (ub-1)-th True samples of the mask
+        (counting from 0).
+        '''
+        return _intervals_by_rank(self.intervals, lb, ub)
+
+    def select_times(self, times, padding=0):
+
+        if padding != 0:
+            raise NotImplementedError    # TODO
+
+        times = np.asarray(times)
+        indices = np.round(times*self.fs).astype('i')
+        new_intervals = []
+        offset = 0
+        for lb, ub in indices:
+            lb, ub = max(lb, 0), min(ub, self.ntimes)
+            if ub <= lb:
+                continue
+            first = np.searchsorted(self.intervals[:, 1], lb, side='right')
+            last = np.searchsorted(self.intervals[:, 0], ub, side='left')
+            within = np.clip(self.intervals[first:last], lb, ub)
+            new_intervals.append(within - lb + offset)
+            offset += ub - lb
+        if new_intervals:
+            new_intervals = np.concatenate(new_intervals)
+        return self._interval_copy(new_intervals, ntimes=offset,
+                                   segments=times)
+
+    @classmethod
+    def concatenate_time(cls, signals):
+        '''
+        Combines the masks along the time axis.
+        '''
+        for signal in signals:
+            if not isinstance(signal, cls):
+                return RasterizedSignal.concatenate_time(signals)
+        base = signals[0]
+        for signal in signals[1:]:
+            if not base.fs == signal.fs:
+                raise ValueError('Cannot concat signals with unequal fs')
+
+        offsets = np.cumsum([0] + [s.ntimes for s in signals])
+        intervals = np.concatenate([s.intervals + o for s, o in
+                                    zip(signals, offsets)])
+        epochs = cls._merge_epochs(signals)
+
+        return cls(fs=base.fs, intervals=intervals, ntimes=offsets[-1],
+                   name=base.name, recording=base.recording, chans=base.chans,
+                   meta=base.meta, epochs=epochs, safety_checks=False)
+
+
 class PointProcess(SignalBase):
     '''
     Expects data to be a dictionary of the form:
@@ -2067,20 +2509,15 @@ class PointProcess(SignalBase):
         """
         attributes = self._get_attributes()
         attributes.update(kwargs)
-        return PointProcess(data=data, safety_checks=False, **attributes)
-
+        sig = PointProcess(data=data, safety_checks=False, **attributes)
+        return self._share_epoch_index(sig)
 
-    def rasterize(self, fs=None):
-        """
-        convert list of spike times to a raster of spike rate, with duration
-        matching max end time in the event_times list
-
-        by default, fs=self.fs, which can be preset to match other signals in a
-        recording
-        """
-        if not fs:
-            fs = self.fs
 
+    def _raster_length(self, fs):
+        '''
+        Number of time bins in a raster of this signal at fs: up to the end
+        of the last epoch, or of the last event if there are no epochs.
+        '''
         if self.epochs is not None:
             max_epoch_time = self.epochs["end"].max()
         else:
@@ -2092,18 +2529,38 @@ class PointProcess(SignalBase):
         else:
             max_time=max_epoch_time
 
-        max_bin = np.int(np.round(fs*max_time))
-        unit_count = len(self._data.keys())
-        raster = np.zeros([unit_count, max_bin])
+        return int(np.round(fs*max_time))
+
+    def rasterize(self, fs=None, sparse=False):
+        """
+        convert list of spike times to a raster of spike rate, with duration
+        matching max end time in the event_times list
+
+        by default, fs=self.fs, which can be preset to match other signals in a
+        recording
+
+        if sparse is True, returns a SparseRasterizedSignal (spike counts in
+        a scipy.sparse CSR matrix) instead of a dense RasterizedSignal.
+        """
+        if not fs:
+            fs = self.fs
+
+        if sparse:
+            attributes = self._get_attributes()
+            del attributes['signal_type']
+            attributes['fs'] = fs
+            sig = SparseRasterizedSignal(data=self._data, safety_checks=False,
+                                         **attributes)
+            return self._share_epoch_index(sig)
+
+        max_bin = self._raster_length(fs)
 
         # _data dictionary has one entry per cell.
         # The output raster should be cell X time
-        cellids = sorted(self._data)
-        for i, key in enumerate(cellids):
-            for t in self._data[key]:
-                b = int(np.floor(t*fs))
-                if b < max_bin:
-                    raster[i, b] += 1
+        cellids, rows, bins = _spike_bins(self._data, fs, max_bin)
+        raster = np.zeros([len(cellids), max_bin])
+        index, counts = np.unique(rows * max_bin + bins, return_counts=True)
+        raster.ravel()[index] = counts
 
         return RasterizedSignal(fs=fs, data=raster, name=self.name,
                                 recording=self.recording, chans=cellids,
@@ -2227,7 +2684,7 @@ class PointProcess(SignalBase):
         offset = 0
         for signal in signals:
             if offset==0:
-                data=signal._data
+                data=dict(signal._data)
             else:
                 cellids = sorted(signal._data)
                 for i, key in enumerate(cellids):
@@ -2241,7 +2698,7 @@ class PointProcess(SignalBase):
         # basically do the same thing for epochs, using the Base routine
         epochs = _merge_epochs(signals)
 
-        return PointProcess(
+        return type(base)(
             name=base.name,
             recording=base.recording,
             chans=base.chans,
@@ -2284,7 +2741,7 @@ class PointProcess(SignalBase):
         # basically do the same thing for epochs, using the Base routine
         epochs = _merge_epochs([self,new_signal])
 
-        return PointProcess(
+        return type(self)(
             name=self.name,
             recording=self.recording,
             chans=self.chans,
@@ -2344,8 +2801,8 @@ class PointProcess(SignalBase):
             epoch_bounds = self.get_epoch_bounds(epoch,
                                                   boundary_mode=boundary_mode,
                                                   fix_overlap=fix_overlap,
-                                                  mask=mask, 
-                                                  allow_incomplete=allow_incomplete)
+                                                  overlapping_epoch=overlapping_epoch,
+                                                  mask=mask)
         else:
             epoch_bounds = epoch
 
@@ -2356,18 +2813,191 @@ class PointProcess(SignalBase):
                 raise IndexError("No matching epochs to extract for: %s\n"
                                  "In signal: %s", epoch, self.name)
 
+        epoch_bounds = np.asarray(epoch_bounds, dtype=float)
+        lb = epoch_bounds[:, 0]
+        ub = epoch_bounds[:, 1]
         epoch_data = dict()
 
-        for j, c in enumerate(self._data.keys()):
-            epoch_data[c] = np.zeros((0, 2))
-            d = np.array([])
-            t = np.array([])
-            for i, (lb, ub) in enumerate(epoch_bounds):
-                _d = self._data[c][(self._data[c] >= lb) & (self._data[c] < ub)] - lb
-                d = np.append(d, _d)
-                t = np.append(t, np.full_like(_d, i))
-            epoch_data[c] = np.concatenate((np.expand_dims(t,1), np.expand_dims(d,1)), axis=1)
+        for c in self._data.keys():
+            # events in [lb, ub) of every occurrence, found by searching the
+            # sorted event times, in their original order within each one
+            times = np.asarray(self._data[c])
+            order = np.argsort(times, kind='stable')
+            first = np.searchsorted(times[order], lb, side='left')
+            counts = np.maximum(np.searchsorted(times[order], ub, side='left')
+                                - first, 0)
+            t = np.repeat(np.arange(len(lb)), counts)
+            pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                      counts)
+            idx = order[np.repeat(first, counts) + pos]
+            keep = np.lexsort((idx, t))
+            t, idx = t[keep], idx[keep]
+            d = times[idx] - lb[t]
+            epoch_data[c] = np.stack((t.astype(float), d.astype(float)), axis=1)
+
+        return epoch_data
+
+
+class SparseRasterizedSignal(PointProcess):
+    '''
+    Spike counts of a PointProcess binned at fs and stored as a
+    scipy.sparse CSR matrix (channel X time bin), for long, high sampling
+    rate recordings where a dense raster would be mostly zeros.
+
+    Expects data in the same form as PointProcess (a dictionary of event
+    times per channel), which is kept so that the signal can be re-binned
+    exactly to any sampling rate with rasterize(fs, sparse=True). Channels
+    are in sorted order, as in PointProcess.rasterize.
+
+    as_continuous() builds the dense raster on demand, and extract_epoch()
+    and extract_epoch_block() (and so as_matrix()) bin the counts of each
+    epoch occurrence straight from the sparse matrix, so these can be used
+    as with a RasterizedSignal. Other RasterizedSignal methods (normalize,
+    jackknifes etc.) are not available: use rasterize() to get a dense
+    RasterizedSignal for those. Saved signals are written (and load back) as
+    PointProcess signals.
+    '''
+
+    def __init__(self, fs, data, name, recording, chans=None, epochs=None,
+                 segments=None, meta=None, safety_checks=True,
+                 normalization='none', **other_attributes):
+        super().__init__(fs, data, name, recording, chans, epochs, segments,
+                         meta, safety_checks, normalization)
+        self.signal_type = str(PointProcess)
+        self.ntimes = self._raster_length(fs)
+
+        cellids, rows, bins = _spike_bins(self._data, fs, self.ntimes)
+        self.chans = cellids
+        self._counts = scipy.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, bins)),
+            shape=(len(cellids), self.ntimes))
+        self._counts.sum_duplicates()
+
+    def _modified_copy(self, data, **kwargs):
+        """
+        For internal use when making various immutable copies of this signal.
+        Returns a RasterizedSignal if data is an array.
+        """
+        attributes = self._get_attributes()
+        attributes.update(kwargs)
+        if isinstance(data, dict):
+            del attributes['signal_type']
+            sig = SparseRasterizedSignal(data=data, safety_checks=False,
+                                         **attributes)
+        else:
+            attributes['signal_type'] = str(RasterizedSignal)
+            sig = RasterizedSignal(data=data, safety_checks=False, **attributes)
+        return self._share_epoch_index(sig)
+
+    def rasterize(self, fs=None, sparse=False):
+        '''
+        Dense RasterizedSignal, or if sparse is True a SparseRasterizedSignal,
+        at fs (default self.fs). Other sampling rates are binned from the
+        event times.
+        '''
+        if (not fs or fs == self.fs) and sparse:
+            return self
+        if not fs or fs == self.fs:
+            return RasterizedSignal(fs=self.fs, data=self.as_continuous(),
+                                    name=self.name, recording=self.recording,
+                                    chans=self.chans, epochs=self.epochs,
+                                    meta=self.meta)
+        return super().rasterize(fs, sparse)
+
+    def as_sparse(self):
+        '''
+        Spike counts, as a (channel X time bin) scipy.sparse CSR matrix.
+        '''
+        return self._counts
+
+    def as_continuous(self):
+        return self._counts.toarray()
+
+    def extract_epoch(self, epoch, boundary_mode='exclude',
+                      fix_overlap='first', allow_empty=False,
+                      overlapping_epoch=None, mask=None, allow_incomplete=False):
+        '''
+        Extracts all occurances of epoch from the signal, as
+        RasterizedSignal.extract_epoch does, without building the dense
+        raster.
 
+        Returns
+        -------
+        epoch_data : 3D array
+            Three dimensional array of shape O, C, T where O is the number of
+            occurances of the epoch, C is the number of channels, and T is the
+            maximum length of the epoch in samples. Shorter epochs are padded
+            with NaN.
+        '''
+        if type(epoch) is str:
+            epoch_indices = self.get_epoch_indices(epoch,
+                                                   boundary_mode=boundary_mode,
+                                                   fix_overlap=fix_overlap,
+                                                   overlapping_epoch=overlapping_epoch,
+                                                   mask=mask,
+                                                   allow_incomplete=allow_incomplete)
+        else:
+            epoch_indices = epoch
+
+        if epoch_indices.size == 0:
+            if allow_empty:
+                return np.empty([0, 0, 0])
+            else:
+                raise IndexError("No matching epochs to extract for: %s\n"
+                                 "In signal: %s", epoch, self.name)
+
+        n_samples = np.max(epoch_indices[:, 1] - epoch_indices[:, 0])
+        return self._gather_epochs(epoch_indices, n_samples)
+
+    def extract_epoch_block(self, epoch_names, boundary_mode='exclude',
+                            fix_overlap='first', overlapping_epoch=None,
+                            mask=None, allow_incomplete=False, copy=True):
+        '''
+        Extracts all occurrences of several epochs into one array, as
+        RasterizedSignal.extract_epoch_block does, without building the
+        dense raster. The result is always a copy.
+        '''
+        return RasterizedSignal.extract_epoch_block(
+            self, epoch_names, boundary_mode=boundary_mode,
+            fix_overlap=fix_overlap, overlapping_epoch=overlapping_epoch,
+            mask=mask, allow_incomplete=allow_incomplete, copy=copy)
+
+    def _gather_epochs(self, epoch_indices, n_samples, copy=True):
+        '''
+        Bins the counts between each (lb, ub) pair in epoch_indices into an
+        array of shape (occurrence, chan, n_samples), padded with NaN. See
+        RasterizedSignal._gather_epochs; copy is ignored.
+        '''
+        epoch_indices = np.asarray(epoch_indices)
+        lb = epoch_indices[:, 0].astype(int)
+        ub = np.minimum(epoch_indices[:, 1], self.ntimes).astype(int)
+        if np.any(lb < 0) or np.any(ub < lb):
+            raise ValueError('Trying to extract invalid range from signal for epoch (out of bounds or negative duration?).')
+        n_samples = int(n_samples)
+        n_epochs, n_chans = len(lb), self.nchans
+
+        # nonzero bins of every channel, as one sorted array of
+        # channel * ntimes + bin
+        counts = self._counts
+        rows = np.repeat(np.arange(n_chans), np.diff(counts.indptr))
+        keys = rows * self.ntimes + counts.indices
+
+        # the nonzero bins inside each (occurrence, channel) pair
+        offsets = np.arange(n_chans) * self.ntimes
+        first = np.searchsorted(keys, lb[:, np.newaxis] + offsets)
+        n = np.searchsorted(keys, ub[:, np.newaxis] + offsets) - first
+        pair = np.repeat(np.arange(n_epochs * n_chans), n.ravel())
+        pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n.ravel(), n.ravel())
+        nz = np.repeat(first.ravel(), n.ravel()) + pos
+
+        epoch_data = np.zeros((n_epochs, n_chans, n_samples))
+        bins = counts.indices[nz] - lb[pair // n_chans]
+        epoch_data.reshape(-1)[pair * n_samples + bins] = counts.data[nz]
+
+        # pad the occurrences that are shorter than n_samples
+        pad = np.arange(n_samples) >= (ub - lb)[:, np.newaxis]
+        epoch_data[np.broadcast_to(pad[:, np.newaxis, :],
+                                   epoch_data.shape)] = np.nan
         return epoch_data
 
 
@@ -2599,6 +3229,61 @@ class TiledSignal(SignalBase):
         )
 
 
+class FitSignal(RasterizedSignal):
+    '''
+    Lightweight stand-in for a RasterizedSignal, used while fitting.
+
+    Holds only a name, a data matrix and a reference to the RasterizedSignal
+    it was derived from (the template). All other attributes (fs, chans,
+    epochs, etc.) are read from the template, so creating one skips the
+    epoch and safety-check work done by RasterizedSignal.__init__. This is
+    the same thing _modified_copy() would produce, since derived signals keep
+    the metadata of the signal they were transformed from.
+
+    Use as_signal() to turn it back into a real RasterizedSignal.
+    '''
+
+    def __init__(self, template, data=None, name=None):
+        self._template = template
+        self._data = template._data if data is None else data
+        self._data.flags.writeable = False
+        self.name = template.name if name is None else name
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't set on this object
+        if name.startswith('__') or name == '_template':
+            raise AttributeError(name)
+        return getattr(self._template, name)
+
+    @property
+    def nchans(self):
+        return self._data.shape[0]
+
+    @property
+    def ntimes(self):
+        return self._data.shape[1]
+
+    def _modified_copy(self, data, **kwargs):
+        '''
+        For internal use when making various immutable copies of this signal.
+        Returns another FitSignal unless attributes other than the name are
+        being changed.
+        '''
+        name = kwargs.pop('name', self.name)
+        if kwargs:
+            return self.as_signal()._modified_copy(data, name=name, **kwargs)
+        return FitSignal(self._template, data, name)
+
+    def as_signal(self):
+        '''
+        Returns a RasterizedSignal with the same name, data and metadata.
+        '''
+        if (self._data is self._template._data and
+                self.name == self._template.name):
+            return self._template
+        return self._template._modified_copy(self._data, name=self.name)
+
+
 class RasterizedSignalSubset(SignalBase):
     '''
     Expects data to be a list of lists.
@@ -2766,6 +3451,45 @@ def load_signal_from_streams(data_stream, json_stream, epoch_stream=None):
     return s
 
 
+def load_signal_from_npy(filepath, js, epochs=None, mmap_mode='c'):
+    '''
+    Loads a signal saved by SignalBase._save_data_to_npy. js is the dict of
+    attributes from SignalBase._json_attributes.
+
+    For .npy files the data are opened with np.load(..., mmap_mode), so with
+    the default mmap_mode='c' nothing is read from disk until the data are
+    used. The mapping is copy-on-write: in-place changes to the data stay in
+    memory and processes that map the same file share the unchanged pages.
+    Use mmap_mode=None to read everything into memory.
+    '''
+    signal_type = js.get('signal_type', "nems.signal.RasterizedSignal")
+    kwargs = dict(name=js['name'], chans=js.get('chans', None), epochs=epochs,
+                  recording=js['recording'], fs=js['fs'], meta=js['meta'])
+
+    if filepath.endswith('.npz'):
+        with np.load(filepath) as f:
+            data = {key: f[key] for key in f.files}
+    else:
+        data = np.load(filepath, mmap_mode=mmap_mode)
+
+    if 'RasterizedSignal' in signal_type:
+        s = RasterizedSignal(data=data, **kwargs)
+    elif 'PointProcess' in signal_type:
+        s = PointProcess(data=data, **kwargs)
+    elif 'TiledSignal' in signal_type:
+        s = TiledSignal(data=data, **kwargs)
+    else:
+        raise ValueError('signal_type unknown')
+
+    s.segments = np.array(js.get('segments', s.segments))
+    s.normalization = js.get('normalization', s.normalization)
+    if 'norm_baseline' in js:
+        s.norm_baseline = np.array(js['norm_baseline'])
+        s.norm_gain = np.array(js['norm_gain'])
+
+    return s
+
+
 def load_rasterized_signal(basepath):
     csvfilepath = basepath + '.csv'
     epochfilepath = basepath + '.epoch.csv'
@@ -2984,3 +3708,81 @@ def _normalize_data(data, normalization='minmax'):
     data_out = (data - d) / g
 
     return data_out, d, g
+
+
+def _normalize_intervals(intervals, ntimes=None):
+    '''
+    Sorts [start, end) sample intervals, clips them to [0, ntimes], drops
+    empty ones and merges overlapping or adjacent ones. Returns an Nx2 int
+    array.
+    '''
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    if ntimes is not None:
+        intervals = np.clip(intervals, 0, ntimes)
+    intervals = intervals[intervals[:, 1] > intervals[:, 0]]
+    if len(intervals) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    intervals = intervals[np.argsort(intervals[:, 0], kind='stable')]
+
+    # an interval starts a new run if it begins after every earlier one ends
+    run_end = np.maximum.accumulate(intervals[:, 1])
+    new_run = np.concatenate(([True], intervals[1:, 0] > run_end[:-1]))
+    last = np.append(np.flatnonzero(new_run)[1:] - 1, len(intervals) - 1)
+    return np.stack((intervals[new_run, 0], run_end[last]), axis=1)
+
+
+def _invert_intervals(intervals, ntimes):
+    '''
+    Complement in [0, ntimes) of normalized intervals.
+    '''
+    bounds = np.concatenate(([0], intervals.ravel(), [ntimes]))
+    complement = bounds.reshape(-1, 2)
+    return complement[complement[:, 1] > complement[:, 0]]
+
+
+def _intervals_from_array(mask):
+    '''
+    [start, end) intervals where the 1-d array mask is nonzero.
+    '''
+    edges = np.diff(np.concatenate(([0], mask != 0, [0])).astype(np.int8))
+    return np.stack((np.flatnonzero(edges == 1),
+                     np.flatnonzero(edges == -1)), axis=1)
+
+
+def _as_intervals(mask):
+    if isinstance(mask, IntervalMask):
+        return mask.intervals
+    elif isinstance(mask, SignalBase):
+        return _intervals_from_array(mask.as_continuous()[0])
+    return np.asarray(mask)
+
+
+def _intervals_by_rank(intervals, lb, ub):
+    '''
+    Sample intervals covering the lb-th to (ub-1)-th samples (counting
+    from 0) inside intervals.
+    '''
+    lengths = intervals[:, 1] - intervals[:, 0]
+    first_rank = np.concatenate(([0], np.cumsum(lengths)))
+    lo = np.maximum(lb, first_rank[:-1])
+    hi = np.minimum(ub, first_rank[1:])
+    keep = hi > lo
+    starts = intervals[keep, 0] - first_rank[:-1][keep]
+    return np.stack((starts + lo[keep], starts + hi[keep]), axis=1)
+
+
+def _spike_bins(data, fs, max_bin):
+    '''
+    Bins the event times in data ({chan: times}) at fs, for all channels at
+    once. Returns the sorted channel names and, for every event falling in
+    [0, max_bin), its channel (row) and bin.
+    '''
+    cellids = sorted(data)
+    times = [np.asarray(data[c], dtype=float).ravel() for c in cellids]
+    rows = np.repeat(np.arange(len(cellids)), [len(t) for t in times])
+    if len(rows):
+        bins = np.floor(np.concatenate(times) * fs)
+    else:
+        bins = np.zeros(0)
+    keep = (bins >= 0) & (bins < max_bin)
+    return cellids, rows[keep], bins[keep].astype(int)
@@ -14,7 +14,7 @@ import tensorflow_probability as tfp
 import nems.utils
 from nems import initializers, recording, get_setting
 from nems import modelspec as mslib
-from nems.tf import callbacks, loss_functions, modelbuilder
+from nems.tf import callbacks, datasets, loss_functions, modelbuilder
 from nems.tf.layers import Conv2D_NEMS
 from nems.initializers import init_static_nl
 
@@ -137,6 +137,7 @@ def fit_tf(
         freeze_layers: typing.Union[None, list] = None,
         IsReload: bool = False,
         epoch_name: str = "REFERENCE",
+        streaming: bool = False,
         **context
         ) -> dict:
     """TODO
@@ -157,6 +158,8 @@ def fit_tf(
       from model layer indexes.
     :param IsReload:
     :param epoch_name
+    :param streaming: Read batches of epochs from est while fitting (see nems.tf.datasets) instead of extracting all
+      the data up front. Needs an epoch_name.
     :param context:
 
     :return: dict {'modelspec': modelspec}
@@ -210,29 +213,45 @@ def fit_tf(
     # also grab the fs
     fs = est[input_name].fs
 
-    if (epoch_name is not None) and (epoch_name != ""):
-        # extract out the raw data, and reshape to (batch, time, channel)
-        stim_train = np.transpose(est[input_name].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
-        resp_train = np.transpose(est[output_name].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
+    if streaming and ((epoch_name is None) or (epoch_name == "")):
+        log.warning('Streaming needs an epoch_name, extracting all the data instead.')
+        streaming = False
+
+    if streaming:
+        # only locate the epochs here, the data are read batch by batch while fitting
+        input_names = [input_name] + (['state'] if 'state' in est.signals else [])
+        reader = datasets.EpochReader(est, input_names + [output_name], epoch_name)
+        shapes = reader.shapes
+        stim_shape = shapes[0]
+        state_shape = shapes[1] if len(input_names) > 1 else None
+        log.info(f'Feature dimensions: {stim_shape}; Data dimensions: {shapes[-1]}.')
+        if state_shape is not None:
+            log.info(f'State dimensions: {state_shape}')
     else:
-        # extract data as a single batch size (1, time, channel)
-        stim_train = np.transpose(est.apply_mask()[input_name].as_continuous()[np.newaxis, ...], [0, 2, 1])
-        resp_train = np.transpose(est.apply_mask()[output_name].as_continuous()[np.newaxis, ...], [0, 2, 1])
-
-    log.info(f'Feature dimensions: {stim_train.shape}; Data dimensions: {resp_train.shape}.')
-
-    # get state if present, and setup training data
-    if 'state' in est.signals:
         if (epoch_name is not None) and (epoch_name != ""):
-           state_train = np.transpose(est['state'].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
+            # extract out the raw data, and reshape to (batch, time, channel)
+            stim_train = np.transpose(est[input_name].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
+            resp_train = np.transpose(est[output_name].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
         else:
-           state_train = np.transpose(est.apply_mask()['state'].as_continuous()[np.newaxis, ...], [0, 2, 1])
-        state_shape = state_train.shape
-        log.info(f'State dimensions: {state_shape}')
-        train_data = [stim_train, state_train]
-    else:
-        state_train, state_shape = None, None
-        train_data = stim_train
+            # extract data as a single batch size (1, time, channel)
+            stim_train = np.transpose(est.apply_mask()[input_name].as_continuous()[np.newaxis, ...], [0, 2, 1])
+            resp_train = np.transpose(est.apply_mask()[output_name].as_continuous()[np.newaxis, ...], [0, 2, 1])
+
+        log.info(f'Feature dimensions: {stim_train.shape}; Data dimensions: {resp_train.shape}.')
+        stim_shape = stim_train.shape
+
+        # get state if present, and setup training data
+        if 'state' in est.signals:
+            if (epoch_name is not None) and (epoch_name != ""):
+               state_train = np.transpose(est['state'].extract_epoch(epoch=epoch_name, mask=est['mask']), [0, 2, 1])
+            else:
+               state_train = np.transpose(est.apply_mask()['state'].as_continuous()[np.newaxis, ...], [0, 2, 1])
+            state_shape = state_train.shape
+            log.info(f'State dimensions: {state_shape}')
+            train_data = [stim_train, state_train]
+        else:
+            state_train, state_shape = None, None
+            train_data = stim_train
 
     # correlation for monitoring
     # TODO: tf.utils?
@@ -242,13 +261,28 @@ def fit_tf(
     # get the layers and build the model
     cost_fn = loss_functions.get_loss_fn(cost_function)
     model_layers = modelspec.modelspec2tf2(use_modelspec_init=use_modelspec_init, seed=seed, fs=fs, initializer=initializer)
-    if np.any([isinstance(layer, Conv2D_NEMS) for layer in model_layers]):
+    add_channel_dim = np.any([isinstance(layer, Conv2D_NEMS) for layer in model_layers])
+    if add_channel_dim:
         # need a "channel" dimension for Conv2D (like rgb channels, not frequency). Only 1 channel for our data.
-        stim_train = stim_train[..., np.newaxis]
-        train_data = train_data[..., np.newaxis]
+        stim_shape = tuple(stim_shape) + (1,)
+        if not streaming:
+            stim_train = stim_train[..., np.newaxis]
+            train_data = train_data[..., np.newaxis]
 
     # do some batch sizing logic
-    batch_size = stim_train.shape[0] if batch_size == 0 else batch_size
+    batch_size = stim_shape[0] if batch_size == 0 else batch_size
+
+    if streaming:
+        n_inputs = 1 if state_shape is None else 2
+        train_data = datasets.epoch_dataset(reader, n_inputs=n_inputs, batch_size=batch_size, seed=seed,
+                                            add_channel_dim=add_channel_dim)
+        # unshuffled, for predictions in the same order as the modelspec's
+        eval_data = datasets.epoch_dataset(reader, n_inputs=n_inputs, batch_size=batch_size, shuffle=False,
+                                           add_channel_dim=add_channel_dim)
+        fit_data = {'x': train_data}
+    else:
+        eval_data = train_data
+        fit_data = {'x': train_data, 'y': resp_train, 'batch_size': batch_size}
 
     model = modelbuilder.ModelBuilder(
         name='Test-model',
@@ -257,7 +291,7 @@ def fit_tf(
         loss_fn=cost_fn,
         optimizer=optimizer,
         metrics=[pearson],
-    ).build_model(input_shape=stim_train.shape, state_shape=state_shape, batch_size=batch_size)
+    ).build_model(input_shape=stim_shape, state_shape=state_shape, batch_size=batch_size)
 
     # tracking early termination
     model.early_terminated = False
@@ -271,7 +305,7 @@ def fit_tf(
     checkpoint = tf.keras.callbacks.ModelCheckpoint(filepath=str(checkpoint_filepath),
                                                     save_best_only=False,
                                                     save_weights_only=True,
-                                                    save_freq=100 * stim_train.shape[0],
+                                                    save_freq=100 * stim_shape[0],
                                                     monitor='loss',
                                                     verbose=0)
     sparse_logger = callbacks.SparseProgbarLogger(n_iters=10)
@@ -305,12 +339,10 @@ def fit_tf(
 
     log.info(f'Fitting model (batch_size={batch_size})...')
     history = model.fit(
-        train_data,
-        resp_train,
+        **fit_data,
         # validation_split=0.2,
         verbose=verbose,
         epochs=max_iter,
-        batch_size=batch_size,
         callbacks=callback0 + [
             nan_terminate,
             nan_weight_terminate,
@@ -325,7 +357,7 @@ def fit_tf(
     )
 
     # did we terminate on a nan loss or weights? Load checkpoint if so
-    if np.all(np.isnan(model.predict(train_data))) or model.early_terminated:  # TODO: should this be np.any()?
+    if np.all(np.isnan(model.predict(eval_data))) or model.early_terminated:  # TODO: should this be np.any()?
         log.warning('Model terminated on nan loss or weights, restoring saved weights.')
         try:
             # this can fail if it nans out before a single checkpoint gets saved, either because no saved weights
@@ -340,7 +372,7 @@ def fit_tf(
     contains_tf_only_layers = np.any(['tf_only' in m['fn'] for m in modelspec.modules])
     if not contains_tf_only_layers:
         # compare the predictions from the model and modelspec
-        error = compare_ms_tf(modelspec, model, est, train_data)
+        error = compare_ms_tf(modelspec, model, est, eval_data)
         if error > 1e-5:
             log.warning(f'Mean difference between NEMS and TF model prediction: {error}')
         else:
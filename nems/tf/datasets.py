@@ -0,0 +1,117 @@
+"""Streaming tf.data input pipelines that read epochs from a recording."""
+
+import logging
+import typing
+
+import numpy as np
+import tensorflow as tf
+
+from nems import recording
+
+log = logging.getLogger(__name__)
+
+
+class EpochReader:
+    """Reads occurrences of an epoch from some signals of a recording on demand.
+
+    The occurrences are located once (only those spanned by the mask are
+    kept, as in `extract_epoch(epoch_name, mask=rec['mask'])`), but the data
+    are only copied out of the signals when a set of occurrences is read. With
+    a memory mapped recording (see `load_recording_from_npy`) only those
+    occurrences are read from disk.
+    """
+    def __init__(self,
+                 rec: recording.Recording,
+                 signal_names: typing.List[str],
+                 epoch_name: str,
+                 mask=None,
+                 ):
+        """
+        :param rec: The recording to read from.
+        :param signal_names: Names of the signals to read, e.g. ['stim', 'resp'].
+        :param epoch_name: Name of the epoch whose occurrences are read.
+        :param mask: Mask signal selecting the occurrences. If None, uses rec['mask'] if there is one.
+        """
+        if mask is None and 'mask' in rec.signals:
+            mask = rec['mask']
+
+        self.signals = [rec[name].rasterize() for name in signal_names]
+        self.indices = self.signals[0].get_epoch_indices(epoch_name, boundary_mode='exclude', fix_overlap='first',
+                                                         mask=mask)
+        if len(self.indices) == 0:
+            raise IndexError(f'No matching epochs to read for: {epoch_name}')
+        self.n_samples = int(np.max(self.indices[:, 1] - self.indices[:, 0]))
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def shapes(self) -> typing.List[tuple]:
+        """Shape of each signal as (occurrences, time, channel), like the arrays fit_tf makes."""
+        return [(len(self), self.n_samples, s.shape[0]) for s in self.signals]
+
+    def read(self, occurrences) -> typing.List[np.ndarray]:
+        """Reads the given occurrences of every signal.
+
+        :param occurrences: Indices of the occurrences to read.
+
+        :return: One float32 array of shape (len(occurrences), time, channel) per signal. Occurrences shorter than
+          the longest one are padded with NaN.
+        """
+        occurrences = np.asarray(occurrences, dtype=int)
+        batch = []
+        for signal in self.signals:
+            data = signal.as_continuous()
+            out = np.full((len(occurrences), self.n_samples, data.shape[0]), np.nan, dtype='float32')
+            for i, (lb, ub) in enumerate(self.indices[occurrences]):
+                ub = min(ub, data.shape[-1])
+                out[i, :ub - lb] = data[:, lb:ub].T
+            batch.append(out)
+        return batch
+
+
+def epoch_dataset(reader: EpochReader,
+                  n_inputs: int = 1,
+                  batch_size: typing.Union[None, int] = None,
+                  shuffle: bool = True,
+                  seed: int = 0,
+                  add_channel_dim: bool = False,
+                  ) -> tf.data.Dataset:
+    """Makes a tf.data.Dataset that streams batches of epochs from a recording.
+
+    The occurrence indices are shuffled (again on each pass through the data) and batched, and each batch is read
+    with the reader in parallel map calls while the following batches are prefetched. The elements are
+    (inputs, output) pairs as expected by `tf.keras.Model.fit`: the last signal of the reader is the output, and
+    the others are the inputs (a tuple if n_inputs > 1).
+
+    :param reader: EpochReader for the input signals followed by the output signal.
+    :param n_inputs: Number of input signals.
+    :param batch_size: Number of occurrences per batch. If None or 0, all occurrences are one batch.
+    :param shuffle: Whether to shuffle the occurrences. Use False to keep the order of `extract_epoch`.
+    :param seed: Shuffle seed.
+    :param add_channel_dim: Add a trailing channel dimension to the first input, as needed by Conv2D layers.
+
+    :return: The dataset.
+    """
+    n_occurrences = len(reader)
+    if not batch_size:
+        batch_size = n_occurrences
+    shapes = reader.shapes
+
+    def read(occurrences):
+        batch = list(tf.numpy_function(reader.read, [occurrences], [tf.float32] * len(shapes)))
+        for data, shape in zip(batch, shapes):
+            data.set_shape((None,) + shape[1:])
+        if add_channel_dim:
+            batch[0] = batch[0][..., tf.newaxis]
+        inputs = tuple(batch[:n_inputs]) if n_inputs > 1 else batch[0]
+        return inputs, batch[-1]
+
+    dataset = tf.data.Dataset.range(n_occurrences)
+    if shuffle:
+        dataset = dataset.shuffle(n_occurrences, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size) \
+        .map(read, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+
+    return dataset
@@ -145,6 +145,17 @@ def targz_uri(uri):
         return None
 
 
+def npy_uri(uri):
+    '''
+    Returns the URI if it names a binary (.npy) recording directory, else
+    None.
+    '''
+    if uri.rstrip('/\\').endswith('.nrec'):
+        return uri
+    else:
+        return None
+
+
 def save_resource(uri, data=None, json=None):
     '''
     For saving a resource to a URI. Throws an exception if there was a
@@ -4,13 +4,25 @@ This module contains wrappers for transformations ("xforms") applied sequentiall
 fitting process.
 
 """
+import contextlib
+import json
 import logging
+import multiprocessing
 import os
+import shutil
+import tempfile
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
 
 import nems.xforms as xforms
 import nems.db as nd
+import nems.modelspec as ms
 from nems import get_setting
+from nems.recording import load_recording, is_npy_recording
+from nems.uri import NumpyEncoder, json_numpy_obj_hook
 from nems.utils import escaped_split, escaped_join
 from nems.registry import KeywordRegistry, xforms_lib, keyword_lib
 from nems.plugins import (default_keywords, default_loaders, default_fitters,
@@ -164,6 +176,24 @@ def fit_model_xform(cellid, batch, modelname, autoPlot=True, saveInDB=False,
     :param recording_uri
     :return: savepath = path to saved results or (xfspec, ctx) tuple
     """
+    xfspec, ctx, save_destination = _fit_model_xform(
+        cellid, batch, modelname, autoPlot=autoPlot,
+        recording_uri=recording_uri, initial_context=initial_context)
+
+    if returnModel:
+        # return fit, skip save!
+        return xfspec, ctx
+
+    return _save_model_xform(xfspec, ctx, save_destination, saveInDB=saveInDB)
+
+
+def _fit_model_xform(cellid, batch, modelname, autoPlot=True,
+                     recording_uri=None, initial_context=None):
+    """
+    Generate and evaluate the xfspec for fit_model_xform.
+    :return: (xfspec, ctx, save_destination) tuple, save_destination is the
+       URI that the results should be saved to
+    """
     startime = time.time()
     log.info('Initializing modelspec(s) for cell/batch %s/%d...',
              cellid, int(batch))
@@ -234,9 +264,17 @@ def fit_model_xform(cellid, batch, modelname, autoPlot=True, saveInDB=False,
     modelspec.meta['runtime'] = int(time.time() - startime)
     modelspec.meta.update(meta)
 
-    if returnModel:
-        # return fit, skip save!
-        return xfspec, ctx
+    return xfspec, ctx, save_destination
+
+
+def _save_model_xform(xfspec, ctx, save_destination, saveInDB=False):
+    """
+    Save the results of _fit_model_xform (and add them to the Results
+    table if saveInDB).
+    :return: savepath = path to saved results
+    """
+    modelspec = ctx['modelspec']
+    log_xf = ctx['log']
 
     # save results
     log.info('Saving modelspec(s) to {0} ...'.format(save_destination))
@@ -259,6 +297,248 @@ def fit_model_xform(cellid, batch, modelname, autoPlot=True, saveInDB=False,
     return save_data['savepath']
 
 
+BLAS_THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                         'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                         'VECLIB_MAXIMUM_THREADS']
+
+
+def fit_models_local(cellids, batch, modelnames, n_workers=None,
+                     recording_uri=None, results_file=None, force_rerun=False,
+                     blas_threads=1, share_recordings=True, autoPlot=False,
+                     saveInDB=False, mp_context='spawn'):
+    """
+    Fit every combination of cellid and modelname with fit_model_xform,
+    in parallel on the local machine. A local alternative to
+    nems.db.enqueue_models that doesn't need the job queue.
+
+    :param cellids: list of cellids (or of lists of cellids, for
+       population models)
+    :param batch: batch number passed on to fit_model_xform
+    :param modelnames: list of modelnames
+    :param n_workers: number of worker processes (default os.cpu_count()
+       // blas_threads)
+    :param recording_uri: None (the loader keywords locate the data), a uri,
+       a uri containing '{cellid}', or a dict {cellid: uri}
+    :param results_file: path to a JSON lines file. One record is appended
+       per finished fit, and fits with a successful record are skipped when
+       the same results_file is used again, so an interrupted run can be
+       resumed.
+    :param force_rerun: refit even if results_file says a fit is done
+    :param blas_threads: number of BLAS/OpenMP threads per worker. With the
+       default 'spawn' mp_context the limit is applied (via environment
+       variables) before numpy is imported in the worker.
+    :param share_recordings: if True and recording_uri is given, each
+       cell's recording is loaded once and written to shared memory
+       (/dev/shm where it exists) with Recording.save_npy. All models of
+       the cell then memory-map the same copy, see load_recording_from_npy.
+    :param autoPlot: passed on to fit_model_xform
+    :param saveInDB: add each fit to the Results table
+    :param mp_context: multiprocessing start method for the workers
+    :return: list of result records, one per (cellid, modelname), in the
+       order they were requested. Each record is a dict with keys cellid,
+       batch, modelname, status ('done' or 'error'), savepath, error and
+       meta. meta is the modelspec.meta of the fit, which has the fields
+       update_results_table reads, see results_modelspec.
+    """
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // blas_threads)
+    jobs = [(cellid, modelname) for cellid in cellids
+            for modelname in modelnames]
+    key = lambda cellid, modelname: (json.dumps(cellid), int(batch), modelname)
+
+    records = {}
+    if (results_file is not None) and not force_rerun:
+        for r in load_local_results(results_file):
+            if r['status'] == 'done':
+                records[key(r['cellid'], r['modelname'])] = r
+    todo = [(c, m) for c, m in jobs if key(c, m) not in records]
+    log.info('Fitting %d models (%d already done) with %d workers',
+             len(todo), len(jobs) - len(todo), n_workers)
+
+    shared_dir = None
+    if share_recordings and (recording_uri is not None) and todo:
+        shared_root = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        shared_dir = tempfile.mkdtemp(prefix='nems_fit_', dir=shared_root)
+
+    # submit the models of one cell at a time, and only while fewer than
+    # n_workers fits are waiting or running, so that only the recordings of
+    # the cells being fit are shared at once. Each shared recording is
+    # removed once its fits are done.
+    by_cell = {}
+    for cellid, modelname in todo:
+        by_cell.setdefault(json.dumps(cellid), []).append((cellid, modelname))
+    pending_fits = {c: len(v) for c, v in by_cell.items()}
+    cells = iter(enumerate(by_cell.items()))
+    shared_uris = {}
+
+    start = time.time()
+    n_done = 0
+    n_failed = 0
+    try:
+        with _blas_thread_limit(blas_threads), \
+                ProcessPoolExecutor(
+                    max_workers=n_workers,
+                    mp_context=multiprocessing.get_context(mp_context),
+                    initializer=_init_fit_worker,
+                    initargs=(blas_threads,)) as executor:
+            futures = {}
+            while True:
+                while len(futures) < n_workers:
+                    try:
+                        i, (c, cell_jobs) = next(cells)
+                    except StopIteration:
+                        break
+                    uri = _cell_recording_uri(recording_uri, cell_jobs[0][0])
+                    if shared_dir is not None:
+                        uri = _share_recording(uri, shared_dir, i)
+                        shared_uris[c] = uri
+                    for cellid, modelname in cell_jobs:
+                        f = executor.submit(_fit_model_worker, cellid, batch,
+                                            modelname, uri, autoPlot,
+                                            saveInDB)
+                        futures[f] = (cellid, modelname)
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for f in done:
+                    cellid, modelname = futures.pop(f)
+                    r = f.result()
+                    records[key(cellid, modelname)] = r
+                    if results_file is not None:
+                        _append_local_result(results_file, r)
+
+                    n_done += 1
+                    if r['status'] != 'done':
+                        n_failed += 1
+                        log.error('Fit of %s/%s failed:\n%s', cellid,
+                                  modelname, r['error'])
+                    elapsed = time.time() - start
+                    rate = n_done / elapsed
+                    log.info('Finished %s/%s (%d/%d, %d failed): %.2f '
+                             'fits/min, %.0f s remaining', cellid, modelname,
+                             n_done, len(todo), n_failed, rate * 60,
+                             (len(todo) - n_done) / rate)
+
+                    c = json.dumps(cellid)
+                    pending_fits[c] -= 1
+                    if (pending_fits[c] == 0) and (c in shared_uris):
+                        shutil.rmtree(shared_uris.pop(c), ignore_errors=True)
+    finally:
+        if shared_dir is not None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+    if todo:
+        elapsed = time.time() - start
+        log.info('Fit %d models in %.1f s (%.2f fits/min, %d failed)',
+                 n_done, elapsed, n_done / elapsed * 60, n_failed)
+
+    return [records[key(c, m)] for c, m in jobs]
+
+
+def load_local_results(results_file):
+    """
+    Read the result records written by fit_models_local. If a fit appears
+    more than once, the last record wins.
+    """
+    if not os.path.exists(results_file):
+        return []
+    records = {}
+    with open(results_file, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line, object_hook=json_numpy_obj_hook)
+            records[(json.dumps(r['cellid']), r['batch'], r['modelname'])] = r
+    return list(records.values())
+
+
+def results_modelspec(record):
+    """
+    Wrap the meta of a fit_models_local result record in a ModelSpec, e.g.
+    to pass it to nems.db.update_results_table.
+    """
+    raw = np.full((1, 1, 1), None)
+    raw[0, 0, 0] = [{'meta': record['meta']}]
+    return ms.ModelSpec(raw)
+
+
+def _cell_recording_uri(recording_uri, cellid):
+    if (recording_uri is None) or isinstance(recording_uri, str):
+        if recording_uri is not None and '{cellid}' in recording_uri:
+            return recording_uri.format(cellid=cellid)
+        return recording_uri
+    return recording_uri[cellid]
+
+
+def _share_recording(uri, shared_dir, i):
+    '''
+    Copy the recording at uri into shared_dir in the binary format, unless
+    it already is in that format. Returns the uri to load it from.
+    '''
+    if is_npy_recording(uri):
+        return uri
+    shared_uri = os.path.join(shared_dir, 'cell{:04d}.nrec'.format(i))
+    log.info('Sharing recording %s as %s', uri, shared_uri)
+    load_recording(uri).save_npy(shared_uri)
+    return shared_uri
+
+
+@contextlib.contextmanager
+def _blas_thread_limit(n_threads):
+    '''
+    Set the BLAS/OpenMP thread count environment variables that new worker
+    processes inherit.
+    '''
+    saved = {k: os.environ.get(k) for k in BLAS_THREAD_VARIABLES}
+    os.environ.update({k: str(n_threads) for k in BLAS_THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+
+
+def _init_fit_worker(n_threads):
+    os.environ.update({k: str(n_threads) for k in BLAS_THREAD_VARIABLES})
+    try:
+        # BLAS libraries that are already loaded (eg, in forked workers)
+        # ignore the environment variables
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(n_threads)
+    except ImportError:
+        pass
+
+
+def _fit_model_worker(cellid, batch, modelname, recording_uri, autoPlot,
+                      saveInDB):
+    record = {'cellid': cellid, 'batch': int(batch), 'modelname': modelname,
+              'status': 'done', 'savepath': None, 'error': None, 'meta': {}}
+    try:
+        xfspec, ctx, save_destination = _fit_model_xform(
+            cellid, batch, modelname, autoPlot=autoPlot,
+            recording_uri=recording_uri)
+        record['savepath'] = _save_model_xform(xfspec, ctx, save_destination,
+                                               saveInDB=saveInDB)
+        # round trip through JSON so that the record can be saved
+        record['meta'] = json.loads(
+            json.dumps(ctx['modelspec'].meta, cls=NumpyEncoder),
+            object_hook=json_numpy_obj_hook)
+    except Exception:
+        record['status'] = 'error'
+        record['error'] = traceback.format_exc()
+    return record
+
+
+def _append_local_result(results_file, record):
+    with open(results_file, 'a') as f:
+        f.write(json.dumps(record, cls=NumpyEncoder) + '\n')
+        f.flush()
+
+
 def load_model_xform(cellid, batch=271,
         modelname="ozgf100ch18_wcg18x2_fir15x2_lvl1_dexp1_fit01",
         eval_model=True, only=None):
@@ -6,11 +6,19 @@ fitting process. Custom xforms can be developed as long as they adhere to the re
 """
 import io
 import os
+import sys
 import copy
 import socket
 import logging
 import importlib
 import glob
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -29,7 +37,7 @@ from nems import get_setting
 from nems.registry import xforms_lib, keyword_lib, xform, xmodule, scan_for_kw_defs
 #from nems.plugins import (default_keywords, default_loaders, default_fitters,
 #                          default_initializers)
-from nems.signal import RasterizedSignal
+from nems.signal import RasterizedSignal, SignalBase
 from nems.uri import save_resource, load_resource
 from nems.utils import (iso8601_datestring, find_module,
                         recording_filename_hash, get_default_savepath, lookup_fn_at)
@@ -114,14 +122,23 @@ def evaluate_step(xfa, context={}):
         if k in context_in:
             log.info('xf argument %s overlaps with existing context key: %s', k, xf)
 
-    # Merge args into context, and make a deepcopy so that mutation
-    # inside xforms will not be propagated unless the arg is returned.
-    args = copy.deepcopy(context_in)
+    # Merge args into a copy of the context so that mutation inside xforms
+    # will not be propagated unless the arg is returned.
+    args = copy_context(context_in)
     args.update(**xfargs)
     #merged_args = {**xfargs, **context_in}
     #args = copy.deepcopy(merged_args)
 
+    start_time = time.time()
+    start_rss = _peak_rss_mb()
     new_context = fn(**args)
+    elapsed = time.time() - start_time
+    peak_rss = _peak_rss_mb()
+    if peak_rss is None:
+        log.info('Done: %s (%.2f s)', xf, elapsed)
+    else:
+        log.info('Done: %s (%.2f s, peak memory %.1f MB, +%.1f MB)',
+                 xf, elapsed, peak_rss, peak_rss - start_rss)
     if len(context_out_keys):
         if type(new_context) is tuple:
             # print(new_context)
@@ -150,7 +167,7 @@ def evaluate(xformspec, context={}, start=0, stop=None):
     Also, this function wraps every logging call and saves it in a log
     that is the second value returned by this function.
     '''
-    context = copy.deepcopy(context)  # Create a new starting context
+    context = copy_context(context)  # Create a new starting context
 
     # Create a log stream set to the debug level; add it as a root log handler
     log_stream = io.StringIO()
@@ -163,11 +180,19 @@ def evaluate(xformspec, context={}, start=0, stop=None):
     rootlogger.addHandler(ch)
 
     # Evaluate the xforms
+    step_times = []
     for xfa in xformspec[start:stop]:
+        start_time = time.time()
         context = evaluate_step(xfa, context)
+        step_times.append((xfa[0], time.time() - start_time))
 
     # Close the log, remove the handler, and add the 'log' string to context
     log.info('Done (re-)evaluating xforms.')
+    log.info('Time per step:')
+    for xf, elapsed in step_times:
+        log.info('  %8.2f s  %s', elapsed, xf)
+    if _peak_rss_mb() is not None:
+        log.info('Peak memory: %.1f MB', _peak_rss_mb())
     ch.close()
     rootlogger.removeFilter(ch)
     logstring = log_stream.getvalue()
@@ -176,6 +201,77 @@ def evaluate(xformspec, context={}, start=0, stop=None):
     return context, logstring
 
 
+def copy_context(context):
+    '''
+    Copy of an xforms context for passing to an xform. Signal data are
+    treated as immutable and are not copied: recordings (including those in
+    lists and attached to modelspecs) are copied with Recording.copy, and
+    each of their signals with SignalBase.copy, which shares the data. The
+    epochs DataFrames are copied, since some xforms still edit them in
+    place. So an xform can replace the signals of a recording, or the
+    attributes or epochs of a signal, without changing the original context,
+    but must never edit the data of a signal in place. Everything else
+    (modelspec, meta) is deep-copied.
+    '''
+    memo = {}
+    for v in context.values():
+        _share_signals(v, memo)
+    return copy.deepcopy(context, memo)
+
+
+def _share_signals(value, memo):
+    '''
+    Adds copies of the recordings and signals found in value to memo, the
+    memo dict for copy.deepcopy.
+    '''
+    if id(value) in memo:
+        return
+    if isinstance(value, Recording):
+        other = value.copy()
+        memo[id(value)] = other
+        other.meta = copy.deepcopy(value.meta, memo)
+        for view in other.signal_views:
+            # dict.items, so lazily loaded signals are not read
+            for k, s in list(dict.items(view)):
+                if isinstance(s, SignalBase):
+                    if id(s) not in memo:
+                        memo[id(s)] = _copy_signal(s)
+                    dict.__setitem__(view, k, memo[id(s)])
+    elif isinstance(value, SignalBase):
+        memo[id(value)] = _copy_signal(value)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _share_signals(v, memo)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _share_signals(v, memo)
+    elif isinstance(value, ms.ModelSpec):
+        _share_signals(value.recording, memo)
+
+
+def _copy_signal(sig):
+    '''
+    Copy of sig that shares its data but has its own epochs DataFrame.
+    '''
+    other = sig.copy()
+    if sig.epochs is not None:
+        other.epochs = sig.epochs.copy()
+    return other
+
+
+def _peak_rss_mb():
+    '''
+    Peak resident memory of this process in MB, or None if unknown.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac
+    if sys.platform == 'darwin':
+        return peak / 1024 ** 2
+    return peak / 1024
+
+
 ###############################################################################
 # Stuff below this line are useful resuable components.
 # See xforms_test.py for how to use it.
@@ -201,7 +297,7 @@ def init_context(kw_kwargs=None, **context):
 
 def load_recording_wrapper(load_command=None, exptid="RECORDING", cellid=None,
                            save_cache=True, IsReload=False, modelspecs=None,
-                           modelspec=None, **context):
+                           modelspec=None, signals=None, **context):
     """
     generic wrapper for loading recordings
     :param load_command: string pointing to relevant load command, eg "my.lib.load_fun"
@@ -234,6 +330,9 @@ def load_recording_wrapper(load_command=None, exptid="RECORDING", cellid=None,
         string identifier for the signals being modeled. eg the name of the cell or
         the experiment (if multiple cells are being modeled at once). will extract
         that chan from rec['resp'].chans after loading (but not saved in cache)
+    :param signals: list of signal names to keep, eg ['stim', 'resp']. If None,
+        keep all. Other signals are not read from a cached recording (the cache
+        always contains every signal).
     :param context: dictionary of parameters/metadata that will be passed through to load_command
 
     :return: rec - NEMS recording object
@@ -243,7 +342,7 @@ def load_recording_wrapper(load_command=None, exptid="RECORDING", cellid=None,
     data_file = recording_filename_hash(exptid, context, nems.get_setting('NEMS_RECORDINGS_DIR'))
     if os.path.exists(data_file):
         log.info("Loading cached file %s", data_file)
-        rec = load_recording(data_file)
+        rec = load_recording(data_file, signals=signals)
     else:
 
         fn = lookup_fn_at(load_command)
@@ -272,6 +371,10 @@ def load_recording_wrapper(load_command=None, exptid="RECORDING", cellid=None,
         if save_cache:
             rec.save(data_file)
 
+        if signals is not None:
+            rec = Recording({k: v for k, v in rec.signals.items()
+                             if k in signals}, meta=rec.meta)
+
     # if cellid specified, select only that channel
     if cellid is not None:
         if cellid in rec['resp'].chans:
@@ -284,13 +387,15 @@ def load_recording_wrapper(load_command=None, exptid="RECORDING", cellid=None,
 
 def load_recordings(recording_uri_list=None, normalize=False, cellid=None,
                     save_other_cells_to_state=None, input_name='stim',
-                    output_name='resp', meta={}, **context):
+                    output_name='resp', meta={}, signals=None, **context):
     '''
     Load one or more recordings into memory given a list of URIs.
+    If signals (list of signal names) is given, only load those signals.
     '''
 
-    rec = load_recording(recording_uri_list[0])
-    other_recordings = [load_recording(uri) for uri in recording_uri_list[1:]]
+    rec = load_recording(recording_uri_list[0], signals=signals)
+    other_recordings = [load_recording(uri, signals=signals)
+                        for uri in recording_uri_list[1:]]
     if other_recordings:
         rec.concatenate_recordings(other_recordings)
 
@@ -943,18 +1048,41 @@ def fit_basic(modelspec, est, max_iter=1000, tolerance=1e-7,
               metric='nmse', IsReload=False, fitter='scipy_minimize',
               jackknifed_fit=False, random_sample_fit=False,
               n_random_samples=0, random_fit_subset=None,
-              output_name='resp', **context):
-    ''' A basic fit that optimizes every input modelspec. '''
+              output_name='resp', gradient=False, n_workers=1,
+              early_stop=None, **context):
+    ''' A basic fit that optimizes every input modelspec.
+
+    If gradient is True, use analytic gradients of the metric when the
+    model supports them (see nems.analysis.fit_basic.fit_basic).
+    If n_workers > 1, up to n_workers jackknife folds and fits (e.g. the
+    random initial conditions of nems.initializers.rand_phi) are fit at a
+    time in worker processes (see nems.analysis.fit_nfold.fit_nfold).
+    If early_stop is given, fits that fall more than early_stop times the
+    best error behind the best fit of their fold are given up early.
+    '''
 
     if IsReload:
         return {}
     metric_fn = lambda d: getattr(metrics, metric)(d, 'pred', output_name)
+    metric_grad_fn = None
+    if hasattr(metrics, metric + '_grad'):
+        metric_grad_fn = lambda d: getattr(metrics, metric + '_grad')(
+                d, 'pred', output_name)
     fitter_fn = getattr(nems.fitters.api, fitter)
     fit_kwargs = {'tolerance': tolerance, 'max_iter': max_iter}
 
     if modelspec.jack_count < est.view_count:
         raise Warning('modelspec.jack_count does not match est.view_count')
         # modelspec.tile_jacks(nfolds)
+    fit_count = modelspec.fit_count * est.view_count
+    if ((n_workers > 1) and (fit_count > 1)) or (early_stop is not None):
+        modelspec = nems.analysis.api.fit_nfold(
+                est.views(), modelspec, fitter=fitter_fn, metric=metric_fn,
+                fit_kwargs=fit_kwargs, gradient=gradient,
+                metric_grad=metric_grad_fn, metaname='fit_basic',
+                n_workers=n_workers, early_stop=early_stop)
+        return {'modelspec': modelspec}
+
     for fit_idx in range(modelspec.fit_count):
         for jack_idx, e in enumerate(est.views()):
             modelspec.jack_index = jack_idx
@@ -965,7 +1093,8 @@ def fit_basic(modelspec, est, max_iter=1000, tolerance=1e-7,
                      jack_idx + 1, modelspec.jack_count, tolerance, max_iter)
             modelspec = nems.analysis.api.fit_basic(
                     e, modelspec, fit_kwargs=fit_kwargs,
-                    metric=metric_fn, fitter=fitter_fn)
+                    metric=metric_fn, fitter=fitter_fn,
+                    gradient=gradient, metric_grad=metric_grad_fn)
 
     return {'modelspec': modelspec}
 
@@ -0,0 +1,61 @@
+"""
+Compare the per-evaluation overhead of evaluating a model on a regular
+Recording (a full RasterizedSignal is built for the output of every module)
+against a FitRecording (outputs are lightweight FitSignals), which is what
+fit_basic uses inside its cost function.
+
+usage: python benchmark_fit_mode.py [n_times]
+"""
+import sys
+import timeit
+
+import numpy as np
+
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+from nems.initializers import from_keywords
+from nems.priors import set_mean_phi
+from nems.recording import Recording, FitRecording
+
+
+def cost(rec, modelspec):
+    # same work as nems.analysis.cost_functions.basic_cost, minus the
+    # unpacking of the parameter vector
+    result = ms.evaluate(rec, modelspec)
+    return metrics.nmse(result, 'pred', 'resp')
+
+
+if __name__ == '__main__':
+    n_times = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    modelname = 'wc.18x1-fir.1x15-lvl.1-dexp.1'
+
+    stim = np.random.rand(18, n_times)
+    resp = np.random.rand(1, n_times)
+    rec = Recording.load_from_arrays([stim, resp], 'benchmark', 100,
+                                     sig_names=['stim', 'resp'])
+    rec['pred'] = rec['stim'].copy()
+    fit_rec = FitRecording(rec)
+
+    modelspec = set_mean_phi(from_keywords(modelname))
+    assert cost(rec, modelspec) == cost(fit_rec, modelspec)
+
+    n = 200
+    kwargs = dict(repeat=10, number=n,
+                  globals={'cost': cost, 'modelspec': modelspec,
+                           'rec': rec, 'fit_rec': fit_rec})
+    rec_result = timeit.repeat('cost(rec, modelspec)', **kwargs)
+    fit_result = timeit.repeat('cost(fit_rec, modelspec)', **kwargs)
+
+    def compare(name, result, reference_result):
+        # Always take the *minimum* since this is an indication of how fast the
+        # computer can do it. Other values are likely affected by interrupts in
+        # other programs.
+        result = np.array(result)*1e3/n
+        reference_result = np.array(reference_result)*1e3/n
+        min_result = np.min(result)
+        speedup = np.min(reference_result)/np.min(result)
+        print('{}\t{:.4f} msec\tspeedup of {:.4f}x'.format(name, min_result, speedup))
+
+    print('{}, {} time bins, per evaluation:'.format(modelname, n_times))
+    compare('Recording', rec_result, rec_result)
+    compare('FitRecording', fit_result, rec_result)
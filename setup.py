@@ -20,6 +20,7 @@ EXTRAS_REQUIRES = {
     'nwb': ['allensdk'],
     'tensorflow': ['tensorflow==2.2', 'tensorboard', 'tensorflow-probability==0.10.1'],
     'tests': ['pytest', 'pytest-benchmark'],
+    'numba': ['numba'],
     'gui': ['PyQt5', 'pyqtgraph']
 }
 
@@ -3,9 +3,11 @@ import pytest
 import numpy as np
 import pandas as pd
 
+from nems import epoch as ep
 from nems.epoch import (epoch_union, epoch_difference, epoch_intersection,
                         epoch_contains, epoch_contained, adjust_epoch_bounds,
-                        remove_overlap, find_common_epochs, add_epoch)
+                        remove_overlap, merge_epoch, find_common_epochs,
+                        add_epoch)
 
 @pytest.fixture()
 def epoch_a():
@@ -300,6 +302,127 @@ def test_remove_overlap():
     assert np.all(actual == expected)
 
 
+def _random_epochs(rng, n, disjoint, duration=40):
+    '''
+    n random integer epochs within [0, duration + 10]. Disjoint epochs are
+    sorted and may touch or have zero length.
+    '''
+    if disjoint:
+        return np.sort(rng.randint(0, duration, 2 * n)).reshape(-1, 2)
+    starts = rng.randint(0, duration, n)
+    return np.stack((starts, starts + rng.randint(0, 10, n)), axis=1)
+
+
+def _coverage(epochs, duration=50, resolution=4):
+    '''
+    Rasterized open interior of the union of epochs.
+    '''
+    t = (np.arange(duration * resolution) + 0.5) / resolution
+    covered = np.zeros(len(t), dtype=bool)
+    for lb, ub in epochs:
+        covered |= (t > lb) & (t < ub)
+    return covered
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_epoch_algebra_matches_reference(seed):
+    rng = np.random.RandomState(seed)
+    for i in range(50):
+        na, nb = rng.randint(1, 8, 2)
+        a = _random_epochs(rng, na, disjoint=False)
+        b = _random_epochs(rng, nb, disjoint=False)
+
+        for f in (merge_epoch, remove_overlap):
+            expected = getattr(ep, f.__name__ + '_reference')(a)
+            assert np.array_equal(f(a), expected.reshape(-1, 2))
+        assert np.array_equal(epoch_union(a, b),
+                              ep.epoch_union_reference(a, b))
+        for mode in ('start', 'end', 'both', 'any'):
+            assert np.array_equal(epoch_contains(a, b, mode),
+                                  ep.epoch_contains_reference(a, b, mode))
+        assert np.array_equal(epoch_contained(a, b),
+                              ep.epoch_contained_reference(a, b))
+        expected = ep.epoch_intersection_full_reference(a, b)
+        assert np.array_equal(ep.epoch_intersection_full(a, b),
+                              expected.reshape(-1, 2))
+
+        # the reference intersection only handles disjoint epochs, and also
+        # keeps some pieces of zero length
+        a = _random_epochs(rng, na, disjoint=True)
+        b = _random_epochs(rng, nb, disjoint=True)
+        expected = ep.epoch_intersection_reference(a, b).reshape(-1, 2)
+        keep = (expected[:, 0] < expected[:, 1]) | \
+            np.isin(expected[:, 0], a[a[:, 0] == a[:, 1], 0])
+        assert np.array_equal(epoch_intersection(a, b), expected[keep])
+
+
+def test_intersection_overlapping_a():
+    # overlapping and repeated occurences of a each keep their own pieces
+    a = np.array([[2.1, 2.7], [6.7, 7.4], [1.4, 3.7], [2.1, 2.4]])
+    b = np.array([[1, 5.1]])
+    expected = np.array([[1.4, 3.7], [2.1, 2.4], [2.1, 2.7]])
+    assert np.array_equal(epoch_intersection(a, b), expected)
+    assert np.array_equal(ep.epoch_intersection_reference(a, b), expected)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_intersection_overlapping_a_matches_reference(seed):
+    rng = np.random.RandomState(seed)
+    for i in range(50):
+        na, nb = rng.randint(1, 8, 2)
+        a = _random_epochs(rng, na, disjoint=False)
+        a = np.concatenate((a, a[rng.randint(0, na, 2)]))
+        b = _random_epochs(rng, nb, disjoint=True)
+
+        # the reference, one occurence of a at a time
+        a = a[np.lexsort((a[:, 1], a[:, 0]))]
+        expected = np.concatenate(
+            [ep.epoch_intersection_reference(a[[k]], b).reshape(-1, 2)
+             for k in range(len(a))])
+        # pieces of zero length are only kept strictly inside b
+        inside = (expected[:, :1] > b[:, 0]) & (expected[:, :1] < b[:, 1])
+        keep = (expected[:, 0] < expected[:, 1]) | inside.any(axis=1)
+        assert np.array_equal(epoch_intersection(a, b), expected[keep])
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_epoch_difference_intersection_coverage(seed):
+    rng = np.random.RandomState(seed)
+    for i in range(50):
+        na, nb = rng.randint(1, 8, 2)
+        a = _random_epochs(rng, na, disjoint=bool(i % 2))
+        b = _random_epochs(rng, nb, disjoint=False)
+
+        difference = epoch_difference(a, b)
+        assert np.all(difference[:, 0] <= difference[:, 1])
+        assert np.array_equal(_coverage(difference),
+                              _coverage(a) & ~_coverage(merge_epoch(b)))
+        intersection = epoch_intersection(a, b)
+        assert np.array_equal(_coverage(intersection),
+                              _coverage(a) & _coverage(b))
+        assert np.all(epoch_contained(intersection, merge_epoch(a)))
+        assert np.all(epoch_contained(intersection, merge_epoch(b)))
+
+
+def test_difference_partial_overlap():
+    # epochs in a that start inside one in b and extend past it
+    a = np.array([[0, 10], [20, 30]])
+    b = np.array([[5, 15], [18, 25]])
+    expected = np.array([[0, 5], [25, 30]])
+    assert np.array_equal(epoch_difference(a, b), expected)
+
+
+def test_epoch_algebra_empty():
+    a = np.array([[0, 10], [20, 30]])
+    empty = np.array([])
+    assert epoch_intersection(a, empty).shape == (0, 2)
+    assert np.array_equal(epoch_difference(a, empty), a)
+    assert np.array_equal(epoch_union(a, empty), a)
+    assert not np.any(epoch_contained(a, empty))
+    assert merge_epoch(empty).shape == (0, 2)
+    assert remove_overlap(empty).shape == (0, 2)
+
+
 def test_find_common_epochs(epoch_df):
     expected = {
         ('parent', 0, 10),
@@ -333,3 +456,31 @@ def test_add_epoch(epoch_df):
     expected = [[1, 2], [30, 31]]
     values = result.loc[m, ['start', 'end']].values
     assert np.array_equal(expected, values)
+
+
+def test_add_epoch_contained(epoch_df):
+    result = add_epoch(epoch_df, 'child', 'parent_1', new_name='early_child',
+                       operation='contained')
+    m = result['name'] == 'early_child'
+    expected = [[1, 2], [1, 6], [6, 7], [7, 11], [9, 11]]
+    assert np.array_equal(result.loc[m, ['start', 'end']].values, expected)
+
+
+def test_group_epochs_by_parent(epoch_df):
+    result = list(ep.group_epochs_by_parent(epoch_df, r'^parent_\d+'))
+    assert [name for name, _ in result] == ['parent_1', 'parent_2']
+    assert result[0][1].index.tolist() == [0, 1, 2, 3, 4, 5, 6]
+    assert result[1][1].index.tolist() == [7, 8, 9, 10, 11, 12]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_epoch_contained_pairs(seed):
+    rng = np.random.RandomState(seed)
+    a = _random_epochs(rng, 20, disjoint=False)
+    b = _random_epochs(rng, 50, disjoint=False)
+    a_index, b_index = ep.epoch_contained_pairs(a, b)
+
+    expected = [(i, j) for i in range(len(a)) for j in range(len(b))
+                if (a[i, 0] <= b[j, 0]) and (b[j, 1] <= a[i, 1])]
+    assert sorted(zip(a_index, b_index)) == expected
+    assert np.all(np.diff(a_index) >= 0)
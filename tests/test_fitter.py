@@ -1,8 +1,20 @@
 import pytest
 
 import numpy as np
+from functools import partial
 
+from nems.analysis.cost_functions import gradient_cost
+from nems.analysis.fit_basic import fit_basic
+from nems.analysis.fit_nfold import fit_nfold, fit_multistart
 from nems.fitters.mappers import simple_vector, to_bounds_array
+from nems.fitters.util import (check_gradient, phi_to_vector, vector_to_phi,
+                               PhiLayout)
+from nems.initializers import from_keywords, rand_phi
+import nems.metrics.api as metrics
+import nems.modelspec as ms
+from nems.priors import set_random_phi
+from nems.recording import Recording
+import nems.segmentors
 
 
 def test_simple_vector_subset(simple_modelspec_with_phi):
@@ -38,6 +50,30 @@ def test_simple_vector_subset(simple_modelspec_with_phi):
     assert id(simple_modelspec_with_phi) == id(new_modelspec)
 
 
+def test_phi_layout():
+    template = [{'coefs': np.zeros((2, 3)), 'baseline': 0.0}, None, {},
+                {'a': 1, 'b': [0.5, 1.5]}]
+    layout = PhiLayout(template)
+    assert layout.size == 10
+    assert np.array_equal(layout.pack(template), phi_to_vector(template))
+
+    vector = np.arange(10, dtype=float)
+    phi = layout.unpack(vector)
+    expected = vector_to_phi(vector, template)
+    assert [list(p) for p in phi] == [list(p) for p in expected]
+    for p, e in zip(phi, expected):
+        for k in p:
+            assert np.array_equal(p[k], e[k])
+            assert np.shape(p[k]) == np.shape(e[k])
+    # arrays are views of the vector, scalars are not
+    assert np.shares_memory(phi[0]['coefs'], vector)
+    assert np.isscalar(phi[0]['baseline'])
+    assert np.array_equal(layout.pack(phi), vector)
+
+    with pytest.raises(ValueError):
+        layout.unpack(vector[:-1])
+
+
 @pytest.mark.xfail  # 'wc' option 'g' bounds changed after 4e77819
 def test_simple_vector_bounds_subset(simple_modelspec_with_phi):
     packer, unpacker, bounds = simple_vector(simple_modelspec_with_phi)
@@ -167,3 +203,102 @@ def test_partial_definition(bounds_modelspec):
     # Don't need to assert anything here, just shouldn't get an error
     # for leaving 'sd' bounds undefined.
     x = bounds(bounds_modelspec)
+
+
+@pytest.mark.parametrize('keywords', [
+    'wc.18x2.g-fir.2x15-lvl.1-dexp.1',
+    'wc.18x2.n-fir.2x10-dlog-lvl.1-relu.1',
+    'wc.18x3-fir.3x4-scl.1-lvl.1-stategain.2',
+    'wc.18x3.g-lvl.3-dexp.3-wc.3x1-lvl.1',
+])
+@pytest.mark.parametrize('metric', [metrics.nmse_grad, metrics.mse_grad])
+def test_gradient(keywords, metric):
+    np.random.seed(0)
+    stim = np.random.rand(18, 200)
+    stim[:, 5] = np.nan
+    resp = np.random.rand(1, 200)
+    state = np.vstack([np.ones((1, 200)), np.random.randn(1, 200)])
+    rec = Recording.load_from_arrays([stim, resp, state], 'gradient', 100,
+                                     sig_names=['stim', 'resp', 'state'])
+    rec['pred'] = rec['stim'].copy()
+
+    modelspec = set_random_phi(from_keywords(keywords))
+    packer, unpacker, _ = simple_vector(modelspec)
+    cost_fn = partial(gradient_cost, unpacker=unpacker, modelspec=modelspec,
+                      data=rec, segmentor=nems.segmentors.use_all_data,
+                      evaluator=ms.evaluate_gradient, metric=metric)
+    grad, numeric_grad, max_error = check_gradient(cost_fn, packer(modelspec))
+    assert max_error < 1e-6
+
+
+def test_fit_basic_gradient(simple_recording):
+    rec = simple_recording
+    rec['pred'] = rec['stim'].copy()
+    modelspec = set_random_phi(from_keywords('wc.18x2.g-fir.2x15-lvl.1'))
+    fit_kwargs = {'max_iter': 50}
+
+    result = fit_basic(rec, modelspec, fit_kwargs=fit_kwargs, gradient=True)
+    start_err = metrics.nmse(ms.evaluate(rec, modelspec), 'pred', 'resp')
+    final_err = metrics.nmse(ms.evaluate(rec, result), 'pred', 'resp')
+    assert final_err < start_err
+
+    # no backward for stp, falls back to finite differences
+    modelspec = set_random_phi(from_keywords('wc.18x2-stp.2-fir.2x4-lvl.1'))
+    fit_kwargs = {'max_iter': 2}
+    expected = fit_basic(rec, modelspec, fit_kwargs=fit_kwargs)
+    result = fit_basic(rec, modelspec, fit_kwargs=fit_kwargs, gradient=True)
+    assert np.array_equal(_packed_phi(result), _packed_phi(expected))
+
+
+def test_fit_nfold_parallel(simple_recording):
+    est = simple_recording.jackknife_masks_by_time(3, tiled=True)
+    modelspec = set_random_phi(from_keywords('wc.18x1-fir.1x5-lvl.1'))
+    fit_kwargs = {'max_iter': 20}
+
+    serial = fit_nfold(est.views(), modelspec, fit_kwargs=fit_kwargs)
+    parallel = fit_nfold(est.views(), modelspec, fit_kwargs=fit_kwargs,
+                         n_workers=3)
+    assert parallel.jack_count == 3
+    for jack_idx in range(3):
+        expected = _packed_phi(serial.set_jack(jack_idx))
+        assert np.array_equal(_packed_phi(parallel.set_jack(jack_idx)),
+                              expected)
+    assert not np.array_equal(_packed_phi(parallel.set_jack(0)),
+                              _packed_phi(parallel.set_jack(1)))
+
+    # same as fitting a single fold
+    tiled = modelspec.copy().tile_jacks(3).set_jack(1)
+    expected = fit_basic(est.views()[1], tiled, fit_kwargs=fit_kwargs)
+    assert np.array_equal(_packed_phi(expected),
+                          _packed_phi(parallel.set_jack(1)))
+
+
+def test_fit_multistart(simple_recording):
+    rec = simple_recording
+    rec['pred'] = rec['stim'].copy()
+    modelspec = rand_phi(from_keywords('wc.18x1-fir.1x5-lvl.1'),
+                         rand_count=3)['modelspec']
+    fit_kwargs = {'max_iter': 20}
+
+    result = fit_multistart(rec, modelspec, fit_kwargs=fit_kwargs,
+                            n_workers=3)
+    assert (result.fit_count, result.jack_count) == (3, 1)
+    for fit_idx in range(3):
+        expected = fit_basic(rec, modelspec.copy().set_fit(fit_idx),
+                             fit_kwargs=fit_kwargs)
+        assert np.array_equal(_packed_phi(result.set_fit(fit_idx)),
+                              _packed_phi(expected))
+
+    # the random starts are given up as soon as they are behind the first
+    result = fit_multistart(rec, modelspec, fit_kwargs=fit_kwargs,
+                            early_stop=0, early_stop_evals=1)
+    assert result.meta['early_stopped'] == [[1, 0], [2, 0]]
+    expected = fit_basic(rec, modelspec.copy().set_fit(0),
+                         fit_kwargs=fit_kwargs)
+    assert np.array_equal(_packed_phi(result.set_fit(0)),
+                          _packed_phi(expected))
+
+
+def _packed_phi(modelspec):
+    packer, _, _ = simple_vector(modelspec)
+    return np.array(packer(modelspec))
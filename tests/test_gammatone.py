@@ -0,0 +1,109 @@
+import pytest
+
+import numpy as np
+import scipy.signal as ss
+
+from nems.analysis.gammatone import filters, gtgram, fftweight
+
+FS = 16000
+
+
+@pytest.fixture
+def wave():
+    return np.random.RandomState(0).randn(FS // 2)
+
+
+def erb_filterbank_loop(wave, coefs):
+    '''
+    The original erb_filterbank: a cascade of four lfilter calls per channel.
+    '''
+    output = np.zeros((coefs.shape[0], wave.shape[0]))
+    gain = coefs[:, 9]
+    As1 = coefs[:, (0, 1, 5)]
+    As2 = coefs[:, (0, 2, 5)]
+    As3 = coefs[:, (0, 3, 5)]
+    As4 = coefs[:, (0, 4, 5)]
+    Bs = coefs[:, 6:9]
+    for idx in range(0, coefs.shape[0]):
+        y1 = ss.lfilter(As1[idx], Bs[idx], wave)
+        y2 = ss.lfilter(As2[idx], Bs[idx], y1)
+        y3 = ss.lfilter(As3[idx], Bs[idx], y2)
+        y4 = ss.lfilter(As4[idx], Bs[idx], y3)
+        output[idx, :] = y4 / gain[idx]
+    return output
+
+
+def test_erb_filterbank(wave):
+    cfs = filters.centre_freqs(FS, 16, 100, 8000)
+    coefs = np.flipud(filters.make_erb_filters(FS, cfs))
+    expected = erb_filterbank_loop(wave, coefs)
+    output = filters.erb_filterbank(wave, coefs)
+    np.testing.assert_allclose(output, expected, rtol=0,
+                               atol=1e-12 * np.abs(expected).max())
+
+    # filtering in pieces, carrying the filter state, is the same
+    sos, gain = filters.make_erb_sos(coefs)
+    pieces = []
+    zi = None
+    for start in range(0, wave.shape[0], 1001):
+        piece, zi = filters.erb_filterbank_sos(wave[start:start + 1001],
+                                               sos, gain, zi)
+        pieces.append(piece)
+    assert np.array_equal(np.concatenate(pieces, axis=1), output)
+
+
+@pytest.mark.parametrize('n', [FS // 2, 1234, 400, 399])
+def test_gtgram(wave, n):
+    wave = wave[:n]
+    xe = gtgram.gtgram_xe(wave, FS, 16, 100, 8000)
+    nwin, hop_samples, ncols = gtgram.gtgram_strides(FS, 0.025, 0.01,
+                                                     xe.shape[1])
+    expected = np.zeros((16, ncols))
+    for cnum in range(ncols):
+        segment = xe[:, cnum * hop_samples + np.arange(nwin)]
+        expected[:, cnum] = np.sqrt(segment.mean(1))
+
+    y = gtgram.gtgram(wave, FS, 0.025, 0.01, 16, 100, 8000)
+    np.testing.assert_allclose(y, expected, rtol=1e-12)
+
+    for chunk_size in [160, 777]:
+        y_chunked = gtgram.gtgram(wave, FS, 0.025, 0.01, 16, 100, 8000,
+                                  chunk_size=chunk_size)
+        assert np.array_equal(y_chunked, y)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 50, 333, 1000])
+def test_gtgram_hop_longer_than_window(wave, chunk_size):
+    # with gaps between the windows, a chunk can end before the next column
+    # starts
+    wave = wave[:3000]
+    y = gtgram.gtgram(wave, 1000, 0.05, 0.07, 8, 50, 400)
+    assert y.shape == (8, 43)
+    y_chunked = gtgram.gtgram(wave, 1000, 0.05, 0.07, 8, 50, 400,
+                              chunk_size=chunk_size)
+    assert np.array_equal(y_chunked, y)
+
+
+@pytest.mark.parametrize('n', [FS // 2, 1100, 1024, 1000])
+def test_fft_gtgram(wave, n):
+    wave = wave[:n]
+    nfft = 1024
+    nwin, nhop, _ = gtgram.gtgram_strides(FS, 0.025, 0.01, 0)
+
+    # the original specgram loop
+    win = fftweight.specgram_window(nfft, nwin)
+    sgram = np.zeros((1 + nfft // 2, 1 + (n - nfft) // nhop), complex)
+    for c, b in enumerate(range(0, n - nfft, nhop)):
+        sgram[:, c] = np.fft.fft(win * wave[b:b + nfft])[0:1 + nfft // 2]
+    assert np.array_equal(fftweight.specgram(wave, nfft, FS, nwin, nhop),
+                          sgram)
+
+    weights, _ = fftweight.fft_weights(nfft, FS, 16, 1, 100, FS / 2,
+                                       nfft / 2 + 1)
+    expected = weights.dot(np.abs(sgram)) / nfft
+    result = fftweight.fft_gtgram(wave, FS, 0.025, 0.01, 16, 100)
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+    result_chunked = fftweight.fft_gtgram(wave, FS, 0.025, 0.01, 16, 100,
+                                          chunk_size=2000)
+    np.testing.assert_allclose(result_chunked, result, rtol=1e-12)
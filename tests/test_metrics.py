@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from nems.recording import Recording
+import nems.metrics.api as metrics
+
+
+def test_j_corrcoef_nmse():
+    np.random.seed(0)
+    pred = np.random.rand(3, 1000)
+    resp = pred + np.random.rand(3, 1000)
+    pred[1, ::7] = np.nan
+    resp[2, :] = 1
+    rec = Recording.load_from_arrays([pred, resp], 'rec', 100,
+                                     sig_names=['pred', 'resp'])
+    njacks = 10
+
+    cc, ee, mse, se_mse = metrics.j_corrcoef_nmse(rec, njacks=njacks)
+    assert np.array_equal((cc, ee), metrics.j_corrcoef(rec, njacks=njacks))
+    assert np.array_equal((mse, se_mse), metrics.j_nmse(rec, njacks=njacks))
+
+    # leave-one-out estimates computed one jackknife at a time
+    for i in range(2):
+        ff = np.isfinite(pred[i]) & np.isfinite(resp[i])
+        p, r = pred[i, ff], resp[i, ff]
+        chunksize = int(np.ceil(len(p) / njacks / 10))
+        jack = (np.arange(len(p)) // chunksize) % njacks
+        jc = [np.corrcoef(p[jack != j], r[jack != j])[0, 1]
+              for j in range(njacks)]
+        je = [np.sqrt(np.mean((p[jack != j] - r[jack != j])**2)) /
+              np.std(r[jack != j]) for j in range(njacks)]
+        np.testing.assert_allclose(cc[i], np.mean(jc))
+        np.testing.assert_allclose(ee[i], np.std(jc) * np.sqrt(njacks-1))
+        np.testing.assert_allclose(mse[i], np.mean(je))
+        np.testing.assert_allclose(se_mse[i], np.std(je) * np.sqrt(njacks-1))
+
+    # constant response
+    assert cc[2] == 0 and ee[2] == 0
+
+
+def test_j_corrcoef_nmse_constant_subset():
+    # sparse signals, so that leaving out one jackknife leaves pred or resp
+    # constant
+    rng = np.random.RandomState(0)
+    pred = 0.1 * rng.rand(3, 20000)
+    resp = np.zeros((3, 20000))
+    resp[:, 5000:5020] = rng.rand(3, 20) + 1
+    pred += resp
+    pred[2] = 0
+    pred[2, 9000:9020] = 1
+    rec = Recording.load_from_arrays([pred, resp], 'rec', 100,
+                                     sig_names=['pred', 'resp'])
+    njacks = 20
+    cc, ee, mse, se_mse = metrics.j_corrcoef_nmse(rec, njacks=njacks)
+
+    # the per-jackknife rules of the loop versions: a constant subset gives
+    # a correlation of NaN (ignored) and an nMSE of 1
+    chunksize = int(np.ceil(pred.shape[1] / njacks / 10))
+    jack = (np.arange(pred.shape[1]) // chunksize) % njacks
+    for i in range(3):
+        jc, je = [], []
+        for j in range(njacks):
+            p, r = pred[i, jack != j], resp[i, jack != j]
+            constant = (np.ptp(p) == 0) or (np.ptp(r) == 0)
+            jc.append(np.nan if constant else np.corrcoef(p, r)[0, 1])
+            je.append(1 if np.std(r) == 0 else
+                      np.sqrt(np.mean((p - r)**2)) / np.std(r))
+        np.testing.assert_allclose(cc[i], np.nanmean(jc), atol=1e-12)
+        np.testing.assert_allclose(ee[i], np.nanstd(jc) * np.sqrt(njacks-1),
+                                   atol=1e-12)
+        np.testing.assert_allclose(mse[i], np.mean(je))
+        np.testing.assert_allclose(se_mse[i], np.std(je) * np.sqrt(njacks-1),
+                                   atol=1e-12)
+
+
+def test_r_ceiling_floor():
+    from nems.metrics.corrcoef import _pairwise_corrcoef
+
+    np.random.seed(1)
+    nstim, reps, L = 4, 5, 40
+    stim = np.random.rand(2, nstim * L)
+    resp = np.tile(stim, reps) + np.random.rand(2, nstim * L * reps)
+    pred = np.tile(stim, reps)
+    epochs = pd.DataFrame({
+        'start': np.arange(nstim * reps) * L / 100,
+        'end': (np.arange(nstim * reps) + 1) * L / 100,
+        'name': ['STIM_%d' % (i % nstim) for i in range(nstim * reps)]})
+    rec = Recording.load_from_arrays([resp, pred], 'rec', 100,
+                                     sig_names=['resp', 'pred'])
+    for s in rec.signals.values():
+        s.epochs = epochs
+
+    r_ceiling = metrics.r_ceiling(rec, rec, rand_seed=0)
+    r_floor = metrics.r_floor(rec, rand_seed=0)
+    assert r_ceiling.shape == r_floor.shape == (2,)
+    assert np.all(r_ceiling > r_floor)
+    assert np.array_equal(r_ceiling, metrics.r_ceiling(rec, rec, rand_seed=0))
+    assert np.array_equal(r_floor, metrics.r_floor(rec, rand_seed=0))
+
+    # NaN-aware correlations between all pairs of rows
+    X = np.random.rand(4, 50)
+    X[1, ::3] = np.nan
+    cc = _pairwise_corrcoef(X)[0]
+    for i in range(4):
+        for j in range(4):
+            ff = np.isfinite(X[i]) & np.isfinite(X[j])
+            np.testing.assert_allclose(
+                cc[i, j], np.corrcoef(X[i, ff], X[j, ff])[0, 1])
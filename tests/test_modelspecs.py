@@ -1,6 +1,14 @@
+import json
+
 import pytest
 
-from nems.modelspec import get_best_modelspec, sort_modelspecs
+import numpy as np
+
+from nems.initializers import from_keywords
+from nems.analysis.fit_basic import fit_basic
+from nems.modelspec import (evaluate, get_best_modelspec, sort_modelspecs,
+                            EvalProfile)
+from nems.priors import set_mean_phi
 
 
 @pytest.fixture()
@@ -31,3 +39,59 @@ def test_best(modelspecs):
     best = get_best_modelspec(modelspecs, metakey='r_test',
                               comparison='least')
     assert best[0][0]['fn'] == 'three'
+
+
+def test_eval_cache(simple_recording):
+    modelspec = from_keywords('wc.18x1-fir.1x15-lvl.1-dexp.1')
+    modelspec = set_mean_phi(modelspec)
+    simple_recording['pred'] = simple_recording['stim']
+    expected = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+
+    modelspec.eval_cache_on()
+    pred = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+    np.testing.assert_array_equal(pred, expected)
+    assert modelspec.eval_cache.misses == 1
+
+    # unchanged modelspec is served straight from the cache
+    pred = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+    np.testing.assert_array_equal(pred, expected)
+    assert modelspec.eval_cache.hits == 1
+
+    # changing the last module only re-evaluates that module
+    modelspec[3]['phi']['base'] = modelspec[3]['phi']['base'] + 1
+    pred = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+    assert modelspec.eval_cache.hits == 2
+    modelspec.eval_cache_off()
+    expected = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+    np.testing.assert_array_equal(pred, expected)
+
+
+def test_eval_profile(simple_recording):
+    modelspec = set_mean_phi(from_keywords('wc.18x1-fir.1x15-lvl.1-dexp.1'))
+    simple_recording['pred'] = simple_recording['stim']
+    expected = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+
+    profile = modelspec.profile_on()
+    for i in range(3):
+        pred = evaluate(simple_recording, modelspec)['pred'].as_continuous()
+    np.testing.assert_array_equal(pred, expected)
+    assert modelspec.profile_off() is profile
+    assert profile.stats['evaluate'][0] == 3
+    fir = profile.stats['evaluate;1:nems.modules.fir.basic']
+    assert fir[0] == 3
+    assert fir[2] == 3 * pred.nbytes
+
+    result = fit_basic(simple_recording, modelspec, profile=True,
+                       fit_kwargs={'max_iter': 5})
+    meta = result.meta['profile']
+    assert meta['evals'] > 0
+    assert meta['stats']['cost']['calls'] == meta['evals']
+    assert meta['stats']['cost;metric']['calls'] == meta['evals']
+    assert result.eval_profile is None
+
+    profile = EvalProfile.from_dict(meta)
+    assert profile.to_dict() == meta
+    assert json.loads(profile.to_json()) == meta
+    folded = profile.to_folded().splitlines()
+    assert len(folded) == len(meta['stats'])
+    assert folded[0].rsplit(' ', 1)[0] in meta['stats']
@@ -67,6 +67,48 @@ def test_stp():
     # Y = stp._stp(X, u, tau)
 
 
+def test_stp_recursion():
+    np.random.seed(0)
+    for n_chans in [2, stp._NUMPY_MIN_CHANS]:
+        ustim = np.random.rand(n_chans, 300) * 0.5
+        ustim[0, 100:120] = 2  # drives depression below zero
+        a = np.full(n_chans, 0.05)
+        ui = np.where(np.arange(n_chans) % 2, -1.0, 1.0)
+        lower = np.where(ui > 0, 0, -np.inf)
+        upper = np.where(ui > 0, np.inf, 5)
+
+        expected = stp._stp_recursion_loop(ustim, a, lower, upper)
+        assert expected.min() == 0
+        for fn in (stp._stp_recursion, stp._stp_recursion_numpy,
+                   stp._stp_recursion_python):
+            np.testing.assert_array_equal(fn(ustim, a, lower, upper),
+                                          expected)
+
+
+def test_stp_quick_eval():
+    np.random.seed(0)
+    x = np.random.rand(3, 1000) * 0.01
+    a = np.full((3, 1), 0.1)
+    reset_times = np.array([10, 15, 300, 310, 1000])
+    td = stp._stp_quick(x, a, reset_times)
+
+    # same integration, one chunk at a time
+    expected = np.ones_like(x)
+    x0, imu0 = 0., 0.
+    for j in range(len(reset_times) - 1):
+        si = slice(reset_times[j], reset_times[j + 1])
+        xi = x[:, si]
+        ix = stp._cumtrapz(a + xi) + a + (x0 + xi[:, :1]) / 2
+        mu = np.exp(ix)
+        imu = stp._cumtrapz(mu * xi) + (x0 + mu[:, :1] * xi[:, :1]) / 2 + imu0
+        expected[:, si] = 1 - imu / mu
+        x0 = xi[:, -1:]
+        imu0 = imu[:, -1:] / mu[:, -1:]
+
+    np.testing.assert_allclose(td, expected, rtol=1e-12)
+    assert np.all(td[:, :10] == 1)
+
+
 def test_firbank():
     n_banks = 2
     bank_count = 3
@@ -96,3 +138,36 @@ def test_fir_dexp():
     n_coefs=20
 
     fir.fir_dexp_coefficients(phi, n_coefs=n_coefs)
+
+
+def test_firbank_batch_filter():
+    x = np.random.randn(4, 500)
+    x_nan = x.copy()
+    x_nan[1, 100:110] = np.nan
+
+    for method in ['direct', 'fft', 'auto']:
+        # one shared stimulus per bank, with non_causal shift
+        coefficients = np.random.randn(12, 40)
+        y = fir.batch_filter(x, coefficients, 3, non_causal=2, method=method)
+        y0 = fir.per_channel(x, coefficients, 3, non_causal=2)
+        np.testing.assert_allclose(y, y0, atol=1e-10)
+
+        # one stimulus per filter
+        coefficients = np.random.randn(4, 15)
+        y = fir.batch_filter(x, coefficients, 2, method=method)
+        y0 = fir.per_channel(x, coefficients, 2)
+        np.testing.assert_allclose(y, y0, atol=1e-10)
+
+        # each filter applied to each input channel
+        coefficients = np.random.randn(3, 15)
+        y = fir.batch_filter(x, coefficients, cross_channels=True,
+                             method=method)
+        y0 = fir.per_channel(x, coefficients, cross_channels=True)
+        assert y.shape == (12, 500)
+        np.testing.assert_allclose(y, y0, atol=1e-10)
+
+    # NaNs only contaminate the same samples as lfilter
+    coefficients = np.random.randn(4, 40)
+    y = fir.batch_filter(x_nan, coefficients)
+    y0 = fir.per_channel(x_nan, coefficients)
+    np.testing.assert_allclose(y, y0, atol=1e-10)
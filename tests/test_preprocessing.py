@@ -2,10 +2,12 @@ import pytest
 
 import numpy as np
 import pandas as pd
+import scipy.signal as ss
 
 from nems.signal import RasterizedSignal
 from nems.recording import Recording
-from nems.preprocessing import average_away_epoch_occurrences
+from nems.preprocessing import (average_away_epoch_occurrences,
+                                sliding_band_power)
 
 
 def make_signal(signal_name='dummy_signal_1', recording_name='dummy_recording',
@@ -82,3 +84,56 @@ def test_average_away_epoch_occurrences(recording):
     assert epochs.iat[1, 0] == 'stim2'
     assert epochs.iat[0, 2] == 0.98
     assert epochs.iat[1, 2] == 1.96
+
+
+def test_average_away_epoch_occurrences_back_to_back():
+    # stimuli that end exactly where the next one starts, with some NaN
+    # samples and nested epochs
+    fs = 50
+    data = np.arange(400, dtype=float).reshape(2, 200)
+    data[0, 10:20] = np.nan
+    data[:, 100:150] = np.nan
+    epochs = pd.DataFrame({
+        'start': np.array([0, 50, 100, 150, 0, 50, 100, 150, 0]) / fs,
+        'end': np.array([50, 100, 150, 200, 10, 60, 110, 160, 200]) / fs,
+        'name': ['STIM_a', 'STIM_b', 'STIM_a', 'STIM_b',
+                 'PreStimSilence', 'PreStimSilence', 'PreStimSilence',
+                 'PreStimSilence', 'TRIAL'],
+        })
+    signal = RasterizedSignal(fs, data, 'resp', 'rec', epochs=epochs)
+    averaged = average_away_epoch_occurrences(Recording({'resp': signal}))
+
+    expected = np.concatenate([data[:, 0:50], data[:, 150:200] / 2 +
+                               data[:, 50:100] / 2], axis=1)
+    expected[0, 10:20] = np.nan
+    assert np.allclose(averaged['resp'].as_continuous(), expected,
+                       equal_nan=True)
+    assert averaged['resp'].epochs.to_dict('list') == {
+        'name': ['PreStimSilence', 'STIM_a', 'PreStimSilence', 'STIM_b'],
+        'start': [0.0, 0.0, 1.0, 1.0],
+        'end': [0.2, 1.0, 1.2, 2.0],
+        }
+
+
+@pytest.mark.parametrize('nperseg', [60, 75])
+def test_sliding_band_power(nperseg):
+    fs = 5
+    rng = np.random.RandomState(0)
+    x = 100 + np.cumsum(rng.randn(1000))
+    f, power = sliding_band_power(x, fs, nperseg, n_bins=4)
+    assert power.shape == (4, len(x))
+
+    f_expected, _, Sxx = ss.spectrogram(x, fs=fs, nperseg=nperseg,
+                                        noverlap=nperseg-1)
+    assert np.allclose(f, f_expected[:4])
+    # centered on each window, with the ends repeated
+    pre = nperseg // 2
+    post = len(x) - Sxx.shape[1] - pre
+    expected = np.concatenate((np.repeat(Sxx[:4, :1], pre, axis=1), Sxx[:4],
+                               np.repeat(Sxx[:4, -1:], post, axis=1)), axis=1)
+    assert np.allclose(power, expected, rtol=1e-8, atol=1e-10 * Sxx.max())
+
+    x[500] = np.nan
+    _, power = sliding_band_power(x, fs, nperseg, n_bins=4)
+    assert np.all(np.isnan(power[:, 500-nperseg+1+pre:500+1+pre]))
+    assert np.all(np.isfinite(power[:, :500-nperseg+1+pre]))
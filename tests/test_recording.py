@@ -3,7 +3,8 @@ from os.path import dirname, join
 import numpy as np
 import pandas as pd
 import pytest
-from nems.recording import Recording, load_recording, get_demo_recordings
+from nems.recording import (Recording, load_recording, get_demo_recordings,
+                            load_recording_from_targz)
 from nems.signal import RasterizedSignal
 import nems
 
@@ -203,3 +204,172 @@ def test_recording_copy(recording):
     # Ensure we get a true copy of recording
     recording_copy = recording.copy()
     assert id(recording.signals) != id(recording_copy.signals)
+
+
+def test_fit_recording(simple_recording):
+    from nems.initializers import from_keywords
+    from nems.modelspec import evaluate
+    from nems.priors import set_mean_phi
+    from nems.recording import FitRecording
+
+    modelspec = set_mean_phi(from_keywords('wc.18x1-fir.1x15-lvl.1-dexp.1'))
+    simple_recording['pred'] = simple_recording['stim'].copy()
+    expected = evaluate(simple_recording, modelspec)
+
+    fit_rec = FitRecording(simple_recording)
+    result = evaluate(fit_rec, modelspec)
+    assert set(fit_rec.signals.keys()) == set(simple_recording.signals.keys())
+    np.testing.assert_array_equal(result['pred'].as_continuous(),
+                                  expected['pred'].as_continuous())
+    # the input recording isn't changed by evaluation
+    assert fit_rec['pred'].shape == (18, 200)
+
+    rec = result.to_recording()
+    assert type(rec) is Recording
+    assert type(rec['pred']) is RasterizedSignal
+    assert rec['pred'].name == 'pred'
+    assert rec['pred'].shape == (1, 200)
+    assert rec['pred'].fs == expected['pred'].fs
+    assert rec['stim'] is simple_recording['stim']
+    np.testing.assert_array_equal(rec['pred'].as_continuous(),
+                                  expected['pred'].as_continuous())
+
+
+def test_npy_recording(recording, tmp_path):
+    from nems.signal import PointProcess
+
+    spikes = {'cell1': np.array([0.1, 0.5, 2.2]), 'cell2': np.array([1.0])}
+    pp = PointProcess(fs=50, data=spikes, name='spikes',
+                      recording='dummy_recording',
+                      epochs=recording['dummy_signal_1'].epochs)
+    recording.add_signal(pp)
+    recording = recording.tile_views(2)
+    recording.signal_views[1] = recording.signal_views[1].copy()
+    recording.signal_views[1]['dummy_signal_2'] = \
+        recording['dummy_signal_2']._modified_copy(
+            recording['dummy_signal_2'].as_continuous() * 2)
+
+    uri = str(tmp_path / 'dummy.nrec')
+    assert recording.save(uri) == uri
+    rec = load_recording(uri)
+
+    assert rec.name == recording.name
+    assert rec.meta == recording.meta
+    assert rec.view_count == 2
+    for i in range(2):
+        for name, expected in recording.signal_views[i].items():
+            sig = rec.signal_views[i][name]
+            assert type(sig) is type(expected)
+            assert sig.fs == expected.fs
+            assert sig.chans == expected.chans
+            pd.testing.assert_frame_equal(sig.epochs, expected.epochs)
+            if name == 'spikes':
+                for c in spikes:
+                    assert np.array_equal(sig._data[c], expected._data[c])
+            else:
+                assert np.array_equal(sig.as_continuous(),
+                                      expected.as_continuous())
+    assert rec.signal_views[1]['dummy_signal_1'] is rec['dummy_signal_1']
+
+    # signal data are memory mapped
+    assert isinstance(rec['dummy_signal_1'].as_continuous(), np.memmap)
+    assert np.array_equal(rec['dummy_signal_1'].extract_epoch('trial'),
+                          recording['dummy_signal_1'].extract_epoch('trial'))
+
+
+def test_lazy_recording(recording, tmp_path):
+    uri = str(tmp_path / 'dummy.tgz')
+    recording.save(uri)
+
+    rec = load_recording(uri)
+    assert set(rec.signals.keys()) == set(recording.signals.keys())
+    assert not rec.signals.loaded('dummy_signal_1')
+    assert not rec.signals.loaded('dummy_signal_2')
+
+    # copies share the not-yet-loaded signals
+    rec_copy = rec.copy()
+    sig = rec['dummy_signal_1']
+    assert rec.signals.loaded('dummy_signal_1')
+    assert not rec.signals.loaded('dummy_signal_2')
+    assert rec_copy['dummy_signal_1'] is sig
+    assert np.allclose(sig.as_continuous(),
+                       recording['dummy_signal_1'].as_continuous())
+    pd.testing.assert_frame_equal(sig.epochs,
+                                  recording['dummy_signal_1'].epochs)
+
+    # the archive was decompressed for the first signal, the others are read
+    # from there
+    assert np.allclose(rec['dummy_signal_2'].as_continuous(),
+                       recording['dummy_signal_2'].as_continuous())
+    pd.testing.assert_frame_equal(rec['dummy_signal_2'].epochs,
+                                  recording['dummy_signal_2'].epochs)
+
+    # the same signals are read without lazy loading
+    rec = load_recording_from_targz(uri, lazy=False)
+    assert rec.signals.loaded('dummy_signal_1')
+    assert np.allclose(rec['dummy_signal_2'].as_continuous(),
+                       recording['dummy_signal_2'].as_continuous())
+
+    # only the requested signals are read
+    rec = load_recording(uri, signals=['dummy_signal_2'])
+    assert list(rec.signals.keys()) == ['dummy_signal_2']
+    assert rec.name == recording.name
+    assert np.allclose(rec['dummy_signal_2'].as_continuous(),
+                       recording['dummy_signal_2'].as_continuous())
+
+
+def test_interval_mask(recording):
+    from nems.signal import IntervalMask
+
+    rec = recording.and_mask('trial').or_mask('trial2')
+    mask = rec['mask']
+    assert isinstance(mask, IntervalMask)
+    np.testing.assert_array_equal(mask.intervals, [[3, 250]])
+
+    rec = rec.and_mask('pupil_closed', invert=True)
+    mask = rec['mask']
+    np.testing.assert_array_equal(mask.intervals,
+                                  [[3, 15], [60, 150], [190, 250]])
+    dense = np.zeros((1, 250), dtype=bool)
+    for lb, ub in mask.intervals:
+        dense[0, lb:ub] = True
+    np.testing.assert_array_equal(mask.as_continuous(), dense)
+
+    # set operations match the dense equivalents
+    other = IntervalMask.from_signal(mask, [(0, 10), (100, 200)])
+    np.testing.assert_array_equal(mask.invert().as_continuous(), ~dense)
+    np.testing.assert_array_equal(mask.union(other).as_continuous(),
+                                  dense | other.as_continuous())
+    np.testing.assert_array_equal(mask.intersect(other).as_continuous(),
+                                  dense & other.as_continuous())
+
+    # a dense mask with the same values gives the same results
+    dense_rec = rec.copy()
+    dense_rec['mask'] = RasterizedSignal(
+        fs=mask.fs, data=dense, name='mask', recording=mask.recording,
+        epochs=mask.epochs)
+    sig = rec['dummy_signal_1']
+    for r in (rec, dense_rec):
+        np.testing.assert_array_equal(
+            sig.get_epoch_indices('trial2', mask=r['mask']), [[200, 250]])
+        assert len(sig.get_epoch_indices('trial', mask=r['mask'])) == 0
+    masked = rec.apply_mask()['dummy_signal_1'].as_continuous()
+    assert masked.shape == (3, int(dense.sum()))
+    np.testing.assert_array_equal(
+        masked, dense_rec.apply_mask()['dummy_signal_1'].as_continuous())
+    nan_rec = rec.nan_mask()
+    np.testing.assert_array_equal(
+        nan_rec['dummy_signal_1'].as_continuous(),
+        dense_rec.nan_mask()['dummy_signal_1'].as_continuous())
+    pd.testing.assert_frame_equal(nan_rec['dummy_signal_1'].epochs,
+                                  dense_rec.nan_mask()['dummy_signal_1'].epochs)
+
+    # jackknifes split the True samples of the mask between them
+    jacks = [rec.jackknife_mask_by_time(4, i, invert=True)['mask']
+             for i in range(4)]
+    for jack in jacks:
+        assert isinstance(jack, IntervalMask)
+        assert not np.any(jack.as_continuous() & ~dense)
+    jack_est = recording.jackknife_mask_by_epoch(2, 0, 'pupil_closed')['mask']
+    assert isinstance(jack_est, IntervalMask)
+    np.testing.assert_array_equal(jack_est.intervals, [[0, 15], [60, 250]])
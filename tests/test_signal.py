@@ -386,3 +386,142 @@ def test_epoch_to_signal(signal):
     s = signal.epoch_to_signal('pupil_closed')
     assert s.as_continuous().shape == (1, 200)
     assert s.as_continuous().sum() == 85
+
+
+def test_epoch_index_cache(signal):
+    index = signal.epoch_index
+    assert signal.epoch_index is index
+    assert np.all(signal.get_epoch_bounds('pupil_closed') ==
+                  np.array([[0.3, 1.2], [3.0, 3.8]]))
+
+    # copies that keep the epochs share the index
+    assert signal._modified_copy(signal._data).epoch_index is index
+
+    # adding or replacing epochs rebuilds it
+    signal.add_epoch('pupil_closed', np.array([[1.5, 2.0]]))
+    assert signal.epoch_index is not index
+    assert signal.get_epoch_bounds('pupil_closed').shape == (3, 2)
+
+    epochs = signal.epochs.copy()
+    epochs.loc[epochs['name'] == 'trial', 'start'] = 0.5
+    new_signal = signal._modified_copy(signal._data, epochs=epochs)
+    assert np.all(new_signal.get_epoch_bounds('trial') == [[0.5, 4.0]])
+    assert np.all(signal.get_epoch_bounds('trial') == [[0.06, 4.0]])
+
+    # as do edits made in place
+    index = signal.epoch_index
+    rows = np.flatnonzero(signal.epochs['name'] == 'pupil_closed')
+    signal.epochs.loc[signal.epochs.index[rows[0]], 'start'] = 0.2
+    signal.epochs.loc[signal.epochs.index[rows[1]], 'name'] = 'pupil_open'
+    assert signal.epoch_index is not index
+    assert np.all(signal.get_epoch_bounds('pupil_closed') ==
+                  [[0.2, 1.2], [1.5, 2.0]])
+    assert np.all(signal.get_epoch_bounds('pupil_open') == [[3.0, 3.8]])
+
+
+def test_epoch_index_overlapping(signal):
+    index = signal.epoch_index
+    assert set(index.overlapping(1.0, 2.0)) == {0, 1}
+    assert list(index.overlapping(1.0, 2.0, name='pupil_closed')) == [1]
+    assert list(index.overlapping(1.2, 2.0, name='pupil_closed')) == []
+    assert list(index.overlapping(0, 10, name='missing')) == []
+
+
+def test_get_epoch_indices_segments(signal):
+    signal.add_epoch('tone', np.arange(0, 4, 0.5)[:, np.newaxis] + [0, 0.3])
+    mask = signal._modified_copy(signal.as_continuous()[:1] % 30 > 1)
+    for segments in ([[0, 4]], [[0.2, 1.1], [1.1, 2.5], [3.0, 4.0]]):
+        signal.segments = np.array(segments)
+        for epoch in ('tone', 'trial', ['pupil_closed', 'tone']):
+            for kwargs in ({}, {'boundary_mode': 'trim'}, {'mask': mask}):
+                indices = signal.get_epoch_indices(epoch, **kwargs)
+                bounds = signal.get_epoch_bounds(
+                    epoch, kwargs.get('boundary_mode', 'exclude'))
+                expected = signal._segment_indices_loop(bounds)
+                if 'mask' in kwargs:
+                    m = mask.as_continuous()[0]
+                    expected = np.array([(lb, ub) for lb, ub in expected
+                                         if np.all(m[lb:ub]) and m[lb]],
+                                        dtype='i').reshape(-1, 2)
+                assert np.array_equal(indices, expected)
+
+
+def test_extract_epoch_block(signal):
+    signal.add_epoch('tone', np.arange(0, 3.5, 0.5)[:, np.newaxis] + [0, 0.3])
+    names = ['pupil_closed', 'trial', 'tone']
+    epoch_data, index = signal.extract_epoch_block(names)
+    assert list(index['name']) == names
+    assert epoch_data.shape == (index['count'].sum(), 3, 197)
+    for name, offset, count, length in index.itertuples(index=False):
+        assert np.array_equal(epoch_data[offset:offset+count, :, :length],
+                              signal.extract_epoch(name), equal_nan=True)
+        assert np.all(np.isnan(epoch_data[offset:offset+count, :, length:]))
+
+    m = signal.as_matrix(names)
+    assert m.shape == (3, 7, 3, 197)
+    assert np.array_equal(m[2, :, :, :15], signal.extract_epoch('tone'))
+    assert np.all(np.isnan(m[1, 1:]))
+
+    # only the occurrences spanned by another epoch
+    indices = signal.get_epoch_indices('tone', overlapping_epoch='pupil_closed')
+    assert 0 < len(indices) < 7
+    expected = signal.extract_epoch('tone', overlapping_epoch='pupil_closed')
+    assert len(expected) == len(indices)
+    epoch_data, index = signal.extract_epoch_block(
+        ['tone'], overlapping_epoch='pupil_closed')
+    assert np.array_equal(epoch_data, expected, equal_nan=True)
+    m = signal.as_matrix(['tone'], overlapping_epoch='pupil_closed')
+    assert np.array_equal(m[0], expected, equal_nan=True)
+
+    # evenly spaced occurrences of equal length can be returned as a view
+    view, index = signal.extract_epoch_block(['tone'], copy=False)
+    assert np.shares_memory(view, signal.as_continuous())
+    assert not view.flags.writeable
+    assert np.array_equal(view, signal.extract_epoch('tone'))
+    copy, index = signal.extract_epoch_block(['tone', 'trial'], copy=False)
+    assert not np.shares_memory(copy, signal.as_continuous())
+
+
+def test_point_process_rasterize():
+    from nems.signal import PointProcess, SparseRasterizedSignal
+
+    spikes = {'b': np.array([0.005, 0.011, 0.0119, 0.5, 1.99]),
+              'a': np.array([1.2, 0.3, 0.3])}
+    epochs = pd.DataFrame({'start': [0, 0.25, 1.0, 0.9],
+                           'end': [2, 0.75, 1.3, 2],
+                           'name': ['TRIAL', 'STIM', 'STIM', 'LATE']})
+    pp = PointProcess(fs=100, data=spikes, name='spikes',
+                      recording='dummy_recording', epochs=epochs)
+
+    raster = pp.rasterize()
+    assert raster.chans == ['a', 'b']
+    expected = np.zeros((2, 200))
+    expected[0, [30, 120]] = [2, 1]
+    expected[1, [0, 1, 50, 199]] = [1, 2, 1, 1]
+    np.testing.assert_array_equal(raster.as_continuous(), expected)
+    np.testing.assert_array_equal(pp.rasterize(fs=10).as_continuous().sum(),
+                                  expected.sum())
+
+    folded = pp.extract_epoch('STIM')
+    np.testing.assert_allclose(folded['a'], [[0, 0.05], [0, 0.05], [1, 0.2]])
+    np.testing.assert_allclose(folded['b'], [[0, 0.25]])
+
+    sparse = pp.rasterize(sparse=True)
+    assert isinstance(sparse, SparseRasterizedSignal)
+    assert sparse.shape == raster.shape
+    assert sparse.as_sparse().nnz == 6
+    np.testing.assert_array_equal(sparse.as_continuous(), expected)
+    np.testing.assert_array_equal(sparse.extract_epoch('STIM'),
+                                  raster.extract_epoch('STIM'))
+    late = sparse.extract_epoch('STIM', overlapping_epoch='LATE')
+    assert late.shape == (1, 2, 30)
+    np.testing.assert_array_equal(
+        late, raster.extract_epoch('STIM', overlapping_epoch='LATE'))
+    np.testing.assert_array_equal(
+        sparse.extract_epoch_block(['TRIAL', 'STIM'])[0],
+        raster.extract_epoch_block(['TRIAL', 'STIM'])[0])
+    np.testing.assert_array_equal(sparse.as_matrix(['TRIAL', 'STIM']),
+                                  raster.as_matrix(['TRIAL', 'STIM']))
+    np.testing.assert_array_equal(
+        sparse.rasterize(fs=1000, sparse=True).as_continuous(),
+        pp.rasterize(fs=1000).as_continuous())
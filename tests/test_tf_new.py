@@ -1,12 +1,17 @@
 from functools import wraps
 
 import numpy as np
+import pandas as pd
 import pytest
 
 from tensorflow import config
 
 from nems.modelspec import eval_ms_layer
+from nems.recording import Recording
+from nems.signal import RasterizedSignal
+from nems.tf import datasets, modelbuilder
 from nems.tf.cnnlink_new import eval_tf_layer
+import nems.initializers
 
 
 @pytest.fixture()
@@ -164,3 +169,62 @@ def test_stp(data, kern_size):
     in_size = data.shape[-1]
     layer_spec = f'stp.{in_size}'
     assert compare_ms_tf(layer_spec, data)
+
+
+@pytest.fixture()
+def epoch_rec():
+    """Synthetic recording with 12 REFERENCE epochs of 40 or 50 bins, two of them masked out."""
+    fs = 100
+    rng = np.random.RandomState(0)
+    starts = np.arange(12) * 60
+    lengths = np.where(np.arange(12) % 3, 50, 40)
+    epochs = pd.DataFrame({'name': 'REFERENCE', 'start': starts / fs, 'end': (starts + lengths) / fs})
+    n_times = 12 * 60
+    mask = np.ones((1, n_times), dtype=bool)
+    mask[:, 120:170] = False
+    mask[:, 600:650] = False
+
+    signals = {}
+    for name, chans in (('stim', 18), ('resp', 2), ('state', 3)):
+        signals[name] = RasterizedSignal(fs, rng.rand(chans, n_times), name, 'rec', epochs=epochs)
+    signals['mask'] = RasterizedSignal(fs, mask, 'mask', 'rec', epochs=epochs)
+    return Recording(signals)
+
+
+def _concat_batches(dataset):
+    inputs, outputs = zip(*dataset.as_numpy_iterator())
+    if isinstance(inputs[0], tuple):
+        inputs = [np.concatenate(x) for x in zip(*inputs)]
+    else:
+        inputs = np.concatenate(inputs)
+    return inputs, np.concatenate(outputs)
+
+
+def test_epoch_dataset(epoch_rec):
+    reader = datasets.EpochReader(epoch_rec, ['stim', 'state', 'resp'], 'REFERENCE')
+    assert reader.shapes == [(10, 50, 18), (10, 50, 3), (10, 50, 2)]
+
+    dataset = datasets.epoch_dataset(reader, n_inputs=2, batch_size=3, shuffle=False)
+    (stim, state), resp = _concat_batches(dataset)
+    for name, data in (('stim', stim), ('state', state), ('resp', resp)):
+        expected = epoch_rec[name].extract_epoch('REFERENCE', mask=epoch_rec['mask'])
+        np.testing.assert_allclose(data, np.transpose(expected, [0, 2, 1]), rtol=1e-6)
+
+    # shuffled, every occurrence still comes once per pass, with matching inputs and outputs
+    dataset = datasets.epoch_dataset(reader, n_inputs=2, batch_size=4, seed=1)
+    for _ in range(2):
+        (shuffled_stim, shuffled_state), shuffled_resp = _concat_batches(dataset)
+        order = np.argsort(shuffled_stim[:, 0, 0])
+        np.testing.assert_array_equal(shuffled_stim[order], stim[np.argsort(stim[:, 0, 0])])
+        np.testing.assert_array_equal(shuffled_resp[order], resp[np.argsort(stim[:, 0, 0])])
+
+
+def test_epoch_dataset_predict(epoch_rec):
+    reader = datasets.EpochReader(epoch_rec, ['stim', 'resp'], 'REFERENCE')
+    dataset = datasets.epoch_dataset(reader, batch_size=4, shuffle=False)
+    stim, _ = _concat_batches(dataset)
+
+    ms = nems.initializers.from_keywords('wc.18x2.g')
+    model = modelbuilder.ModelBuilder(layers=ms.modelspec2tf2(use_modelspec_init=True)) \
+        .build_model(input_shape=reader.shapes[0])
+    np.testing.assert_allclose(model.predict(dataset), model.predict(stim), rtol=1e-5, atol=1e-5)
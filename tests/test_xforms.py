@@ -66,5 +66,110 @@ def test_fit_performance(context):
     assert m1 == m2
 
 
+
+
+def test_copy_context(context):
+    rec = context['rec']
+    ctx = xforms.copy_context(context)
+    assert ctx['rec'] is not rec
+    assert ctx['modelspec'] is not context['modelspec']
+    for k, sig in rec.signals.items():
+        # signals are copied, data are shared
+        assert ctx['rec'][k] is not sig
+        assert ctx['rec'][k]._data is sig._data
+
+    ctx['rec']['stim'].name = 'changed'
+    ctx['rec']['new'] = ctx['rec']['resp'].copy()
+    assert rec['stim'].name == 'stim'
+    assert 'new' not in rec.signals
+
+    # epochs edited in place (as some xforms do) are not shared
+    names = rec['resp'].epochs['name'].copy()
+    ctx['rec']['resp'].epochs['name'] = 'changed'
+    assert rec['resp'].epochs['name'].equals(names)
+
+    # references between context entries are kept
+    modelspec = context['modelspec']
+    ctx = xforms.copy_context({'val': modelspec.recording,
+                               'modelspec': modelspec})
+    assert ctx['modelspec'].recording is ctx['val']
+
+    assert 'Done: nems.xforms.fit_basic' in context['log']
+
+def test_fit_models_local(tmp_path, monkeypatch):
+    import nems.xform_helper as xhelp
+    from nems.recording import Recording
+
+    # workers are spawned, so they pick up the results dir from the env
+    monkeypatch.setenv('NEMS_RESULTS_DIR', str(tmp_path / 'results'))
+    rng = np.random.RandomState(0)
+    rec = Recording.load_from_arrays(
+        [rng.rand(2, 500), rng.rand(2, 500)], 'dummy', 100,
+        sig_names=['stim', 'resp'],
+        signal_kwargs=[{}, {'chans': ['cell-1', 'cell-2']}])
+    uri = str(tmp_path / 'dummy.tgz')
+    rec.save(uri)
+
+    results_file = str(tmp_path / 'results.jsonl')
+    modelnames = ['ld-tev_wc.2x1-lvl.1_basic.t3', 'ld-tev_wc.2x1-lvl.1_xx']
+    records = xhelp.fit_models_local(['cell-1'], 0, modelnames, n_workers=2,
+                                     recording_uri=uri,
+                                     results_file=results_file)
+    assert [r['modelname'] for r in records] == modelnames
+    assert records[0]['status'] == 'done'
+    assert records[0]['meta']['cellid'] == 'cell-1'
+    assert 'r_test' in xhelp.results_modelspec(records[0]).meta
+    assert records[1]['status'] == 'error'
+    assert records[1]['error'].startswith('Traceback')
+
+    # completed fits are skipped
+    records = xhelp.fit_models_local(['cell-1'], 0, modelnames[:1],
+                                     results_file=results_file)
+    assert len(xhelp.load_local_results(results_file)) == 2
+    assert records[0]['status'] == 'done'
+    with open(results_file) as f:
+        assert len(f.readlines()) == 2
+
+def _quick_fit_worker(cellid, batch, modelname, recording_uri, autoPlot,
+                      saveInDB):
+    import time
+    time.sleep(0.05)
+    return {'cellid': cellid, 'batch': int(batch), 'modelname': modelname,
+            'status': 'done', 'savepath': None, 'error': None, 'meta': {}}
+
+
+def test_fit_models_local_shares_few_recordings(tmp_path, monkeypatch):
+    import multiprocessing
+    import os
+    import nems.xform_helper as xhelp
+    from nems.recording import Recording
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork so that workers see the patched worker')
+    rng = np.random.RandomState(0)
+    rec = Recording.load_from_arrays([rng.rand(2, 100)], 'dummy', 100,
+                                     sig_names=['resp'])
+    uri = str(tmp_path / 'dummy.tgz')
+    rec.save(uri)
+
+    # the number of shared recordings already there when the next cell is
+    # staged
+    staged = []
+    share_recording = xhelp._share_recording
+
+    def counting_share_recording(uri, shared_dir, i):
+        staged.append(len(os.listdir(shared_dir)))
+        return share_recording(uri, shared_dir, i)
+
+    monkeypatch.setattr(xhelp, '_fit_model_worker', _quick_fit_worker)
+    monkeypatch.setattr(xhelp, '_share_recording', counting_share_recording)
+    cellids = ['cell-{}'.format(i) for i in range(8)]
+    records = xhelp.fit_models_local(cellids, 0, ['m1', 'm2'], n_workers=2,
+                                     recording_uri=uri, mp_context='fork')
+    assert all(r['status'] == 'done' for r in records)
+    assert len(staged) == len(cellids)
+    assert max(staged) < 2
+
+
 #def test_get_signal_as_array(context, rec_key='rec'):
 #    a = xf.get_signal_as_array(context, 'stim', rec_key='rec')